@@ -1,44 +1,10 @@
 import sys
 import pandas as pd
-import fred_pandas
 import streamlit as st
 import plotly.graph_objects as go
+import datasets
 # ----------------------------------------------------------------------
-assets = {
-    "WGCAL": 'Gold Certificate Account',
-    "WOSDRL": 'Special Drawing Rights Certificate Account',
-    "WACL": 'Coin',
-    "WSHOBL": 'Bills',
-    "WSHONBNL": 'Notes and bonds, nominal',
-    "WSHONBIIL": 'Notes and bonds, inflation-indexed',
-    "WSHOICL": 'Inflation compensation',
-    "WSHOFADSL": 'Federal Agency Debt Securities',
-    "WSHOMCB": 'Mortgage-backed securities',
-    "WUPSHO": 'Unamortized Premiums on Securities Held Outright',
-    "WUDSHO": 'Unamortized Discounts on Securities Held Outright', # Negative value
-    "WORAL": 'Repurchase Agreements',
-    "WLCFLPCL": 'Primary Credit',
-    "WLCFOCEL": 'Other Credit Extensions',
-    "SWPT": 'Central Bank Liquidity Swaps',
-    "WFCDA": 'Foreign Currency Denominated Assets',
-    "WAOAL": 'Other Assets',
-    'H41RESPPALDKNWW': 'Bank Term Funding Program'
-}
-
-liabilities = {
-    "WLFN": 'Federal Reserve Notes, net of F.R. Bank holdings',
-    "WLRRAL": 'Reverse repurchase agreements',
-    "TERMT": 'Term deposits held by depository institutions',
-    "WLODLL": 'Other Deposits Held by Depository Institutions',
-    "WDTGAL": 'U.S. Treasury, General Account',
-    "WDFOL": 'Foreign Official',
-    "WLODL": 'Other',
-    "H41RESH4ENWW": 'Treasury Contribution to Credit Facilities'
-}
-
-all_items = {**assets, **liabilities}
-
-series_items = list(assets.keys()) + list(liabilities.keys())
+from _fed_balance_sheet import assets, liabilities, all_items, series_items
 # ----------------------------------------------------------------------
 # python -m fed_balance_sheet_chart update
 
@@ -46,67 +12,13 @@ if __name__ == '__main__':
     if 'update' in sys.argv:
         print('updating series data')
 
-        for elt in series_items:
-            fred_pandas.load_records(series=elt, update=True)
+        import upstream
+        upstream.RefreshClient().refresh(
+            [source for source in upstream.SOURCES if source.name in series_items]
+        )
         exit()
 # ----------------------------------------------------------------------
-@st.cache_data
-def setup_dataframe():
-
-    tbl = {}
-    
-    for series in series_items:
-        tbl[series] = fred_pandas.load_records(series=series, update=False)
-
-    for series, df in tbl.items():
-        df.rename(columns={'value': series}, inplace=True)
-        df.drop(columns='realtime_start',    inplace=True)
-        df.drop(columns='realtime_end',      inplace=True)
-
-    ls = list(tbl.values())
-
-    a = ls[0]
-
-    for b in ls[1:]:
-        a = a.merge(b, on='date')
-
-    for series in a.columns[1:]:
-        # a[series] = pd.to_numeric(a[series], errors='coerce')
-        a[series] = pd.to_numeric(a[series])
-
-    for series in liabilities.keys():
-        a[series] = a[series] * -1
-
-    return a
-
-# ----------------------------------------------------------------------
-@st.cache_data
-def setup_diff_dataframe():
-
-    tbl = {}
-    
-    for series in series_items:
-        tbl[series] = fred_pandas.load_records(series=series, update=False)
-
-    for series, df in tbl.items():
-        df.rename(columns={'value': series}, inplace=True)
-        df.drop(columns='realtime_start',    inplace=True)
-        df.drop(columns='realtime_end',      inplace=True)
-
-    ls = list(tbl.values())
-
-    a = ls[0]
-
-    for b in ls[1:]:
-        a = a.merge(b, on='date')
-
-    for series in a.columns[1:]:
-        a[series] = pd.to_numeric(a[series])
-
-    return a
-# ----------------------------------------------------------------------
-
-a = setup_dataframe()
+a = datasets.load('fed_balance_sheet')
 
 if st.sidebar.checkbox('Remove series larger than'):
 
@@ -144,8 +56,7 @@ fig.update_layout(barmode='relative', width=1000, height=600)
 st.plotly_chart(fig)
 
 def clear_cache():
-    setup_dataframe.clear()
-    setup_diff_dataframe.clear()
+    datasets.refresh('fed_balance_sheet_levels')
 
 # st.sidebar.button('Clear cache', on_click=setup_dataframe.clear)
 
@@ -154,7 +65,7 @@ st.sidebar.button('Clear cache', on_click=clear_cache)
 # ----------------------------------------------------------------------
 st.write('### Changes for week')
 
-df_diff = setup_diff_dataframe()
+df_diff = datasets.load('fed_balance_sheet_levels')
 
 df_diff = df_diff.set_index('date').diff().reset_index()
 
@@ -1,6 +1,7 @@
-import pandas as pd
-import fred_pandas
-from functools import lru_cache
+from lazy_imports import lazy_module
+
+pd = lazy_module("pandas")
+fred_pandas = lazy_module("fred_pandas")
 
 # Define assets and liabilities
 assets = {
@@ -38,17 +39,19 @@ liabilities = {
 all_items = {**assets, **liabilities}
 series_items = list(assets.keys()) + list(liabilities.keys())
 
-@lru_cache(maxsize=1)
-def load_dataframe():
-    """Load and process the Federal Reserve balance sheet data."""
+def load_levels():
+    """
+    Load the H.4.1 series from the fred_pandas cache and merge them on date.
+
+    Returns one numeric column per series, with unsigned levels and a
+    datetime date column. Use datasets.load("fed_balance_sheet_levels") for the
+    shared, cached copy.
+    """
     tbl = {}
-    
-    for series in series_items:
-        tbl[series] = fred_pandas.load_records(series=series, update=False)
 
-    for series, df in tbl.items():
-        df.rename(columns={'value': series}, inplace=True)
-        df.drop(columns=['realtime_start', 'realtime_end'], inplace=True)
+    for series in series_items:
+        df = fred_pandas.load_records(series=series, update=False)
+        tbl[series] = df[['date', 'value']].rename(columns={'value': series})
 
     ls = list(tbl.values())
     a = ls[0]
@@ -59,30 +62,6 @@ def load_dataframe():
     for series in a.columns[1:]:
         a[series] = pd.to_numeric(a[series])
 
-    for series in liabilities.keys():
-        a[series] = a[series] * -1
+    a['date'] = pd.to_datetime(a['date'])
 
     return a
-
-@lru_cache(maxsize=1)
-def load_diff_dataframe():
-    """Load and process the Federal Reserve balance sheet data for weekly changes."""
-    tbl = {}
-    
-    for series in series_items:
-        tbl[series] = fred_pandas.load_records(series=series, update=False)
-
-    for series, df in tbl.items():
-        df.rename(columns={'value': series}, inplace=True)
-        df.drop(columns=['realtime_start', 'realtime_end'], inplace=True)
-
-    ls = list(tbl.values())
-    a = ls[0]
-
-    for b in ls[1:]:
-        a = a.merge(b, on='date')
-
-    for series in a.columns[1:]:
-        a[series] = pd.to_numeric(a[series])
-
-    return a 
\ No newline at end of file
@@ -1,17 +1,13 @@
 import datetime
 import streamlit as st
 import pandas as pd
-import fed_net_liquidity
+import datasets
 
 # st.markdown('# Fed Net Liquidity')
 
 st.set_page_config(page_title='Fed Net Liquidity', page_icon=':moneybag:', layout='wide')
 
-@st.cache_data
-def get_dataframe():
-    return fed_net_liquidity.load_dataframe()
-
-df = get_dataframe()
+df = datasets.load('fed_net_liquidity')
 
 df = df[['date', 'WALCL', 'WALCL_diff', 'RRP', 'RRP_diff', 'TGA', 'TGA_diff', 'REM', 'REM_diff', 'NL', 'NL_diff']]
 
@@ -52,4 +48,4 @@ st.dataframe(
     hide_index=True
 )
 
-st.button(label='Clear cache', on_click=get_dataframe.clear)
\ No newline at end of file
+st.button(label='Clear cache', on_click=lambda: datasets.refresh('fed_net_liquidity'))
\ No newline at end of file
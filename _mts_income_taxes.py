@@ -1,24 +1,11 @@
 
 import pandas as pd
-import treasury_gov_pandas.datasets.mts.mts_table_4.load
 import streamlit as st
 import plotly.express as px
 import numpy as np
+import datasets
 
-@st.cache_data
-def load_dataframe():
-    df = treasury_gov_pandas.datasets.mts.mts_table_4.load.load()
-
-    df['record_date'] = pd.to_datetime(df['record_date'])
-
-    df['current_month_net_rcpt_amt']   = pd.to_numeric(df['current_month_net_rcpt_amt'], errors='coerce')
-    df['current_month_gross_rcpt_amt'] = pd.to_numeric(df['current_month_gross_rcpt_amt'], errors='coerce')
-    df['current_fytd_net_rcpt_amt']    = pd.to_numeric(df['current_fytd_net_rcpt_amt'], errors='coerce')
-    df['prior_fytd_net_rcpt_amt']      = pd.to_numeric(df['prior_fytd_net_rcpt_amt'], errors='coerce')
-
-    return df
-
-df = load_dataframe()
+df = datasets.load('mts_table_4')
 
 'Data is from the [Monthly Treasury Statement](https://fiscaldata.treasury.gov/datasets/monthly-treasury-statement/receipts-of-the-u-s-government) dataset on treasury.gov.'
 
@@ -116,7 +103,7 @@ fig = px.line(tmp, x='record_date', y=['current_fytd_net_rcpt_amt', 'prior_fytd_
 
 st.plotly_chart(fig, use_container_width=True)
 
-st.button('Clear cache', on_click=load_dataframe.clear)
+st.button('Clear cache', on_click=lambda: datasets.refresh('mts_table_4'))
 
 # ----------------------------------------------------------------------
 
@@ -1,17 +1,9 @@
 import pandas as pd
-import treasury_gov_pandas.datasets.deposits_withdrawals_operating_cash.load
 import streamlit as st
 import plotly.express as px
+import datasets
 
-@st.cache_data
-def load_dataframe():
-    return treasury_gov_pandas.datasets.deposits_withdrawals_operating_cash.load.load()
-
-df = load_dataframe()
-
-df['transaction_today_amt'] = pd.to_numeric(df['transaction_today_amt'], errors='coerce')
-df['transaction_mtd_amt']   = pd.to_numeric(df['transaction_mtd_amt'],   errors='coerce')
-df['transaction_fytd_amt']  = pd.to_numeric(df['transaction_fytd_amt'],  errors='coerce')
+df = datasets.load('dts_deposits_withdrawals')
 
 df = df.query('transaction_catg != "null"')
 
@@ -89,6 +81,6 @@ fig = px.bar(
 
 st.plotly_chart(fig, use_container_width=True)
 
-st.sidebar.button(label='Clear Cache', on_click= lambda: load_dataframe.clear())
+st.sidebar.button(label='Clear Cache', on_click= lambda: datasets.refresh('dts_deposits_withdrawals'))
 
 st.sidebar.markdown('[source code](https://github.com/dharmatech/tga_explorer.py)')
\ No newline at end of file
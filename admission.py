@@ -0,0 +1,239 @@
+"""
+Admission control for widget endpoints.
+
+Every widget endpoint gets a gate that lets a limited number of requests run
+at once. Requests over the limit wait in a bounded queue for at most
+ADMISSION_TIMEOUT seconds; when the queue is full or the wait runs out the
+request is rejected right away with 503 and a Retry-After header, instead of
+piling up in the threadpool until the client times out.
+
+Cheap endpoints (the root, /widgets.json, /templates.json and /debug/*)
+and the long-lived /events stream skip the gates entirely, so they stay
+fast while expensive charts are queued.
+
+Settings (environment variables):
+
+    ADMISSION_DEFAULT_LIMIT   concurrent requests per endpoint (default 4)
+    ADMISSION_QUEUE_SIZE      waiting requests per endpoint (default 8)
+    ADMISSION_TIMEOUT         seconds a request may wait (default 10)
+    ADMISSION_LIMITS          per-endpoint limits, e.g. "fed-balance-sheet=2,batch=1"
+"""
+
+import asyncio
+import collections
+import json
+import math
+import os
+import threading
+import time
+
+from registry import WIDGETS
+
+DEFAULT_LIMIT = int(os.environ.get("ADMISSION_DEFAULT_LIMIT", "4"))
+QUEUE_SIZE = int(os.environ.get("ADMISSION_QUEUE_SIZE", "8"))
+TIMEOUT = float(os.environ.get("ADMISSION_TIMEOUT", "10"))
+
+# Endpoints that build large figures or run several widgets
+LIMITS = {
+    "fed-balance-sheet": 1,
+    "fed-net-liquidity-all": 1,
+    "mts-income-taxes-monthly-by-year": 1,
+    "transactions-range": 2,
+    "batch": 1,
+    # Full-history downloads hold their slot until the body is streamed
+    "export": 2,
+}
+
+for entry in os.environ.get("ADMISSION_LIMITS", "").split(","):
+    if "=" in entry:
+        endpoint, limit = entry.split("=", 1)
+        LIMITS[endpoint.strip()] = int(limit)
+
+# Paths that never wait behind expensive requests
+PRIORITY_PATHS = {"/", "/widgets.json", "/templates.json", "/events"}
+PRIORITY_PREFIXES = ("/debug/",)
+
+# Endpoints that are not widgets but are still admitted through a gate; a
+# path below one of them, e.g. /export/mts-table-4, shares its gate
+EXTRA_ENDPOINTS = {"batch", "export"}
+
+# Requests to unknown paths share one gate
+DEFAULT_GATE = "default"
+
+# Set in the scope of an admitted request to the seconds it spent inside
+# its gate, i.e. without waiting in the queue
+SERVICE_TIME_SCOPE = "admission.service_time"
+
+
+class Gate:
+    """Concurrency limit with a bounded FIFO wait queue."""
+
+    def __init__(self, name, limit, queue_size=QUEUE_SIZE, timeout=TIMEOUT):
+        self.name = name
+        self.limit = limit
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.active = 0
+        self.admitted = 0
+        self.rejected_queue_full = 0
+        self.rejected_deadline = 0
+        self.service_time = None
+        self._waiters = collections.deque()
+
+    @property
+    def waiting(self):
+        return sum(1 for waiter in self._waiters if not waiter.done())
+
+    async def acquire(self):
+        """
+        Waits for a free slot.
+
+        Returns:
+            bool: True if the request was admitted, False if it was rejected.
+        """
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            self.admitted += 1
+            return True
+
+        if self.waiting >= self.queue_size:
+            self.rejected_queue_full += 1
+            return False
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, self.timeout)
+        except asyncio.TimeoutError:
+            # release() may have handed over the slot just as the wait ran out
+            if not (waiter.done() and not waiter.cancelled()):
+                self.rejected_deadline += 1
+                return False
+        except asyncio.CancelledError:
+            # The request went away, e.g. the client disconnected, possibly
+            # just after release() handed it the slot: pass that slot on
+            if waiter.done() and not waiter.cancelled():
+                self._hand_over()
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+
+        self.admitted += 1
+        return True
+
+    def release(self, elapsed):
+        """Frees a slot, handing it to the oldest waiting request if any."""
+        if self.service_time is None:
+            self.service_time = elapsed
+        else:
+            self.service_time = 0.8 * self.service_time + 0.2 * elapsed
+        self._hand_over()
+
+    def _hand_over(self):
+        """Gives a slot to the oldest waiting request, or frees it."""
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    def retry_after(self):
+        """Seconds a rejected client should wait before trying again."""
+        per_request = self.service_time or 1.0
+        backlog = self.waiting + self.active
+        return max(1, math.ceil(per_request * backlog / max(self.limit, 1)))
+
+    def stats(self):
+        return {
+            "limit": self.limit,
+            "queue_size": self.queue_size,
+            "timeout": self.timeout,
+            "active": self.active,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "rejected_queue_full": self.rejected_queue_full,
+            "rejected_deadline": self.rejected_deadline,
+            "avg_service_ms": (
+                None if self.service_time is None
+                else round(self.service_time * 1000, 1)
+            ),
+        }
+
+
+GATES = {}
+_gates_lock = threading.Lock()
+
+
+def gate_for(path):
+    """
+    Returns the gate for a request path, or None for priority paths.
+
+    Args:
+        path (str): The request path, e.g. "/fed-balance-sheet".
+
+    Returns:
+        Gate: The endpoint's gate, or None if the path is not gated.
+    """
+    if path in PRIORITY_PATHS or path.startswith(PRIORITY_PREFIXES):
+        return None
+
+    endpoint = path.strip("/")
+    if endpoint not in WIDGETS and endpoint not in EXTRA_ENDPOINTS:
+        prefix = endpoint.split("/", 1)[0]
+        endpoint = prefix if prefix in EXTRA_ENDPOINTS else DEFAULT_GATE
+
+    gate = GATES.get(endpoint)
+    if gate is None:
+        with _gates_lock:
+            gate = GATES.setdefault(
+                endpoint, Gate(endpoint, LIMITS.get(endpoint, DEFAULT_LIMIT))
+            )
+    return gate
+
+
+def stats():
+    """Returns the counters of every gate, keyed by endpoint."""
+    return {name: gate.stats() for name, gate in sorted(GATES.items())}
+
+
+class AdmissionMiddleware:
+    """ASGI middleware that admits HTTP requests through their endpoint's gate."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "OPTIONS":
+            return await self.app(scope, receive, send)
+
+        gate = gate_for(scope["path"])
+        if gate is None:
+            return await self.app(scope, receive, send)
+
+        if not await gate.acquire():
+            return await self._reject(gate, send)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            elapsed = time.perf_counter() - start
+            scope[SERVICE_TIME_SCOPE] = elapsed
+            gate.release(elapsed)
+
+    async def _reject(self, gate, send):
+        body = json.dumps({
+            "error": f"Server busy: too many {gate.name} requests, retry later"
+        }).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(gate.retry_after()).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
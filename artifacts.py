@@ -0,0 +1,243 @@
+"""
+Dependency graph of derived artifacts.
+
+Datasets (see datasets.py) are the sources of the graph. Artifacts are
+results derived from datasets or from other artifacts, e.g. the MTS panel
+or the DTS prefix-sum cube. Each artifact declares its inputs, and its
+version is a hash of its name and of its inputs' versions, so the version of
+any node can be computed without building it:
+
+    fed_balance_sheet_levels -> fed_balance_sheet_changes -> h41-weeks options
+    mts_table_4 -> mts_panel -> mts_by_month -> MTS widgets
+
+An artifact is rebuilt only when its version changes, i.e. when a dataset
+upstream of it was reloaded. Consumers such as widget responses key their
+caches by version_of() their inputs and drop entries with affected(), so a
+new TGA print reloads fed_net_liquidity and rebuilds what depends on it,
+while the MTS artifacts and responses stay cached.
+
+    @register_artifact("dts_cube", inputs=["dts_deposits_withdrawals"])
+    def _build(df): ...
+
+    cube = artifacts.get("dts_cube")
+"""
+
+import asyncio
+import hashlib
+import threading
+import time
+
+import cache_registry
+import datasets
+
+# Registered artifacts: name -> Artifact
+ARTIFACTS = {}
+
+_cache = cache_registry.Cache("artifacts")
+_locks = {}
+_registry_lock = threading.Lock()
+
+
+class Artifact:
+    """A derived result and the datasets or artifacts it is built from."""
+
+    def __init__(self, name, build, inputs):
+        self.name = name
+        self.build = build
+        self.inputs = tuple(inputs)
+
+
+def register_artifact(name, inputs):
+    """
+    Decorator that registers the build function of an artifact.
+
+    Args:
+        name (str): The artifact name, distinct from every dataset name.
+        inputs (tuple): Names of the datasets and artifacts it is built
+            from. The build function receives their values, in this order.
+
+    Returns:
+        function: The decorated build function, unchanged.
+    """
+    def decorator(func):
+        for input_name in inputs:
+            if input_name not in ARTIFACTS and input_name not in datasets.LOADERS:
+                raise ValueError(f"Unknown input {input_name} of artifact {name}")
+        ARTIFACTS[name] = Artifact(name, func, inputs)
+        return func
+    return decorator
+
+
+def _hash(name, versions):
+    text = "|".join([name] + [str(v) for v in versions])
+    return hashlib.sha1(text.encode()).hexdigest()[:16]
+
+
+def _lock_for(name):
+    with _registry_lock:
+        return _locks.setdefault(name, threading.Lock())
+
+
+def version(name):
+    """
+    Returns the current version of a dataset or artifact.
+
+    Loads the datasets upstream of an artifact if needed, but does not build
+    the artifact itself.
+    """
+    artifact = ARTIFACTS.get(name)
+    if artifact is None:
+        return datasets.version(name)
+    return _hash(name, [version(i) for i in artifact.inputs])
+
+
+def version_of(names):
+    """Returns one version hash covering several datasets or artifacts."""
+    return _hash("", [version(name) for name in names])
+
+
+def peek_version(name):
+    """
+    Returns version(name) if every dataset upstream of it is loaded, or
+    None. Never loads anything, so it is safe to call from the event loop.
+    """
+    artifact = ARTIFACTS.get(name)
+    if artifact is None:
+        snapshot = datasets.peek(name)
+        return None if snapshot is None else snapshot.version
+    versions = [peek_version(i) for i in artifact.inputs]
+    if None in versions:
+        return None
+    return _hash(name, versions)
+
+
+def peek_version_of(names):
+    """Returns version_of(names) if it needs no loading, or None."""
+    versions = [peek_version(name) for name in names]
+    if None in versions:
+        return None
+    return _hash("", versions)
+
+
+async def aversion_of(names):
+    """
+    Async version_of(). Answers on the event loop when the datasets are
+    loaded, and only loads them in a worker thread otherwise.
+    """
+    current = peek_version_of(names)
+    if current is None:
+        return await asyncio.to_thread(version_of, names)
+    return current
+
+
+def _input_snapshot(name):
+    if name in ARTIFACTS:
+        return get_snapshot(name)
+    return datasets.get(name)
+
+
+def get_snapshot(name):
+    """
+    Returns the current value of an artifact, building it if its inputs
+    changed since it was last built.
+
+    Args:
+        name (str): The artifact name.
+
+    Returns:
+        datasets.Snapshot: The value, as .frame, and its version hash.
+    """
+    artifact = ARTIFACTS[name]
+    inputs = [_input_snapshot(i) for i in artifact.inputs]
+    current = _hash(name, [snapshot.version for snapshot in inputs])
+
+    snapshot = _cache.get(name)
+    if snapshot is None or snapshot.version != current:
+        with _lock_for(name):
+            snapshot = _cache.get(name)
+            if snapshot is None or snapshot.version != current:
+                start = time.perf_counter()
+                value = artifact.build(*[s.frame for s in inputs])
+                snapshot = datasets.Snapshot(name, current, value)
+                _cache.put(name, snapshot, cost=time.perf_counter() - start)
+    return snapshot
+
+
+def get(name):
+    """Returns the current value of an artifact. Treat as read-only."""
+    return get_snapshot(name).frame
+
+
+def _edges():
+    """Yields (node, inputs) for every dataset and artifact."""
+    yield from datasets.INPUTS.items()
+    for artifact in ARTIFACTS.values():
+        yield artifact.name, artifact.inputs
+
+
+def downstream(names):
+    """Returns every dataset and artifact derived, directly or not, from names."""
+    found = set()
+    pending = list(names)
+    while pending:
+        current = pending.pop()
+        for node, inputs in _edges():
+            if current in inputs and node not in found:
+                found.add(node)
+                pending.append(node)
+    return found
+
+
+def affected(names):
+    """Returns names and every node downstream of them."""
+    return set(names) | downstream(names)
+
+
+@datasets.on_change
+def _drop_stale(names):
+    # Free the artifacts built from the old snapshots right away, instead of
+    # holding them until their next use
+    stale = downstream(names)
+    _cache.discard(lambda name: name in stale)
+
+
+def report(consumers=None):
+    """
+    Describes the graph without loading or building anything.
+
+    Args:
+        consumers (dict): Optional. Names of things that read the graph
+            (e.g. widget endpoints) -> their inputs.
+
+    Returns:
+        dict: Per node its kind, inputs, direct dependents and the version
+        currently held, or None if it is not loaded. Consumers are listed
+        under each of their inputs.
+    """
+    consumers = consumers or {}
+    loaded = datasets.loaded()
+    built = dict(_cache.items())
+
+    nodes = {}
+    for node, inputs in _edges():
+        if node in ARTIFACTS:
+            snapshot = built.get(node)
+            kind = "artifact"
+        else:
+            snapshot = loaded.get(node)
+            kind = "dataset"
+        nodes[node] = {
+            "kind": kind,
+            "inputs": list(inputs),
+            "dependents": [],
+            "consumers": [],
+            "version": None if snapshot is None else snapshot.version,
+        }
+    for node, inputs in _edges():
+        for input_name in inputs:
+            nodes[input_name]["dependents"].append(node)
+    for consumer, inputs in consumers.items():
+        for input_name in inputs:
+            if input_name in nodes:
+                nodes[input_name]["consumers"].append(consumer)
+    return nodes
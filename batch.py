@@ -0,0 +1,218 @@
+"""
+Batch execution of widget requests.
+
+A batch is a list of {"endpoint": ..., "params": {...}} items naming widgets
+from the WIDGETS registry. All items of a batch read the same dataset
+snapshots, and independent items are built in parallel on a thread pool.
+
+Items share the widget response cache with GET requests (see
+widget_cache.py), under the same key: a fresh response is answered from
+it, and a response built for an item is stored in it.
+"""
+
+import asyncio
+import concurrent.futures
+import inspect
+import json
+import os
+import time
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response
+
+import artifacts
+import datasets
+import widget_cache
+from registry import WIDGETS, WIDGET_HANDLERS, WIDGET_INPUTS
+
+BATCH_WORKERS = int(os.environ.get("BATCH_WORKERS", "4"))
+
+# Most items one batch may have; larger batches are rejected
+MAX_ITEMS = int(os.environ.get("BATCH_MAX_ITEMS", "50"))
+
+_PARSE_ERRORS = {
+    int: ("int_parsing", "Input should be a valid integer, unable to parse string as an integer"),
+    float: ("float_parsing", "Input should be a valid number, unable to parse string as a number"),
+}
+
+_executor = concurrent.futures.ThreadPoolExecutor(
+    max_workers=BATCH_WORKERS, thread_name_prefix="batch"
+)
+
+
+class ParamsError(ValueError):
+    """Invalid params of a batch item, with FastAPI's validation details."""
+
+    def __init__(self, errors):
+        super().__init__(errors)
+        self.errors = errors
+
+
+def _parse(annotation, value):
+    if isinstance(value, bool):
+        raise TypeError(value)
+    if annotation is int and isinstance(value, float) and not value.is_integer():
+        raise ValueError(value)
+    return annotation(value)
+
+
+def _coerce_params(func, params):
+    """
+    Keeps the params the endpoint function accepts and converts them to the
+    function's annotated int/float types, like FastAPI does for query params.
+
+    Raises:
+        ParamsError: If a value does not convert or a required param is
+            missing.
+    """
+    signature = inspect.signature(func)
+    kwargs = {}
+    errors = []
+    for name, value in params.items():
+        parameter = signature.parameters.get(name)
+        if parameter is None:
+            continue
+        if parameter.annotation in _PARSE_ERRORS:
+            try:
+                value = _parse(parameter.annotation, value)
+            except (TypeError, ValueError):
+                kind, message = _PARSE_ERRORS[parameter.annotation]
+                errors.append({"type": kind, "loc": ["query", name], "msg": message, "input": value})
+                continue
+        kwargs[name] = value
+    for name, parameter in signature.parameters.items():
+        if parameter.default is inspect.Parameter.empty and name not in params:
+            errors.append({"type": "missing", "loc": ["query", name], "msg": "Field required", "input": None})
+    if errors:
+        raise ParamsError(errors)
+    return kwargs
+
+
+def _query_value(value):
+    """A JSON parameter value as it would be sent in a query string."""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
+
+
+def call_widget(endpoint, params, typed=False):
+    """
+    Answers a widget request from the widget response cache, or calls the
+    registered endpoint function directly.
+
+    Args:
+        endpoint (str): The widget endpoint, e.g. "fed-net-liquidity".
+        params (dict): The query parameters to pass.
+        typed (bool): Optional. Whether the client accepts typed arrays.
+
+    Returns:
+        tuple: (status_code, body) where body is the JSON-encoded payload.
+    """
+    func = WIDGET_HANDLERS.get(endpoint)
+    if endpoint not in WIDGETS or func is None:
+        body = json.dumps({"error": f"Unknown endpoint {endpoint}"})
+        return 404, body.encode()
+
+    params = params or {}
+    try:
+        kwargs = _coerce_params(func, params)
+    except ParamsError as e:
+        return 422, json.dumps({"detail": e.errors}).encode()
+
+    key = version = None
+    if endpoint in WIDGET_INPUTS:
+        try:
+            version = artifacts.version_of(WIDGET_INPUTS[endpoint])
+        except Exception:
+            # Let the handler report the error in its own way
+            pass
+        else:
+            query = [(name, _query_value(value)) for name, value in params.items()]
+            key = widget_cache.key_for(endpoint, query, typed)
+            stored = widget_cache.lookup(key, version)
+            if stored is not None:
+                return 200, stored.variants["identity"]
+
+    try:
+        start = time.perf_counter()
+        result = func(**kwargs)
+        if inspect.isawaitable(result):
+            result = asyncio.run(result)
+        if not isinstance(result, Response):
+            result = JSONResponse(jsonable_encoder(result))
+        cost = time.perf_counter() - start
+    except Exception as e:
+        return 500, json.dumps({"error": str(e)}).encode()
+
+    body = bytes(result.body)
+    if key is not None and result.status_code == 200:
+        widget_cache.store(key, version, body, result.headers.items(), cost)
+    return result.status_code, body
+
+
+def _encode_item(index, item, status, body):
+    """Encodes one batch result, splicing in the already-encoded payload."""
+    head = json.dumps({
+        "index": index,
+        "endpoint": item.get("endpoint"),
+        "status": status,
+    }, separators=(",", ":"))
+    return head[:-1].encode() + b',"data":' + body + b"}"
+
+
+def _submit_all(items, typed):
+    """Submits every item of a batch; returns {future: index}."""
+    scope = datasets.scope_context()
+    futures = {}
+    for index, item in enumerate(items):
+        future = _executor.submit(
+            scope.copy().run,
+            call_widget,
+            item.get("endpoint"),
+            item.get("params") or {},
+            typed,
+        )
+        futures[future] = index
+    return futures
+
+
+def run_batch(items, typed=False):
+    """
+    Runs a batch and returns all results as one JSON array, in request order.
+
+    Args:
+        items (list): The batch items, dicts with "endpoint" and "params".
+        typed (bool): Optional. Whether the client accepts typed arrays.
+
+    Returns:
+        bytes: The JSON-encoded list of results.
+    """
+    futures = _submit_all(items, typed)
+    results = [None] * len(items)
+    for future, index in futures.items():
+        status, body = future.result()
+        results[index] = _encode_item(index, items[index], status, body)
+    return b"[" + b",".join(results) + b"]"
+
+
+def stream_batch(items, typed=False):
+    """
+    Runs a batch and yields each result as an NDJSON line when it completes.
+
+    Args:
+        items (list): The batch items, dicts with "endpoint" and "params".
+        typed (bool): Optional. Whether the client accepts typed arrays.
+
+    Returns:
+        generator: Yields one encoded result line per item.
+    """
+    # Submit eagerly so the work starts in the request's own context
+    futures = _submit_all(items, typed)
+
+    def generate():
+        for future in concurrent.futures.as_completed(futures):
+            index = futures[future]
+            status, body = future.result()
+            yield _encode_item(index, items[index], status, body) + b"\n"
+
+    return generate()
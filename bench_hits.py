@@ -0,0 +1,198 @@
+"""
+Benchmark of the cache-hit path.
+
+Launches the server on offline stand-ins (see standins.py), warms every
+widget with its default parameters and the /options lists, then measures
+requests that are answered from the caches:
+
+- latency: one keep-alive connection requesting the warmed paths in turn,
+  reported as p50/p90/p99;
+- throughput: --connections keep-alive connections requesting them as fast
+  as they can for --duration seconds, reported as requests per second.
+
+    python bench_hits.py
+
+Compare against an earlier revision, checked out into a temporary git
+worktree and run on the same data:
+
+    python bench_hits.py --before HEAD~1
+
+The client speaks HTTP/1.1 over raw asyncio streams, so that it is not the
+bottleneck of a single-process server.
+"""
+
+import argparse
+import asyncio
+import json
+import shutil
+import subprocess
+import tempfile
+import time
+import urllib.parse
+
+from loadgen import ROOT, Server, Workspace, percentile
+
+
+async def _open(url):
+    parsed = urllib.parse.urlsplit(url)
+    return await asyncio.open_connection(parsed.hostname, parsed.port)
+
+
+async def _get(reader, writer, path):
+    """Sends one GET on a keep-alive connection and reads the whole response."""
+    writer.write(
+        f"GET {path} HTTP/1.1\r\nHost: bench\r\nAccept-Encoding: gzip\r\n\r\n".encode()
+    )
+    head = await reader.readuntil(b"\r\n\r\n")
+    lines = head.decode("latin-1").split("\r\n")
+    status = int(lines[0].split()[1])
+    headers = dict(
+        (name.strip().lower(), value.strip())
+        for name, _, value in (line.partition(":") for line in lines[1:] if line)
+    )
+    if headers.get("transfer-encoding") == "chunked":
+        while True:
+            size = int((await reader.readline()).split(b";")[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    else:
+        await reader.readexactly(int(headers.get("content-length", 0)))
+    return status
+
+
+def hit_paths(url):
+    """Widget paths with default parameters, plus the options lists."""
+    import requests
+
+    widgets = requests.get(url + "/widgets.json", timeout=60).json()
+    paths = []
+    for widget in widgets.values():
+        params = Workspace.default_params(widget)
+        query = urllib.parse.urlencode(params)
+        paths.append("/" + widget["endpoint"] + ("?" + query if query else ""))
+        for param in widget.get("params", []):
+            endpoint = param.get("optionsEndpoint")
+            if endpoint and "/" + endpoint.lstrip("/") not in paths:
+                paths.append("/" + endpoint.lstrip("/"))
+    return paths
+
+
+async def warm(url, paths):
+    """Requests every path until it is cached; returns the ones that succeed."""
+    reader, writer = await _open(url)
+    ok = []
+    for path in paths:
+        statuses = [await _get(reader, writer, path) for _ in range(3)]
+        if statuses[-1] == 200:
+            ok.append(path)
+    writer.close()
+    return ok
+
+
+async def latency(url, paths, requests):
+    reader, writer = await _open(url)
+    latencies = []
+    for i in range(requests):
+        start = time.perf_counter()
+        await _get(reader, writer, paths[i % len(paths)])
+        latencies.append(time.perf_counter() - start)
+    writer.close()
+    latencies.sort()
+    return {q: percentile(latencies, q) for q in (50, 90, 99)}
+
+
+async def throughput(url, paths, connections, duration):
+    deadline = time.perf_counter() + duration
+    counts = []
+
+    async def client(offset):
+        reader, writer = await _open(url)
+        count = errors = 0
+        while time.perf_counter() < deadline:
+            status = await _get(reader, writer, paths[(offset + count) % len(paths)])
+            count += 1
+            errors += status != 200
+        writer.close()
+        counts.append((count, errors))
+
+    start = time.perf_counter()
+    await asyncio.gather(*[client(i) for i in range(connections)])
+    elapsed = time.perf_counter() - start
+    return {
+        "rps": sum(c for c, _ in counts) / elapsed,
+        "errors": sum(e for _, e in counts),
+    }
+
+
+def run(data_dir, root, args):
+    """Benchmarks the server of one source tree."""
+    server = Server(data_dir, root=root)
+    try:
+        server.wait_ready()
+        paths = asyncio.run(warm(server.url, hit_paths(server.url)))
+        result = {"paths": len(paths)}
+        result["latency"] = asyncio.run(latency(server.url, paths, args.requests))
+        result.update(asyncio.run(
+            throughput(server.url, paths, args.connections, args.duration)
+        ))
+        return result
+    finally:
+        server.stop()
+
+
+def _ms(seconds):
+    # Hits take well under a millisecond
+    return f"{seconds * 1000:.2f}"
+
+
+def print_results(results):
+    print(f"{'tree':12} {'paths':>6} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'req/s':>9} {'errors':>7}")
+    for name, result in results.items():
+        lat = result["latency"]
+        print(
+            f"{name:12} {result['paths']:6} {_ms(lat[50]):>8} {_ms(lat[90]):>8} "
+            f"{_ms(lat[99]):>8} {result['rps']:9.0f} {result['errors']:7}"
+        )
+    if "before" in results and "after" in results:
+        before, after = results["before"], results["after"]
+        print(
+            f"\np50 {before['latency'][50] / after['latency'][50]:.2f}x faster, "
+            f"{after['rps'] / before['rps']:.2f}x the requests per second"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark cache-hit latency and throughput")
+    parser.add_argument("--before", metavar="REV", help="also benchmark this git revision, for comparison")
+    parser.add_argument("--requests", type=int, default=2000, help="sequential requests for the latency run")
+    parser.add_argument("--connections", type=int, default=32, help="concurrent connections for the throughput run")
+    parser.add_argument("--duration", type=float, default=10, help="seconds of the throughput run")
+    parser.add_argument("--data", help="stand-in data directory (default: generated in a temp directory)")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    data_dir = args.data
+    if data_dir is None:
+        import standins
+        data_dir = tempfile.mkdtemp(prefix="openbb-standins-")
+        standins.write_standins(data_dir)
+
+    results = {}
+    if args.before:
+        worktree = tempfile.mkdtemp(prefix="openbb-before-")
+        subprocess.run(
+            ["git", "-C", ROOT, "worktree", "add", "--detach", worktree, args.before],
+            check=True, stdout=subprocess.DEVNULL,
+        )
+        try:
+            results["before"] = run(data_dir, worktree, args)
+        finally:
+            subprocess.run(["git", "-C", ROOT, "worktree", "remove", "--force", worktree], check=False)
+            shutil.rmtree(worktree, ignore_errors=True)
+    results["after"] = run(data_dir, ROOT, args)
+
+    print_results(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,161 @@
+"""
+Performance budget check of every registered widget.
+
+Writes offline stand-ins (see standins.py) at the reference data scale,
+with a fixed seed and ending today, as widget defaults are relative to
+today. Then builds every widget with its default parameters: once to load
+the data, --runs times to time it, and once more under tracemalloc for its
+peak allocation. Each result is compared with the budget the widget was
+registered with (see registry.Budget):
+
+    python budgets.py
+    python budgets.py --endpoint fed-balance-sheet --runs 50
+
+The handlers are called directly, so the times are build times: without
+the HTTP stack and without the widget cache, which would answer repeats.
+Exits with status 1 if a widget exceeds its budget or does not answer 200.
+"""
+
+import argparse
+import contextlib
+import inspect
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Seed of the stand-in data every budget refers to
+REFERENCE_SEED = 0
+
+
+def _body(result):
+    """Status and body of what a handler returned."""
+    from fastapi.responses import Response
+
+    if isinstance(result, Response):
+        return result.status_code, bytes(result.body)
+    return 200, json.dumps(result, default=str).encode()
+
+
+def default_kwargs(endpoint):
+    """The widget's default parameters that its handler takes, dark theme."""
+    from registry import WIDGET_HANDLERS, WIDGETS
+
+    accepted = inspect.signature(WIDGET_HANDLERS[endpoint]).parameters
+    kwargs = {
+        param["paramName"]: param["value"]
+        for param in WIDGETS[endpoint].get("params", [])
+        if param["paramName"] in accepted and param.get("value") is not None
+    }
+    if "theme" in accepted:
+        kwargs.setdefault("theme", "dark")
+    return kwargs
+
+
+def measure(endpoint, runs):
+    """
+    Builds a widget with its default parameters.
+
+    Returns:
+        dict: status, p95_ms, max_bytes and max_memory.
+    """
+    from loadgen import percentile
+    from registry import WIDGET_HANDLERS
+
+    handler = WIDGET_HANDLERS[endpoint]
+    kwargs = default_kwargs(endpoint)
+
+    # Loads the datasets and builds the artifacts the widget needs
+    status, body = _body(handler(**kwargs))
+
+    times = []
+    size = len(body)
+    for _ in range(runs):
+        start = time.perf_counter()
+        status, body = _body(handler(**kwargs))
+        times.append((time.perf_counter() - start) * 1000)
+        size = max(size, len(body))
+
+    tracemalloc.start()
+    try:
+        _body(handler(**kwargs))
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "status": status,
+        "p95_ms": percentile(sorted(times), 95),
+        "max_bytes": size,
+        "max_memory": peak,
+    }
+
+
+def _limit(value, unit=1, digits=0):
+    return "-" if value is None else f"{value / unit:.{digits}f}"
+
+
+def print_results(results):
+    print(f"{'widget':36} {'status':>6} {'p95 ms':>15} {'KB':>15} {'MB alloc':>15}  result")
+    for endpoint, result in results.items():
+        m, b = result["measured"], result["budget"]
+        print(
+            f"{endpoint:36} {m['status']:6} "
+            f"{_limit(m['p95_ms'], digits=1):>7}/{_limit(b['p95_ms']):<7} "
+            f"{_limit(m['max_bytes'], 1e3):>7}/{_limit(b['max_bytes'], 1e3):<7} "
+            f"{_limit(m['max_memory'], 2**20, 1):>7}/{_limit(b['max_memory'], 2**20):<7}  "
+            + ("ok" if not result["failures"] else "FAIL " + ", ".join(result["failures"]))
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check every widget against its performance budget")
+    parser.add_argument("--runs", type=int, default=20, help="timed builds per widget")
+    parser.add_argument("--endpoint", action="append", help="only check this widget; repeat for several")
+    parser.add_argument("--data", help="stand-in data directory (default: generated in a temp directory)")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    sys.path.insert(0, ROOT)
+    # Build every chart in this process, so it is measured
+    os.environ["FIGURE_WORKERS"] = "0"
+
+    data_dir = args.data
+    if data_dir is None:
+        import standins
+        data_dir = tempfile.mkdtemp(prefix="openbb-budgets-")
+        standins.write_standins(data_dir, seed=REFERENCE_SEED)
+    os.chdir(data_dir)
+
+    # The loaders report every file they read
+    with contextlib.redirect_stdout(io.StringIO()):
+        import main  # noqa: F401
+        from registry import WIDGET_BUDGETS
+
+        results = {}
+        for endpoint in args.endpoint or list(WIDGET_BUDGETS):
+            budget = WIDGET_BUDGETS[endpoint]
+            measured = measure(endpoint, args.runs)
+            failures = budget.exceeded(measured)
+            if measured["status"] != 200:
+                failures.append(f"status {measured['status']}")
+            results[endpoint] = {
+                "budget": budget.limits(),
+                "measured": measured,
+                "failures": failures,
+            }
+
+    print_results(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+    failed = [endpoint for endpoint, result in results.items() if result["failures"]]
+    if failed:
+        print(f"\n{len(failed)} of {len(results)} widgets over budget or failing: {', '.join(failed)}")
+        sys.exit(1)
@@ -0,0 +1,776 @@
+"""
+Shared cache backend under the dataset and widget response caches.
+
+The in-process caches (see cache_registry.py) belong to one machine: every
+machine loads each dataset from upstream and builds each response itself,
+and a new machine starts cold. With CACHE_BACKEND set, source datasets (see
+datasets.py) and widget responses (see widget_cache.py) are also written to
+a backend shared by the fleet, and read from it before being loaded or
+built, so one warm machine serves the cache of every other:
+
+    CACHE_BACKEND=memory                          # this process only
+    CACHE_BACKEND=file:///var/cache/openbb        # machines sharing a volume
+    CACHE_BACKEND=redis://:password@cache.internal:6379/0
+
+The in-process caches stay in front of the backend, so a hit never leaves
+the process. Values are stored under namespaced, versioned keys:
+
+    <CACHE_NAMESPACE>:<FORMAT_VERSION>:<kind>:<name>[:<digest of parts>]
+
+where the parts are e.g. a dataset version, or a response's parameters and
+the version of its inputs. FORMAT_VERSION changes whenever what is stored
+changes shape, so machines of different releases never read each other's
+entries; CACHE_NAMESPACE separates deployments sharing one Redis.
+
+Bytes, e.g. response bodies, are stored as they are; anything else, e.g. a
+DataFrame, is pickled. Unpickling runs code, so only point CACHE_BACKEND at
+a store that nothing but the servers can write to.
+
+The Redis backend speaks the Redis protocol (RESP) itself, without a client
+library, so it works with any server speaking it (Redis, Valkey, KeyDB;
+rediss:// for TLS). FakeRedisServer speaks the same protocol in-process, to
+use the Redis backend offline:
+
+    with cache_backends.FakeRedisServer() as server:
+        backend = cache_backends.from_url(server.url)
+
+or, shared by several local servers, python cache_backends.py serve.
+
+Backend errors never fail a request: fetch() and store() count them and
+carry on as on a miss. After a failed connection, the Redis backend is
+skipped for REDIS_RETRY_AFTER seconds instead of being waited on again by
+every load and build.
+"""
+
+import abc
+import argparse
+import hashlib
+import os
+import pickle
+import socket
+import socketserver
+import ssl
+import struct
+import tempfile
+import threading
+import time
+import urllib.parse
+
+NAMESPACE = os.environ.get("CACHE_NAMESPACE", "dharmatech-openbb")
+
+# Changes whenever stored values change shape
+FORMAT_VERSION = "v1"
+
+# Seconds to wait for the Redis server
+REDIS_TIMEOUT = 2.0
+
+# Seconds the Redis backend is skipped after a failed connection
+REDIS_RETRY_AFTER = 30.0
+
+# Seconds between sweeps of expired files by the filesystem backend
+SWEEP_INTERVAL = 600.0
+
+
+class BackendError(Exception):
+    """An error reported by a backend, e.g. a Redis error reply."""
+
+
+class BackendUnavailable(BackendError):
+    """The backend is skipped after a failed connection."""
+
+
+class Backend(abc.ABC):
+    """Bytes stored under string keys, each with an optional time to live."""
+
+    name = "backend"
+
+    @abc.abstractmethod
+    def get(self, key):
+        """Returns the bytes stored under key, or None."""
+
+    @abc.abstractmethod
+    def set(self, key, value, ttl=None):
+        """
+        Stores bytes under key.
+
+        Args:
+            key (str): The key.
+            value (bytes): The value.
+            ttl (float): Optional. Seconds until the value expires.
+        """
+
+    @abc.abstractmethod
+    def delete(self, key):
+        """Removes key; returns whether it was stored."""
+
+    @abc.abstractmethod
+    def exists(self, key):
+        """Whether a value is stored under key, without reading it."""
+
+    def close(self):
+        pass
+
+
+class MemoryBackend(Backend):
+    """A backend in this process, e.g. for testing, or behind FakeRedisServer."""
+
+    name = "memory"
+
+    def __init__(self):
+        # key -> (expiry time or None, bytes)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires is not None and expires <= time.time():
+                del self._values[key]
+                return None
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires = None if ttl is None else time.time() + ttl
+        with self._lock:
+            self._values[key] = (expires, bytes(value))
+
+    def delete(self, key):
+        with self._lock:
+            return self._values.pop(key, None) is not None
+
+    def exists(self, key):
+        return self.get(key) is not None
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._values)
+
+
+class FilesystemBackend(Backend):
+    """
+    One file per key in a directory, e.g. on a volume several machines
+    mount. Files are replaced atomically, so readers never see a partial
+    value. Versioned keys are seldom read again once their version is
+    replaced, so set() removes expired files every SWEEP_INTERVAL seconds.
+    """
+
+    name = "filesystem"
+
+    # Expiry time of the value, 0 if none, in front of it
+    _HEADER = struct.Struct("<d")
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._swept = 0.0
+        self._sweep_lock = threading.Lock()
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode()).hexdigest())
+
+    def _expiry(self, path):
+        with open(path, "rb") as f:
+            (expires,) = self._HEADER.unpack(f.read(self._HEADER.size))
+        return expires
+
+    def exists(self, key):
+        try:
+            expires = self._expiry(self._path(key))
+        except (FileNotFoundError, struct.error):
+            return False
+        return not expires or expires > time.time()
+
+    def sweep(self):
+        """
+        Removes expired files, and temporary files of writes that did not
+        finish within an hour.
+
+        Returns:
+            int: Number of files removed.
+        """
+        now = time.time()
+        removed = 0
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                try:
+                    if entry.name.startswith(".tmp-"):
+                        expired = entry.stat().st_mtime < now - 3600
+                    else:
+                        expires = self._expiry(entry.path)
+                        expired = bool(expires) and expires <= now
+                    if expired:
+                        os.remove(entry.path)
+                        removed += 1
+                except (OSError, struct.error):
+                    # Replaced or removed meanwhile, e.g. by another machine
+                    continue
+        return removed
+
+    def _maybe_sweep(self):
+        now = time.time()
+        if now - self._swept < SWEEP_INTERVAL or not self._sweep_lock.acquire(blocking=False):
+            return
+        try:
+            self._swept = now
+            self.sweep()
+        finally:
+            self._sweep_lock.release()
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        (expires,) = self._HEADER.unpack_from(data)
+        if expires and expires <= time.time():
+            self.delete(key)
+            return None
+        return data[self._HEADER.size:]
+
+    def set(self, key, value, ttl=None):
+        expires = 0.0 if ttl is None else time.time() + ttl
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(self._HEADER.pack(expires))
+                f.write(value)
+            os.replace(tmp, self._path(key))
+        except BaseException:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+        self._maybe_sweep()
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+            return True
+        except FileNotFoundError:
+            return False
+
+
+def _encode(*args):
+    """Encodes a command as a RESP array of bulk strings."""
+    parts = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        if not isinstance(arg, bytes):
+            arg = str(arg).encode()
+        parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+    return b"".join(parts)
+
+
+def _read(reader):
+    """
+    Reads one RESP value: a reply, or a command sent to FakeRedisServer.
+
+    Raises:
+        BackendError: For an error reply.
+        ConnectionError: If the connection was closed.
+    """
+    line = reader.readline()
+    if not line.endswith(b"\r\n"):
+        raise ConnectionError("Connection closed")
+    kind, rest = line[:1], line[1:-2]
+    if kind == b"+":
+        return rest.decode()
+    if kind == b"-":
+        raise BackendError(rest.decode())
+    if kind == b":":
+        return int(rest)
+    if kind == b"$":
+        length = int(rest)
+        if length < 0:
+            return None
+        data = reader.read(length + 2)
+        if len(data) != length + 2:
+            raise ConnectionError("Connection closed")
+        return data[:-2]
+    if kind == b"*":
+        length = int(rest)
+        return None if length < 0 else [_read(reader) for _ in range(length)]
+    raise BackendError(f"Unexpected reply {line[:32]!r}")
+
+
+class _Connection:
+    def __init__(self, host, port, tls, timeout):
+        sock = socket.create_connection((host, port), timeout)
+        if tls:
+            sock = ssl.create_default_context().wrap_socket(sock, server_hostname=host)
+        self.sock = sock
+        self.reader = sock.makefile("rb")
+
+    def command(self, *args):
+        self.sock.sendall(_encode(*args))
+        return _read(self.reader)
+
+    def close(self):
+        try:
+            self.reader.close()
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class RedisBackend(Backend):
+    """
+    A Redis server, or any server speaking its protocol. Connections are
+    opened on demand and reused; one that fails is dropped, and the server
+    is not contacted again for REDIS_RETRY_AFTER seconds.
+    """
+
+    name = "redis"
+
+    def __init__(self, host="127.0.0.1", port=6379, db=0, username=None,
+                 password=None, tls=False, timeout=REDIS_TIMEOUT,
+                 retry_after=REDIS_RETRY_AFTER):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.username = username
+        self.password = password
+        self.tls = tls
+        self.timeout = timeout
+        self.retry_after = retry_after
+        # Monotonic time before which the server is not contacted
+        self._down_until = 0.0
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        connection = _Connection(self.host, self.port, self.tls, self.timeout)
+        try:
+            if self.password is not None:
+                if self.username:
+                    connection.command("AUTH", self.username, self.password)
+                else:
+                    connection.command("AUTH", self.password)
+            if self.db:
+                connection.command("SELECT", self.db)
+        except BaseException:
+            connection.close()
+            raise
+        return connection
+
+    def command(self, *args):
+        """
+        Sends one command and returns its reply.
+
+        Raises:
+            BackendUnavailable: While the server is skipped after a failed
+                connection.
+        """
+        if time.monotonic() < self._down_until:
+            raise BackendUnavailable(f"{self.host}:{self.port} is unavailable")
+        with self._lock:
+            connection = self._idle.pop() if self._idle else None
+        try:
+            if connection is None:
+                connection = self._connect()
+            reply = connection.command(*args)
+        except BackendError:
+            # An error reply leaves the connection usable
+            if connection is not None:
+                self._release(connection)
+            raise
+        except (OSError, ConnectionError):
+            if connection is not None:
+                connection.close()
+            self._down_until = time.monotonic() + self.retry_after
+            raise
+        except BaseException:
+            if connection is not None:
+                connection.close()
+            raise
+        self._release(connection)
+        return reply
+
+    def _release(self, connection):
+        with self._lock:
+            self._idle.append(connection)
+
+    def get(self, key):
+        return self.command("GET", key)
+
+    def set(self, key, value, ttl=None):
+        if ttl is None:
+            self.command("SET", key, value)
+        else:
+            self.command("SET", key, value, "PX", max(1, int(ttl * 1000)))
+
+    def delete(self, key):
+        return self.command("DEL", key) > 0
+
+    def exists(self, key):
+        return self.command("EXISTS", key) > 0
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            connection.close()
+
+
+class _FakeRedisHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        try:
+            while True:
+                try:
+                    args = _read(self.rfile)
+                except (ConnectionError, OSError):
+                    return
+                except BackendError as e:
+                    self.wfile.write(b"-ERR %s\r\n" % str(e).encode())
+                    return
+                if not args:
+                    continue
+                reply = self.server.execute(self.request, [bytes(arg) for arg in args])
+                try:
+                    self.wfile.write(_reply(reply))
+                except OSError:
+                    return
+                if args[0].upper() == b"QUIT":
+                    return
+        finally:
+            self.server._authenticated.discard(self.request)
+
+
+def _reply(value):
+    if isinstance(value, BackendError):
+        return b"-%s\r\n" % str(value).encode()
+    if value is None:
+        return b"$-1\r\n"
+    if isinstance(value, bool) or isinstance(value, int):
+        return b":%d\r\n" % value
+    if isinstance(value, str):
+        return b"+%s\r\n" % value.encode()
+    return b"$%d\r\n%s\r\n" % (len(value), value)
+
+
+class FakeRedisServer(socketserver.ThreadingTCPServer):
+    """
+    An in-process server speaking the Redis protocol, for running
+    RedisBackend offline. Implements PING, AUTH, SELECT, GET, SET (with EX
+    or PX), DEL, EXISTS, DBSIZE, FLUSHDB and QUIT on one database.
+
+    Args:
+        host (str): Optional. Address to listen on.
+        port (int): Optional. Port to listen on; a free one by default.
+        password (str): Optional. Required with AUTH before other commands.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host="127.0.0.1", port=0, password=None):
+        super().__init__((host, port), _FakeRedisHandler)
+        self.password = password
+        self.values = MemoryBackend()
+        self._authenticated = set()
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        auth = f":{urllib.parse.quote(self.password)}@" if self.password else ""
+        return f"redis://{auth}{host}:{port}/0"
+
+    def execute(self, connection, args):
+        command, args = args[0].upper().decode(), args[1:]
+        if command == "AUTH":
+            if args and args[-1].decode() == self.password:
+                self._authenticated.add(connection)
+                return "OK"
+            return BackendError("WRONGPASS invalid password")
+        if self.password and connection not in self._authenticated:
+            return BackendError("NOAUTH Authentication required.")
+        if command in ("PING", "QUIT", "SELECT"):
+            return "PONG" if command == "PING" else "OK"
+        if command == "GET" and len(args) == 1:
+            return self.values.get(args[0].decode())
+        if command == "SET" and len(args) in (2, 4):
+            ttl = None
+            if len(args) == 4:
+                unit = args[2].upper()
+                if unit not in (b"EX", b"PX"):
+                    return BackendError("ERR syntax error")
+                ttl = int(args[3]) / (1 if unit == b"EX" else 1000)
+            self.values.set(args[0].decode(), args[1], ttl)
+            return "OK"
+        if command == "DEL":
+            return sum(self.values.delete(key.decode()) for key in args)
+        if command == "EXISTS":
+            return sum(self.values.get(key.decode()) is not None for key in args)
+        if command == "DBSIZE":
+            return len(self.values)
+        if command == "FLUSHDB":
+            self.values.clear()
+            return "OK"
+        return BackendError(f"ERR unknown command '{command.lower()}'")
+
+    def start(self):
+        """Serves in a background thread; returns the server."""
+        self._thread = threading.Thread(
+            target=self.serve_forever, name="fake-redis", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def from_url(url):
+    """
+    Creates the backend a CACHE_BACKEND value names.
+
+    Args:
+        url (str): "memory", "file:///path" (or a plain path),
+            "redis://[[user]:password@]host[:port][/db]" or rediss:// for
+            TLS. Empty or "none" for no backend.
+
+    Returns:
+        Backend: The backend, or None.
+
+    Raises:
+        ValueError: If the scheme is unknown.
+    """
+    if not url or url == "none":
+        return None
+    if url == "memory":
+        return MemoryBackend()
+    parsed = urllib.parse.urlparse(url)
+    if parsed.scheme in ("redis", "rediss"):
+        path = parsed.path.strip("/")
+        return RedisBackend(
+            host=parsed.hostname or "127.0.0.1",
+            port=parsed.port or 6379,
+            db=int(path) if path else 0,
+            username=urllib.parse.unquote(parsed.username) if parsed.username else None,
+            password=urllib.parse.unquote(parsed.password) if parsed.password else None,
+            tls=parsed.scheme == "rediss",
+        )
+    if parsed.scheme == "file":
+        return FilesystemBackend(urllib.parse.unquote(parsed.path))
+    if not parsed.scheme:
+        return FilesystemBackend(url)
+    raise ValueError(f"Unknown cache backend {url}; use memory, file:///path or redis://host:port")
+
+
+BACKEND = from_url(os.environ.get("CACHE_BACKEND", ""))
+
+_counters = {
+    "hits": 0, "misses": 0, "stores": 0, "errors": 0, "skipped": 0,
+    "bytes_read": 0, "bytes_written": 0,
+}
+_last_error = None
+_counters_lock = threading.Lock()
+
+
+def _count(name, amount=1):
+    with _counters_lock:
+        _counters[name] += amount
+
+
+def _error(e):
+    global _last_error
+    if isinstance(e, BackendUnavailable):
+        _count("skipped")
+        return
+    _count("errors")
+    _last_error = f"{type(e).__name__}: {e}"
+
+
+def configure(backend):
+    """Replaces the shared backend, e.g. with a MemoryBackend for testing."""
+    global BACKEND
+    if BACKEND is not None:
+        BACKEND.close()
+    BACKEND = backend
+
+
+def key(kind, name, *parts):
+    """
+    Returns a namespaced, versioned key.
+
+    Args:
+        kind (str): What is stored, e.g. "dataset" or "response".
+        name (str): Which one, e.g. a dataset name or widget endpoint.
+        *parts: Anything else identifying the value, e.g. versions and
+            parameters, hashed together by their repr().
+    """
+    prefix = f"{NAMESPACE}:{FORMAT_VERSION}:{kind}:{name}"
+    if not parts:
+        return prefix
+    return prefix + ":" + hashlib.sha1(repr(parts).encode()).hexdigest()[:24]
+
+
+def dumps(value):
+    """Serializes a value: bytes as they are, anything else pickled."""
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return b"b" + bytes(value)
+    return b"p" + pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def loads(data):
+    """Deserializes what dumps() returned."""
+    kind, payload = data[:1], data[1:]
+    if kind == b"b":
+        return payload
+    if kind == b"p":
+        return pickle.loads(payload)
+    raise ValueError(f"Unknown cache value type {kind!r}")
+
+
+def fetch(key):
+    """
+    Returns the value stored under key in the shared backend, or None if
+    there is none, nothing is stored or the backend failed.
+    """
+    backend = BACKEND
+    if backend is None:
+        return None
+    try:
+        data = backend.get(key)
+        if data is None:
+            _count("misses")
+            return None
+        value = loads(data)
+    except Exception as e:
+        _error(e)
+        return None
+    _count("hits")
+    _count("bytes_read", len(data))
+    return value
+
+
+def exists(key):
+    """Whether the shared backend holds a value under key; False on errors."""
+    backend = BACKEND
+    if backend is None:
+        return False
+    try:
+        return backend.exists(key)
+    except Exception as e:
+        _error(e)
+        return False
+
+
+def store(key, value, ttl=None):
+    """
+    Stores a value under key in the shared backend.
+
+    Args:
+        key (str): A key from key().
+        value: Bytes, or any picklable value, e.g. a DataFrame.
+        ttl (float): Optional. Seconds the backend keeps it.
+
+    Returns:
+        bool: Whether it was stored.
+    """
+    backend = BACKEND
+    if backend is None:
+        return False
+    try:
+        data = dumps(value)
+        backend.set(key, data, ttl)
+    except Exception as e:
+        _error(e)
+        return False
+    _count("stores")
+    _count("bytes_written", len(data))
+    return True
+
+
+def stats():
+    """The shared backend in use and its counters."""
+    with _counters_lock:
+        counters = dict(_counters)
+    lookups = counters["hits"] + counters["misses"]
+    return {
+        "backend": None if BACKEND is None else BACKEND.name,
+        "namespace": f"{NAMESPACE}:{FORMAT_VERSION}",
+        **counters,
+        "hit_rate": round(counters["hits"] / lookups, 4) if lookups else None,
+        "last_error": _last_error,
+    }
+
+
+def check(backend):
+    """
+    Round-trips a DataFrame, bytes and an expiring value through a backend.
+
+    Raises:
+        AssertionError: If a value does not come back as stored.
+    """
+    import pandas as pd
+
+    frame = pd.DataFrame({
+        "date": pd.date_range("2024-01-03", periods=3, freq="W-WED"),
+        "WALCL": [7.7e6, 7.6e6, 7.5e6],
+    })
+    body = b'{"data": []}' * 100
+    prefix = key("check", str(os.getpid()))
+
+    backend.set(prefix + ":frame", dumps(frame))
+    backend.set(prefix + ":body", dumps(body))
+    backend.set(prefix + ":short", dumps(b"gone"), ttl=0.05)
+    assert loads(backend.get(prefix + ":frame")).equals(frame), "DataFrame changed"
+    assert loads(backend.get(prefix + ":body")) == body, "bytes changed"
+    assert backend.exists(prefix + ":body"), "stored value does not exist"
+    time.sleep(0.1)
+    assert backend.get(prefix + ":short") is None, "value did not expire"
+    assert backend.delete(prefix + ":frame") and backend.delete(prefix + ":body")
+    assert backend.get(prefix + ":frame") is None, "value not deleted"
+    assert not backend.exists(prefix + ":frame"), "deleted value exists"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Shared cache backends")
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve = commands.add_parser("serve", help="run a fake Redis server for local servers to share")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=6379)
+    serve.add_argument("--password")
+    check_parser = commands.add_parser(
+        "check", help="round-trip values through every backend, Redis against a fake server"
+    )
+    check_parser.add_argument("--url", help="only check this CACHE_BACKEND value")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        server = FakeRedisServer(args.host, args.port, args.password)
+        print(f"Serving {server.url}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+    elif args.url:
+        check(from_url(args.url))
+        print(f"{args.url}: ok")
+    else:
+        with tempfile.TemporaryDirectory() as directory, FakeRedisServer(password="secret") as server:
+            for url in ("memory", f"file://{directory}", server.url):
+                backend = from_url(url)
+                check(backend)
+                backend.close()
+                print(f"{url}: ok")
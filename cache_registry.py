@@ -0,0 +1,277 @@
+"""
+Registry of in-process caches sharing one memory budget.
+
+Every cache in the server (dataset snapshots, derived panels and cubes,
+metric results, stored responses) is a Cache registered here. Each entry
+records its size in bytes and its rebuild cost, the seconds it took to
+build. When the caches together hold more than CACHE_MEMORY_BUDGET_MB,
+entries are evicted by GreedyDual-Size-Frequency: an entry's priority is
+hits x rebuild cost / size, plus an aging term, so large entries that are
+cheap to rebuild and seldom used go first. Caches created with
+evictable=False (e.g. /widgets.json) count towards the budget but are never
+evicted.
+
+stats() reports hit rates, sizes and ages of every cache; /debug/caches
+serves it.
+"""
+
+import os
+import sys
+import threading
+import time
+
+MEMORY_BUDGET = int(float(os.environ.get("CACHE_MEMORY_BUDGET_MB", "384")) * 1024 * 1024)
+
+# Registered caches: name -> Cache
+CACHES = {}
+
+# One lock for every cache, so the budget is checked against a consistent total
+_lock = threading.RLock()
+
+# GreedyDual aging term: the priority of the last evicted entry
+_inflation = 0.0
+
+_MISSING = object()
+
+
+def sizeof(value, _seen=None):
+    """
+    Approximates the deep size of a cached value in bytes.
+
+    pandas objects report their deep memory usage, numpy arrays their
+    buffer size; containers and plain objects are walked recursively.
+    """
+    if _seen is None:
+        _seen = set()
+    if id(value) in _seen:
+        return 0
+    _seen.add(id(value))
+
+    if isinstance(value, (bytes, bytearray, str, int, float)):
+        return sys.getsizeof(value)
+
+    memory_usage = getattr(value, "memory_usage", None)
+    if callable(memory_usage):
+        usage = memory_usage(deep=True)
+        return int(usage.sum()) if hasattr(usage, "sum") else int(usage)
+
+    nbytes = getattr(value, "nbytes", None)
+    if isinstance(nbytes, int):
+        return nbytes
+
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(
+            sizeof(k, _seen) + sizeof(v, _seen) for k, v in value.items()
+        )
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return sys.getsizeof(value) + sum(sizeof(v, _seen) for v in value)
+    if hasattr(value, "__dict__"):
+        return sys.getsizeof(value) + sizeof(vars(value), _seen)
+    return sys.getsizeof(value)
+
+
+class Entry:
+    """A cached value with its accounting."""
+
+    def __init__(self, value, size, cost):
+        self.value = value
+        self.size = max(int(size), 1)
+        self.cost = cost
+        self.created = time.time()
+        self.last_used = self.created
+        self.hits = 0
+        self.priority = 0.0
+
+    def touch(self):
+        self.hits += 1
+        self.last_used = time.time()
+        self.priority = _inflation + (self.hits + 1) * max(self.cost, 1e-6) / self.size
+
+
+class Cache:
+    """
+    A named key -> value cache registered with the memory budget.
+
+    Args:
+        name (str): Unique name shown in stats().
+        evictable (bool): Optional. False to never evict entries for the
+            budget; they are still counted.
+        on_evict (callable): Optional. Called with the key and value of
+            every entry evicted for the budget, e.g. to drop entries of
+            other caches that keep the value alive.
+    """
+
+    def __init__(self, name, evictable=True, on_evict=None):
+        self.name = name
+        self.evictable = evictable
+        self.on_evict = on_evict
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = {}
+        with _lock:
+            if name in CACHES:
+                raise ValueError(f"Cache {name} is already registered")
+            CACHES[name] = self
+
+    def get(self, key, default=None):
+        """Returns the cached value for key, or default."""
+        with _lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+            entry.touch()
+            return entry.value
+
+    def put(self, key, value, cost=0.0, size=None):
+        """
+        Stores a value, then evicts other entries if over the budget.
+
+        Args:
+            key (Hashable): The key.
+            value (object): The value. Treat as read-only once stored.
+            cost (float): Optional. Seconds it took to build the value.
+            size (int): Optional. Size in bytes; measured with sizeof() if
+                not given.
+
+        Returns:
+            object: The value.
+        """
+        if size is None:
+            size = sizeof(value)
+        entry = Entry(value, size, cost)
+        with _lock:
+            entry.priority = _inflation + max(cost, 1e-6) / entry.size
+            self._entries[key] = entry
+            _enforce_budget(keep=entry)
+        return value
+
+    def get_or_build(self, key, build):
+        """
+        Returns the cached value for key, building and storing it if missing.
+
+        Args:
+            key (Hashable): The key.
+            build (callable): Called without arguments to build the value;
+                its run time is recorded as the rebuild cost.
+
+        Returns:
+            object: The value.
+        """
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        start = time.perf_counter()
+        value = build()
+        return self.put(key, value, cost=time.perf_counter() - start)
+
+    def pop(self, key, default=None):
+        """Removes key and returns its value, or default."""
+        with _lock:
+            entry = self._entries.pop(key, None)
+        return default if entry is None else entry.value
+
+    def discard(self, predicate):
+        """Removes every entry whose key satisfies predicate(key)."""
+        with _lock:
+            for key in [k for k in self._entries if predicate(k)]:
+                del self._entries[key]
+
+    def clear(self):
+        """Removes every entry."""
+        with _lock:
+            self._entries.clear()
+
+    def keys(self):
+        """Returns a snapshot of the cached keys."""
+        with _lock:
+            return list(self._entries)
+
+    def items(self):
+        """Returns a snapshot of the cached (key, value) pairs."""
+        with _lock:
+            return [(key, entry.value) for key, entry in self._entries.items()]
+
+    def __contains__(self, key):
+        with _lock:
+            return key in self._entries
+
+    def __len__(self):
+        with _lock:
+            return len(self._entries)
+
+    @property
+    def size(self):
+        """Bytes held by every entry."""
+        with _lock:
+            return sum(entry.size for entry in self._entries.values())
+
+    def stats(self):
+        """Counters and per-entry sizes, costs and ages."""
+        now = time.time()
+        with _lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": sum(entry.size for entry in self._entries.values()),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+                "evictions": self.evictions,
+                "evictable": self.evictable,
+                "items": [
+                    {
+                        "key": repr(key),
+                        "bytes": entry.size,
+                        "cost_s": round(entry.cost, 4),
+                        "hits": entry.hits,
+                        "age_s": round(now - entry.created, 1),
+                        "idle_s": round(now - entry.last_used, 1),
+                    }
+                    for key, entry in self._entries.items()
+                ],
+            }
+
+
+def total_size():
+    """Bytes held by every registered cache."""
+    with _lock:
+        return sum(cache.size for cache in CACHES.values())
+
+
+def _enforce_budget(keep):
+    """Evicts the lowest-priority entries until the caches fit the budget."""
+    global _inflation
+    used = total_size()
+    while used > MEMORY_BUDGET:
+        victim = None
+        for cache in CACHES.values():
+            if not cache.evictable:
+                continue
+            for key, entry in cache._entries.items():
+                if entry is keep:
+                    continue
+                if victim is None or entry.priority < victim[2].priority:
+                    victim = (cache, key, entry)
+        if victim is None:
+            return
+        cache, key, entry = victim
+        del cache._entries[key]
+        cache.evictions += 1
+        _inflation = entry.priority
+        used -= entry.size
+        if cache.on_evict is not None:
+            cache.on_evict(key, entry.value)
+            used = total_size()
+
+
+def stats():
+    """Returns the budget, the bytes in use and the stats of every cache."""
+    with _lock:
+        return {
+            "budget_bytes": MEMORY_BUDGET,
+            "used_bytes": total_size(),
+            "caches": {name: cache.stats() for name, cache in sorted(CACHES.items())},
+        }
@@ -0,0 +1,677 @@
+"""
+Shared dataset snapshots.
+
+This is the one data-access layer for the FastAPI backend and the Streamlit
+explorers. Every dataset is registered here with a loader that returns a
+typed DataFrame: numeric columns are numeric and date columns are
+datetime64. The first caller loads a dataset once, and every other caller in
+the process shares the same snapshot. Snapshots must be treated as
+read-only.
+
+Processes on one host, e.g. the API server and a Streamlit explorer, also
+share one copy of each dataset. Every loaded snapshot is written to
+DATASET_SHARE_DIR (see snapshot_files.py) and mapped back, and the other
+processes map the same file instead of loading the dataset: a source
+dataset while it was validated less than DATASET_MAX_AGE seconds ago, a
+derived one while its inputs have the versions it was derived from. Their
+numeric and date columns are then held once, in the page cache.
+
+Each snapshot carries a version, a hash of its content, so caches of derived
+results can be keyed by it: it changes whenever reloaded data differs, and
+the same data has the same version in every process. Datasets may be
+derived from other datasets (see `inputs`), and invalidating or refreshing a
+dataset also invalidates everything derived from it. Snapshots are held in
+a cache_registry cache, so under memory pressure one may be evicted and
+reloaded on next use. Functions registered with
+on_change() are told which datasets were loaded, reloaded or dropped, so
+caches of derived results can be invalidated precisely (see artifacts.py).
+
+Snapshots are served stale-while-revalidate. A snapshot older than
+DATASET_MAX_AGE seconds, or marked with expire(), is still returned at once,
+while one background thread reloads the dataset; if the reloaded data is
+unchanged, the snapshot keeps its version. Only a snapshot older than
+DATASET_MAX_AGE + DATASET_MAX_STALE seconds is reloaded before answering.
+Derived datasets do not expire by age; they follow their inputs.
+
+With a shared cache backend (see cache_backends.py), every source dataset
+loaded or found unchanged is also written to it, and other machines take it
+from there, instead of loading it themselves, while it was validated less
+than DATASET_MAX_AGE seconds ago. A dataset marked with expire() or reloaded
+with refresh() is always loaded from its source.
+
+    df = datasets.load("mts_table_4")       # shared, typed DataFrame
+    datasets.expire("mts_table_4")          # reload in the background
+    datasets.refresh("mts_table_4")         # reload one dataset now
+    datasets.invalidate()                   # drop every snapshot
+"""
+
+import concurrent.futures
+import contextvars
+import glob
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import _fed_balance_sheet
+import cache_backends
+import cache_registry
+import snapshot_files
+from lazy_imports import lazy_module
+
+pd = lazy_module("pandas")
+fed_net_liquidity = lazy_module("fed_net_liquidity")
+deposits_withdrawals_load = lazy_module(
+    "treasury_gov_pandas.datasets.deposits_withdrawals_operating_cash.load"
+)
+mts_table_4_load = lazy_module("treasury_gov_pandas.datasets.mts.mts_table_4.load")
+
+MAX_AGE = float(os.environ.get("DATASET_MAX_AGE", "3600"))
+MAX_STALE = float(os.environ.get("DATASET_MAX_STALE", "86400"))
+
+# Where processes on this host share their snapshots; empty to not share.
+# The loaders read files relative to the working directory, so by default
+# only processes of one user started from the same directory share.
+SHARE_DIR = os.environ.get(
+    "DATASET_SHARE_DIR",
+    os.path.join(
+        tempfile.gettempdir(),
+        "dharmatech-openbb-datasets-" + hashlib.sha1(
+            f"{os.getuid() if hasattr(os, 'getuid') else ''}:{os.getcwd()}".encode()
+        ).hexdigest()[:12],
+    ),
+)
+SHARE_DIR_SET = "DATASET_SHARE_DIR" in os.environ
+
+# Registered loaders: name -> function returning a DataFrame
+LOADERS = {}
+
+# Datasets each dataset is derived from: name -> tuple of names
+INPUTS = {}
+
+# Functions called with the names of datasets whose snapshot changed
+LISTENERS = []
+
+_snapshots = cache_registry.Cache("datasets")
+_share_dir_checked = None
+_private_dir_path = None
+_locks = {}
+_registry_lock = threading.Lock()
+
+# Datasets being reloaded in the background, and the thread that does it
+_revalidating = set()
+_background = concurrent.futures.ThreadPoolExecutor(
+    max_workers=2, thread_name_prefix="dataset-revalidate"
+)
+
+# Snapshots pinned for the current batch of requests, if any
+_scope = contextvars.ContextVar("dataset_scope", default=None)
+
+
+class Snapshot:
+    """An immutable, versioned copy of a dataset."""
+
+    def __init__(self, name, version, frame, validated_at=None):
+        self.name = name
+        self.version = version
+        self.frame = frame
+        self.loaded_at = time.time()
+        # Last time the data was loaded or found unchanged, by any machine
+        self.validated_at = self.loaded_at if validated_at is None else validated_at
+        self.expired = False
+
+    def __repr__(self):
+        return f"Snapshot({self.name!r}, version={self.version}, rows={len(self.frame)})"
+
+
+def register_dataset(name, inputs=()):
+    """
+    Decorator that registers a dataset loader under name.
+
+    Args:
+        name (str): The dataset name used with get() and load().
+        inputs (tuple): Optional. Datasets the loader reads with load().
+            The dataset is invalidated whenever one of them is.
+
+    Returns:
+        function: The decorated loader, unchanged.
+    """
+    def decorator(func):
+        LOADERS[name] = func
+        INPUTS[name] = tuple(inputs)
+        return func
+    return decorator
+
+
+def on_change(func):
+    """
+    Decorator that registers a listener for snapshot changes.
+
+    The listener is called with a list of dataset names after they were
+    loaded, reloaded or invalidated, outside of any dataset lock.
+
+    Returns:
+        function: The decorated listener, unchanged.
+    """
+    LISTENERS.append(func)
+    return func
+
+
+def _notify(names):
+    for listener in LISTENERS:
+        listener(list(names))
+
+
+def _lock_for(name):
+    with _registry_lock:
+        return _locks.setdefault(name, threading.Lock())
+
+
+def content_version(frame):
+    """Returns a hash of a DataFrame's values, index, columns and dtypes."""
+    digest = hashlib.sha1()
+    digest.update(pd.util.hash_pandas_object(frame, index=True).to_numpy().tobytes())
+    digest.update(repr([(str(c), str(t)) for c, t in frame.dtypes.items()]).encode())
+    return digest.hexdigest()[:16]
+
+
+def _dependents(name):
+    """Returns every dataset derived, directly or not, from name."""
+    found = []
+    pending = [name]
+    while pending:
+        current = pending.pop()
+        for other, inputs in INPUTS.items():
+            if current in inputs and other not in found:
+                found.append(other)
+                pending.append(other)
+    return found
+
+
+def _age(snapshot):
+    return time.time() - snapshot.validated_at
+
+
+def _is_stale(snapshot):
+    if INPUTS.get(snapshot.name):
+        return False
+    return snapshot.expired or _age(snapshot) > MAX_AGE
+
+
+def _is_usable(snapshot):
+    """Whether a snapshot may be served, possibly stale."""
+    if snapshot is None:
+        return False
+    if INPUTS.get(snapshot.name):
+        return True
+    return _age(snapshot) <= MAX_AGE + MAX_STALE
+
+
+def _install(name, frame, cost, version, validated_at=None):
+    """Stores a new snapshot and drops the datasets derived from it."""
+    snapshot = Snapshot(name, version, frame, validated_at)
+    with _registry_lock:
+        _snapshots.put(name, snapshot, cost=cost)
+        dependents = _dependents(name)
+        for stale in dependents:
+            _snapshots.pop(stale, None)
+    return snapshot, dependents
+
+
+def _backend_key(name, version=None):
+    if version is None:
+        return cache_backends.key("dataset", name)
+    return cache_backends.key("dataset", name, version)
+
+
+def _is_shared(name):
+    return cache_backends.BACKEND is not None and not INPUTS.get(name)
+
+
+def _publish(snapshot, changed):
+    """
+    Writes a source dataset's snapshot to the shared cache backend: its
+    frame, unless changed is False and the backend holds it already, and
+    the pointer to its version and validation time.
+    """
+    ttl = MAX_AGE + MAX_STALE
+    frame_key = _backend_key(snapshot.name, snapshot.version)
+    if changed or not cache_backends.exists(frame_key):
+        if not cache_backends.store(frame_key, snapshot.frame, ttl):
+            return
+    cache_backends.store(
+        _backend_key(snapshot.name), (snapshot.version, snapshot.validated_at), ttl
+    )
+
+
+def _from_backend(name, current):
+    """
+    Reads the snapshot of a source dataset that was validated less than
+    MAX_AGE seconds ago from the shared cache backend.
+
+    Returns:
+        tuple: (version, validated_at, frame), with frame None if current
+        has that version already; or None if nothing fresh is shared.
+    """
+    shared = cache_backends.fetch(_backend_key(name))
+    if shared is None:
+        return None
+    version, validated_at = shared
+    if time.time() - validated_at > MAX_AGE:
+        return None
+    if current is not None and current.version == version:
+        return version, validated_at, None
+    frame = cache_backends.fetch(_backend_key(name, version))
+    if frame is None:
+        return None
+    return version, validated_at, frame
+
+
+def _share_dir():
+    """
+    Returns SHARE_DIR if snapshots may be shared there, or None.
+
+    Shared files are unpickled, so the default directory, in the system temp
+    directory, is only used if this user created it and no one else can
+    write to it. A directory set with DATASET_SHARE_DIR is trusted.
+    """
+    global _share_dir_checked
+    if _share_dir_checked is None:
+        try:
+            usable = bool(SHARE_DIR) and (
+                snapshot_files.private_directory(SHARE_DIR) or SHARE_DIR_SET
+            )
+        except OSError:
+            usable = False
+        _share_dir_checked = SHARE_DIR if usable else ""
+    return _share_dir_checked or None
+
+
+def _share_paths(name, version=None):
+    pointer = os.path.join(SHARE_DIR, f"{name}.json")
+    if version is None:
+        return pointer
+    return pointer, os.path.join(SHARE_DIR, f"{name}-{version}.snap")
+
+
+def _input_versions(name):
+    return {dependency: get(dependency).version for dependency in INPUTS.get(name, ())}
+
+
+def _from_host(name, current):
+    """
+    Maps the snapshot another process on this host shared in SHARE_DIR, if
+    it is current: validated less than MAX_AGE seconds ago for a source
+    dataset, derived from the current version of its inputs otherwise.
+
+    Returns:
+        tuple: (version, validated_at, frame), with frame None if current
+        has that version already; or None if nothing current is shared.
+    """
+    if _share_dir() is None:
+        return None
+    try:
+        with open(_share_paths(name)) as f:
+            shared = json.load(f)
+        if INPUTS.get(name):
+            if shared["inputs"] != _input_versions(name):
+                return None
+        elif time.time() - shared["validated_at"] > MAX_AGE:
+            return None
+        version = shared["version"]
+        if current is not None and current.version == version:
+            return version, shared["validated_at"], None
+        frame = snapshot_files.read(_share_paths(name, version)[1])
+    except (OSError, ValueError, KeyError):
+        # Not shared, or replaced meanwhile
+        return None
+    return version, shared["validated_at"], frame
+
+
+def _share_on_host(name, version, validated_at, frame):
+    """
+    Writes a snapshot to SHARE_DIR, unless there already, and points the
+    other processes to it.
+
+    Returns:
+        DataFrame: The frame mapped from the file, to hold instead of
+        frame, or frame if it could not be shared. None if frame is None.
+    """
+    if _share_dir() is None:
+        return frame
+    pointer, path = _share_paths(name, version)
+    try:
+        if frame is not None:
+            if not os.path.exists(path):
+                snapshot_files.write(path, frame)
+            frame = snapshot_files.read(path)
+        tmp = f"{pointer}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({
+                "version": version,
+                "validated_at": validated_at,
+                "inputs": _input_versions(name),
+            }, f)
+        os.replace(tmp, pointer)
+        _remove_older(SHARE_DIR, name, path)
+    except (OSError, ValueError):
+        pass
+    return frame
+
+
+def _remove_older(directory, name, path):
+    """Removes the files of other versions of a snapshot than path."""
+    # Processes that mapped an older version keep their mapping
+    for old in glob.glob(os.path.join(directory, glob.escape(name) + "-*.snap")):
+        try:
+            if old != path and snapshot_files.owned(old):
+                os.remove(old)
+        except OSError:
+            # Removed meanwhile, e.g. by another process
+            continue
+
+
+def _private_dir():
+    global _private_dir_path
+    with _registry_lock:
+        if _private_dir_path is None:
+            _private_dir_path = tempfile.mkdtemp(prefix="dharmatech-openbb-snapshots-")
+        return _private_dir_path
+
+
+def remove_snapshot_files():
+    """
+    Removes the files snapshot_file() wrote to the directory private to
+    this process, if any. Call when no other process maps them any more.
+    """
+    global _private_dir_path
+    with _registry_lock:
+        path, _private_dir_path = _private_dir_path, None
+    if path is not None:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def snapshot_file(snapshot):
+    """
+    Returns the path of a file holding a snapshot, for other processes on
+    this host to map with snapshot_files.read() (see figure_pool.py): in
+    SHARE_DIR, or in a directory private to this process if snapshots are
+    not shared there. The file is written unless there already, and the
+    files of older versions are removed.
+
+    Args:
+        snapshot (Snapshot): A dataset or artifact snapshot.
+
+    Returns:
+        str: The path.
+    """
+    directory = _share_dir() or _private_dir()
+    path = os.path.join(directory, f"{snapshot.name}-{snapshot.version}.snap")
+    if not os.path.exists(path):
+        snapshot_files.write(path, snapshot.frame)
+        _remove_older(directory, snapshot.name, path)
+    return path
+
+
+def _load(name, current, shared=True):
+    """
+    Loads a dataset: if shared is True, from SHARE_DIR or the shared cache
+    backend if either holds a current copy, from its loader otherwise. Call
+    with the dataset's lock held.
+
+    Args:
+        name (str): The dataset name.
+        current (Snapshot): The snapshot held now, if any. Kept, and marked
+            as validated, if the loaded data has its version.
+        shared (bool): Optional. False to always call the loader.
+
+    Returns:
+        tuple: The current snapshot, and the names of the datasets whose
+        snapshot changed (empty if current was kept).
+    """
+    start = time.perf_counter()
+    on_host = _from_host(name, current) if shared else None
+    found = on_host
+    if found is None and shared and _is_shared(name):
+        found = _from_backend(name, current)
+    if found is None:
+        frame = LOADERS[name]()
+        version, validated_at = content_version(frame), time.time()
+    else:
+        version, validated_at, frame = found
+    if on_host is None:
+        frame = _share_on_host(name, version, validated_at, frame)
+
+    if current is not None and current.version == version:
+        current.validated_at = max(current.validated_at, validated_at)
+        current.expired = False
+        snapshot, changed = current, []
+    else:
+        snapshot, dependents = _install(
+            name, frame, time.perf_counter() - start, version, validated_at
+        )
+        changed = [name] + dependents
+    if found is None and _is_shared(name):
+        _publish(snapshot, bool(changed))
+    return snapshot, changed
+
+
+def _revalidate(name):
+    """Reloads a stale dataset, keeping its snapshot if nothing changed."""
+    try:
+        with _lock_for(name):
+            current = _snapshots.get(name)
+            # An expired dataset's source was updated: read it from there
+            shared = current is None or not current.expired
+            _, changed = _load(name, current, shared)
+        if not changed:
+            return
+        _notify(changed)
+        # Rebuild the derived datasets here rather than in a user request
+        for dependent in changed[1:]:
+            get(dependent)
+    finally:
+        with _registry_lock:
+            _revalidating.discard(name)
+
+
+def _revalidate_in_background(name):
+    with _registry_lock:
+        if name in _revalidating:
+            return
+        _revalidating.add(name)
+    _background.submit(_revalidate, name)
+
+
+def peek(name):
+    """
+    Returns the current snapshot of a dataset if it can be served without
+    loading, or None. Never blocks on a load, so it is safe to call from
+    the event loop; a stale snapshot is returned and reloaded in the
+    background, as with get().
+
+    Args:
+        name (str): The dataset name.
+
+    Returns:
+        Snapshot: The dataset snapshot, or None.
+    """
+    scope = _scope.get()
+    if scope is not None and name in scope:
+        return scope[name]
+
+    snapshot = _snapshots.get(name)
+    if not _is_usable(snapshot):
+        return None
+    if _is_stale(snapshot):
+        _revalidate_in_background(name)
+
+    if scope is not None:
+        snapshot = scope.setdefault(name, snapshot)
+    return snapshot
+
+
+def get(name):
+    """
+    Returns the current snapshot of a dataset, loading it if needed.
+
+    Concurrent callers wait for a single load instead of loading in parallel.
+    A stale snapshot is returned at once and reloaded in the background.
+    Inside a scope_context(), the first snapshot seen is reused for the
+    rest of the scope.
+
+    Args:
+        name (str): The dataset name.
+
+    Returns:
+        Snapshot: The dataset snapshot.
+    """
+    snapshot = peek(name)
+    if snapshot is not None:
+        return snapshot
+
+    changed = []
+    with _lock_for(name):
+        snapshot = _snapshots.get(name)
+        if not _is_usable(snapshot):
+            snapshot, changed = _load(name, snapshot)
+    if changed:
+        _notify(changed)
+
+    scope = _scope.get()
+    if scope is not None:
+        snapshot = scope.setdefault(name, snapshot)
+    return snapshot
+
+
+def load(name):
+    """Returns the DataFrame of the current snapshot of a dataset."""
+    return get(name).frame
+
+
+def version(name):
+    """Returns the version of the current snapshot of a dataset."""
+    return get(name).version
+
+
+def invalidate(name=None):
+    """
+    Drops the snapshot of a dataset and of every dataset derived from it,
+    or of every dataset if name is None. The next get() reloads them.
+    """
+    with _registry_lock:
+        if name is None:
+            _snapshots.clear()
+            stale = list(LOADERS)
+        else:
+            stale = [name] + _dependents(name)
+            for other in stale:
+                _snapshots.pop(other, None)
+    _notify(stale)
+
+
+def expire(name):
+    """
+    Marks the snapshot of a dataset as stale, e.g. after its source was
+    updated, and starts reloading it in the background. It keeps being
+    served until the reload replaces it.
+    """
+    with _registry_lock:
+        snapshot = _snapshots.get(name)
+        if snapshot is not None:
+            snapshot.expired = True
+    if snapshot is not None:
+        _revalidate_in_background(name)
+
+
+def refresh(name):
+    """
+    Reloads one dataset from its source now and, if the data changed,
+    invalidates the datasets derived from it.
+
+    Readers keep getting the previous snapshot until the new one is ready.
+
+    Args:
+        name (str): The dataset name.
+
+    Returns:
+        Snapshot: The current snapshot.
+    """
+    with _lock_for(name):
+        snapshot, changed = _load(name, _snapshots.get(name), shared=False)
+    if changed:
+        _notify(changed)
+    return snapshot
+
+
+def loaded():
+    """Returns the currently loaded snapshots, keyed by name."""
+    with _registry_lock:
+        return dict(_snapshots.items())
+
+
+def scope_context():
+    """
+    Returns a copy of the current context with a fresh snapshot scope.
+
+    Every get() made through the returned context, or through copies of it,
+    sees the same snapshot of each dataset, even if the dataset is
+    invalidated meanwhile. Use Context.copy() to run it in several threads.
+    """
+    ctx = contextvars.copy_context()
+    ctx.run(_scope.set, {})
+    return ctx
+
+
+@register_dataset("fed_net_liquidity")
+def _load_fed_net_liquidity():
+    df = fed_net_liquidity.load_dataframe()
+    df['date'] = pd.to_datetime(df['date'])
+    return df.reset_index(drop=True)
+
+
+@register_dataset("fed_balance_sheet_levels")
+def _load_fed_balance_sheet_levels():
+    return _fed_balance_sheet.load_levels()
+
+
+@register_dataset("fed_balance_sheet", inputs=["fed_balance_sheet_levels"])
+def _load_fed_balance_sheet():
+    # Liabilities are shown as negative amounts
+    df = load("fed_balance_sheet_levels").copy()
+    for series in _fed_balance_sheet.liabilities.keys():
+        df[series] = df[series] * -1
+    return df
+
+
+@register_dataset("fed_balance_sheet_changes", inputs=["fed_balance_sheet_levels"])
+def _load_fed_balance_sheet_changes():
+    # Week-over-week change of every series
+    df = load("fed_balance_sheet_levels")
+    return df.set_index('date').diff().reset_index()
+
+
+@register_dataset("dts_deposits_withdrawals")
+def _load_dts_deposits_withdrawals():
+    df = deposits_withdrawals_load.load()
+    df['record_date'] = pd.to_datetime(df['record_date'])
+    for col in ['transaction_today_amt', 'transaction_mtd_amt', 'transaction_fytd_amt']:
+        df[col] = pd.to_numeric(df[col], errors='coerce')
+    return df
+
+
+@register_dataset("mts_table_4")
+def _load_mts_table_4():
+    df = mts_table_4_load.load()
+    df['record_date'] = pd.to_datetime(df['record_date'])
+    for col in [
+        'current_month_net_rcpt_amt',
+        'current_month_gross_rcpt_amt',
+        'current_fytd_net_rcpt_amt',
+        'prior_fytd_net_rcpt_amt',
+    ]:
+        df[col] = pd.to_numeric(df[col], errors='coerce')
+    return df
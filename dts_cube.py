@@ -0,0 +1,120 @@
+"""
+Prefix-sum cube over Daily Treasury Statement cash flows.
+
+For every (transaction_type, transaction_catg) pair the cube stores the
+running total of transaction_today_amt by record date. The total of any
+category over any date range is then the difference of two rows, no matter
+how much history the table holds. The cube is an artifact (see
+artifacts.py) built once per version of the dts_deposits_withdrawals
+dataset.
+"""
+
+import artifacts
+from lazy_imports import lazy_module
+
+np = lazy_module("numpy")
+pd = lazy_module("pandas")
+
+DATASET = "dts_deposits_withdrawals"
+
+# Categories that are sub-totals or internal transfers, not cash flows
+EXCLUDE_CATEGORIES = [
+    "null",
+    "Sub-Total Withdrawals",
+    "Sub-Total Deposits",
+    "Transfers from Depositaries",
+    "Transfers from Federal Reserve Account (Table V)",
+    "Transfers to Depositaries",
+    "Transfers to Federal Reserve Account (Table V)",
+    "ShTransfersCtohFederalmReserve Account (Table V)"
+]
+
+
+class Cube:
+    """
+    Cumulative daily amounts.
+
+    Attributes:
+        dates (np.ndarray): Sorted datetime64 record dates.
+        columns (pd.MultiIndex): (transaction_type, transaction_catg) pairs.
+        cumulative (np.ndarray): len(dates) + 1 rows by len(columns); row i
+            holds the totals of every date before dates[i].
+    """
+
+    def __init__(self, dates, columns, cumulative):
+        self.dates = dates
+        self.columns = columns
+        self.cumulative = cumulative
+
+    def totals(self, start_date, end_date):
+        """
+        Sums every category between two dates, both inclusive.
+
+        Args:
+            start_date (str): First date, YYYY-MM-DD.
+            end_date (str): Last date, YYYY-MM-DD.
+
+        Returns:
+            pd.Series: Totals indexed by (transaction_type, transaction_catg).
+        """
+        start = np.datetime64(start_date, 'D')
+        end = np.datetime64(end_date, 'D')
+        i = np.searchsorted(self.dates, start, side='left')
+        j = np.searchsorted(self.dates, end, side='right')
+        return pd.Series(
+            self.cumulative[max(j, i)] - self.cumulative[i],
+            index=self.columns,
+        )
+
+
+@artifacts.register_artifact("dts_cube", inputs=[DATASET])
+def _build(df):
+    df = df[~df['transaction_catg'].isin(EXCLUDE_CATEGORIES)]
+
+    daily = df.pivot_table(
+        values='transaction_today_amt',
+        index=pd.to_datetime(df['record_date']).dt.normalize().rename('record_date'),
+        columns=['transaction_type', 'transaction_catg'],
+        aggfunc='sum',
+        fill_value=0,
+    ).sort_index()
+
+    amounts = daily.to_numpy(dtype='f8')
+    cumulative = np.zeros((amounts.shape[0] + 1, amounts.shape[1]))
+    np.cumsum(amounts, axis=0, out=cumulative[1:])
+
+    return Cube(
+        daily.index.to_numpy(dtype='datetime64[D]'),
+        daily.columns,
+        cumulative,
+    )
+
+
+def get_cube():
+    """
+    Returns the cube for the current dts_deposits_withdrawals snapshot.
+
+    Returns:
+        Cube: The prefix-sum cube. Treat as read-only.
+    """
+    return artifacts.get("dts_cube")
+
+
+def range_totals(start_date, end_date):
+    """
+    Sums daily amounts by category over a date range.
+
+    Withdrawals are returned as negative amounts.
+
+    Args:
+        start_date (str): First date, YYYY-MM-DD.
+        end_date (str): Last date, YYYY-MM-DD.
+
+    Returns:
+        pd.DataFrame: Columns transaction_type, transaction_catg, amount.
+    """
+    totals = get_cube().totals(start_date, end_date)
+    df = totals.rename('amount').reset_index()
+    withdrawals = df['transaction_type'] == 'Withdrawals'
+    df.loc[withdrawals, 'amount'] = -df.loc[withdrawals, 'amount']
+    return df
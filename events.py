@@ -0,0 +1,208 @@
+"""
+Server-sent events announcing data changes per widget endpoint.
+
+Clients subscribe to GET /events and refetch a widget only when it is
+announced, instead of polling it. The stream starts with the current
+version of every endpoint it covers, so a reconnecting client can compare
+them with the versions it holds:
+
+    event: versions
+    data: {"/fed-net-liquidity": "3f2a...", "/options/h41-weeks": null, ...}
+
+and then sends one event per endpoint whose data changed:
+
+    id: 7
+    event: changed
+    data: {"endpoint": "/fed-net-liquidity", "version": "91c0..."}
+
+A version is artifacts.version_of() the endpoint's inputs, the same version
+the widget cache keys its responses by; null means the data is not loaded,
+or was dropped and will be reloaded on the next request. Changes come from
+the dataset listeners (see datasets.on_change), so anything that reloads a
+dataset announces it: an upstream refresh (datasets.expire), a background
+revalidation or an invalidation. Loading a dataset for the first time is not
+announced.
+
+While anyone is subscribed, a watcher looks at the loaded datasets every
+EVENTS_CHECK_INTERVAL seconds, so stale ones are revalidated, and changes
+announced, without waiting for a request. Comment lines are sent every
+EVENTS_KEEPALIVE seconds to keep proxies from closing idle streams.
+
+Streams never end on their own, and uvicorn waits for open responses before
+it shuts down, so close_on_exit() ends them when the server is told to stop.
+"""
+
+import asyncio
+import itertools
+import json
+import os
+import signal
+import threading
+
+import artifacts
+import datasets
+from registry import OPTION_PROVIDERS, WIDGET_INPUTS
+
+KEEPALIVE = float(os.environ.get("EVENTS_KEEPALIVE", "15"))
+CHECK_INTERVAL = float(os.environ.get("EVENTS_CHECK_INTERVAL", "60"))
+
+# Milliseconds a client waits before reconnecting
+RETRY_MS = 5000
+
+# Subscribers: (event loop, asyncio.Queue, frozenset of endpoints or None)
+_subscribers = set()
+_lock = threading.Lock()
+
+# Last version announced per endpoint
+_versions = {}
+_ids = itertools.count(1)
+_watcher = None
+
+
+def endpoints():
+    """Returns every endpoint that can be announced, with its inputs."""
+    found = {f"/{endpoint}": inputs for endpoint, inputs in WIDGET_INPUTS.items()}
+    for provider in OPTION_PROVIDERS.values():
+        found[provider.endpoint] = provider.inputs
+    return found
+
+
+def current_versions(selected=None):
+    """
+    Returns the current version of every endpoint, without loading anything.
+
+    Args:
+        selected (frozenset): Optional. Endpoints to include. All by default.
+
+    Returns:
+        dict: Endpoint -> version, or None if its data is not loaded.
+    """
+    return {
+        endpoint: artifacts.peek_version_of(inputs)
+        for endpoint, inputs in endpoints().items()
+        if selected is None or endpoint in selected
+    }
+
+
+@datasets.on_change
+def _announce(names):
+    """Publishes a changed event for every endpoint downstream of names."""
+    affected = artifacts.affected(names)
+    changed = []
+    with _lock:
+        for endpoint, inputs in endpoints().items():
+            if affected.isdisjoint(inputs):
+                continue
+            version = artifacts.peek_version_of(inputs)
+            previous = _versions.get(endpoint)
+            _versions[endpoint] = version
+            # Not announced: first loads, and reloads after a drop that was
+            # already announced
+            if previous is not None and previous != version:
+                changed.append((next(_ids), endpoint, version))
+        subscribers = list(_subscribers)
+
+    for id_, endpoint, version in changed:
+        for loop, queue, selected in subscribers:
+            if selected is None or endpoint in selected:
+                try:
+                    loop.call_soon_threadsafe(
+                        queue.put_nowait, (id_, {"endpoint": endpoint, "version": version})
+                    )
+                except RuntimeError:
+                    # The subscriber's loop was closed
+                    pass
+
+
+def _format(event, data, id_=None):
+    lines = [] if id_ is None else [f"id: {id_}"]
+    lines += [f"event: {event}", "data: " + json.dumps(data, separators=(",", ":"))]
+    return ("\n".join(lines) + "\n\n").encode()
+
+
+async def _watch():
+    """Revalidates stale datasets while there are subscribers."""
+    while True:
+        await asyncio.sleep(CHECK_INTERVAL)
+        if not _subscribers:
+            continue
+        for name in datasets.loaded():
+            # Starts a background reload of a stale snapshot
+            datasets.peek(name)
+
+
+def _ensure_watcher():
+    global _watcher
+    if _watcher is None or _watcher.done():
+        _watcher = asyncio.get_running_loop().create_task(_watch())
+
+
+async def stream(selected=None):
+    """
+    Yields the server-sent events of one subscriber until it disconnects.
+
+    Args:
+        selected (frozenset): Optional. Endpoints to announce. All by
+            default.
+
+    Yields:
+        bytes: Encoded events and keep-alive comments.
+    """
+    queue = asyncio.Queue()
+    subscriber = (asyncio.get_running_loop(), queue, selected)
+    with _lock:
+        _subscribers.add(subscriber)
+    _ensure_watcher()
+    try:
+        yield f"retry: {RETRY_MS}\n\n".encode()
+        yield _format("versions", current_versions(selected))
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), KEEPALIVE)
+            except asyncio.TimeoutError:
+                yield b": keep-alive\n\n"
+                continue
+            if event is None:
+                return
+            id_, data = event
+            yield _format("changed", data, id_)
+    finally:
+        with _lock:
+            _subscribers.discard(subscriber)
+
+
+def close():
+    """Ends every open stream; clients reconnect after RETRY_MS."""
+    with _lock:
+        subscribers = list(_subscribers)
+    for loop, queue, _ in subscribers:
+        try:
+            loop.call_soon_threadsafe(queue.put_nowait, None)
+        except RuntimeError:
+            pass
+
+
+def close_on_exit():
+    """
+    Wraps the current SIGINT and SIGTERM handlers, i.e. uvicorn's, so that
+    open streams are closed before the server waits for its connections.
+    Call from the main thread, e.g. in a startup handler.
+    """
+    if threading.current_thread() is not threading.main_thread():
+        return
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        previous = signal.getsignal(sig)
+        if not callable(previous):
+            continue
+
+        def handler(signum, frame, previous=previous):
+            close()
+            previous(signum, frame)
+
+        signal.signal(sig, handler)
+
+
+def stats():
+    """Number of subscribers and the last version announced per endpoint."""
+    with _lock:
+        return {"subscribers": len(_subscribers), "versions": dict(_versions)}
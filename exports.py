@@ -0,0 +1,167 @@
+"""
+Streaming bulk exports of the shared datasets.
+
+An export streams rows of a dataset snapshot in chunks of EXPORT_CHUNK_ROWS
+as NDJSON, CSV or Arrow IPC. Only one chunk is converted at a time, so memory
+stays flat however much history is requested, and the rows come from the
+cached snapshot (see datasets.py) rather than from a rebuilt frame. The
+snapshot is taken when the export starts; a refresh during the stream does
+not change what is sent.
+
+Arrow IPC needs the optional pyarrow package.
+"""
+
+import io
+import os
+
+import datasets
+from lazy_imports import lazy_module
+
+np = lazy_module("numpy")
+pd = lazy_module("pandas")
+
+CHUNK_ROWS = int(os.environ.get("EXPORT_CHUNK_ROWS", "5000"))
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+
+EXTENSIONS = {"ndjson": "ndjson", "csv": "csv", "arrow": "arrows"}
+
+
+class Export:
+    """A dataset that can be exported, and the column its rows are dated by."""
+
+    def __init__(self, dataset, date_column):
+        self.dataset = dataset
+        self.date_column = date_column
+
+
+# Exports served at /export/<name>
+EXPORTS = {
+    "fed-balance-sheet": Export("fed_balance_sheet_levels", "date"),
+    "fed-net-liquidity": Export("fed_net_liquidity", "date"),
+    "dts-deposits-withdrawals": Export("dts_deposits_withdrawals", "record_date"),
+    "mts-table-4": Export("mts_table_4", "record_date"),
+}
+
+
+def _row_positions(frame, date_column, start_date, end_date):
+    """Returns the positions of the rows dated between start and end, inclusive."""
+    dates = frame[date_column]
+    if start_date is None and end_date is None:
+        return np.arange(len(frame))
+
+    start = pd.Timestamp(start_date) if start_date else None
+    end = pd.Timestamp(end_date) if end_date else None
+
+    if dates.is_monotonic_increasing:
+        i = dates.searchsorted(start, side="left") if start is not None else 0
+        j = dates.searchsorted(end, side="right") if end is not None else len(frame)
+        return np.arange(i, max(i, j))
+
+    mask = np.ones(len(frame), dtype=bool)
+    if start is not None:
+        mask &= (dates >= start).to_numpy()
+    if end is not None:
+        mask &= (dates <= end).to_numpy()
+    return np.flatnonzero(mask)
+
+
+def _format_dates(chunk):
+    """Formats datetime columns as YYYY-MM-DD for the text formats."""
+    for column in chunk.columns:
+        if pd.api.types.is_datetime64_any_dtype(chunk[column]):
+            chunk[column] = chunk[column].dt.strftime("%Y-%m-%d")
+    return chunk
+
+
+def _ndjson(chunks):
+    for chunk in chunks:
+        if not chunk.empty:
+            # Older pandas versions leave out the final newline
+            lines = _format_dates(chunk).to_json(orient="records", lines=True)
+            yield lines.rstrip("\n").encode() + b"\n"
+
+
+def _csv(chunks):
+    header = True
+    for chunk in chunks:
+        yield _format_dates(chunk).to_csv(index=False, header=header).encode()
+        header = False
+
+
+def _arrow(chunks):
+    import pyarrow
+
+    sink = io.BytesIO()
+    writer = None
+    schema = None
+    for chunk in chunks:
+        batch = pyarrow.RecordBatch.from_pandas(chunk, schema=schema, preserve_index=False)
+        if writer is None:
+            schema = batch.schema
+            writer = pyarrow.ipc.new_stream(sink, schema)
+        writer.write_batch(batch)
+        yield sink.getvalue()
+        sink.seek(0)
+        sink.truncate()
+    if writer is not None:
+        writer.close()
+        yield sink.getvalue()
+
+
+WRITERS = {"ndjson": _ndjson, "csv": _csv, "arrow": _arrow}
+
+
+def prepare(name, fmt="ndjson", columns=None, start_date=None, end_date=None):
+    """
+    Validates an export request and returns the generator of its body.
+
+    Args:
+        name (str): A key of EXPORTS.
+        fmt (str): "ndjson", "csv" or "arrow".
+        columns (list): Optional. Columns to include, in order. All by default.
+        start_date (str): Optional. First date, YYYY-MM-DD, inclusive.
+        end_date (str): Optional. Last date, YYYY-MM-DD, inclusive.
+
+    Returns:
+        generator: Yields the body in chunks of bytes.
+
+    Raises:
+        KeyError: If the export is unknown.
+        ValueError: If the format or a column is unknown, or pyarrow is
+            missing for Arrow.
+    """
+    export = EXPORTS[name]
+    if fmt not in WRITERS:
+        raise ValueError(f"Unknown format {fmt}; use one of {', '.join(WRITERS)}")
+    if fmt == "arrow":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ValueError("Arrow exports need the pyarrow package")
+
+    frame = datasets.load(export.dataset)
+    columns = list(columns or frame.columns)
+    unknown = [c for c in columns if c not in frame.columns]
+    if unknown:
+        raise ValueError(f"Unknown columns {', '.join(unknown)}")
+
+    positions = _row_positions(frame, export.date_column, start_date, end_date)
+    column_positions = [frame.columns.get_loc(c) for c in columns]
+
+    def chunks():
+        if len(positions) == 0:
+            yield frame.iloc[:0, column_positions].copy()
+        for i in range(0, len(positions), CHUNK_ROWS):
+            yield frame.iloc[positions[i:i + CHUNK_ROWS], column_positions].copy()
+
+    return WRITERS[fmt](chunks())
+
+
+def filename(name, fmt):
+    """Download filename of an export."""
+    return f"{name}.{EXTENSIONS[fmt]}"
@@ -0,0 +1,339 @@
+"""
+Figure serialization for widget responses.
+
+Figures can be serialized in two encodings:
+
+- "text": every array is spelled out as JSON numbers and ISO date strings.
+  Every Plotly.js version understands this.
+- "binary": numeric arrays are emitted as Plotly typed-array specs
+  (``{"dtype": ..., "bdata": ...}``) and date arrays as epoch-millisecond
+  typed arrays on ``type: "date"`` axes. Requires Plotly.js >= 2.28.
+
+The encoding is selected with the FIGURE_ENCODING environment variable:
+
+- "text" (default): always use the text encoding.
+- "auto": use the binary encoding for clients that send the
+  ``X-Plotly-Typed-Arrays: 1`` request header, text for everyone else.
+- "binary": always use the binary encoding.
+"""
+
+import base64
+import contextvars
+import datetime
+import json
+import math
+import os
+import re
+
+from fastapi.responses import Response
+from starlette.datastructures import Headers
+
+from lazy_imports import lazy_module
+
+np = lazy_module("numpy")
+
+ENCODING_MODE = os.environ.get("FIGURE_ENCODING", "text").lower()
+
+TYPED_ARRAYS_HEADER = "x-plotly-typed-arrays"
+
+# Whether the client of the current request accepts typed arrays. Set per
+# request by TypedArraysMiddleware.
+_client_typed_arrays = contextvars.ContextVar(
+    "client_typed_arrays", default=False
+)
+
+_ISO_DATE = re.compile(r"^\d{4}-\d{2}-\d{2}([ T]\d{2}:\d{2}(:\d{2}(\.\d+)?)?)?$")
+
+# Trace attributes that hold dates on a date axis
+_AXIS_KEYS = {"x": "xaxis", "y": "yaxis"}
+
+
+def client_accepts_typed_arrays(headers):
+    """
+    Returns True if the request headers announce typed-array support.
+
+    Parameters:
+        headers (Mapping): The request headers.
+    """
+    value = headers.get(TYPED_ARRAYS_HEADER, "").strip().lower()
+    return value in ("1", "true", "yes")
+
+
+def set_client_typed_arrays(headers):
+    """
+    Records whether the client of the current request supports typed arrays.
+
+    Parameters:
+        headers (Mapping): The request headers.
+
+    Returns:
+        contextvars.Token: Token that can be used to reset the value.
+    """
+    return _client_typed_arrays.set(client_accepts_typed_arrays(headers))
+
+
+class TypedArraysMiddleware:
+    """
+    ASGI middleware that records, per request, whether the client accepts
+    typed arrays, for figure_response().
+
+    A plain ASGI middleware rather than @app.middleware("http"), which would
+    route every response, cache hits included, through an extra task and
+    memory stream.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            set_client_typed_arrays(Headers(scope=scope))
+        await self.app(scope, receive, send)
+
+
+def use_binary_encoding():
+    """Returns True if the current response should use typed arrays."""
+    if ENCODING_MODE == "binary":
+        return True
+    if ENCODING_MODE == "auto":
+        return _client_typed_arrays.get()
+    return False
+
+
+def _narrow_float(arr):
+    """
+    Returns the smallest lossless representation of a float array.
+
+    Integral values that fit in 32 bits become i4 and values that survive a
+    round trip through float32 become f4; everything else stays f8.
+    """
+    if arr.size == 0:
+        return arr.astype("f8")
+    finite = np.isfinite(arr)
+    if finite.all():
+        info = np.iinfo("i4")
+        if (
+            arr.min() >= info.min and arr.max() <= info.max
+            and np.array_equal(arr, np.trunc(arr))
+        ):
+            return arr.astype("i4")
+    narrow = arr.astype("f4")
+    if np.array_equal(narrow, arr, equal_nan=True):
+        return narrow
+    return arr.astype("f8")
+
+
+def _typed_array_spec(arr):
+    """Encodes a numeric numpy array as a Plotly typed-array spec."""
+    if arr.dtype.kind == "b":
+        arr = arr.astype("u1")
+    elif arr.dtype.kind in "iu" and arr.dtype.itemsize == 8:
+        # Plotly.js has no 64-bit integer arrays
+        info = np.iinfo("i4")
+        if arr.size == 0 or (arr.min() >= info.min and arr.max() <= info.max):
+            arr = arr.astype("i4")
+        else:
+            arr = arr.astype("f8")
+    elif arr.dtype.kind == "f":
+        arr = _narrow_float(arr)
+
+    arr = np.ascontiguousarray(arr, dtype=arr.dtype.newbyteorder("<"))
+    spec = {
+        "dtype": arr.dtype.str[1:],
+        "bdata": base64.b64encode(arr.tobytes()).decode("ascii"),
+    }
+    if arr.ndim > 1:
+        spec["shape"] = ",".join(str(n) for n in arr.shape)
+    return spec
+
+
+def _decode_typed_array(spec):
+    """Decodes a Plotly typed-array spec back into a numpy array."""
+    arr = np.frombuffer(base64.b64decode(spec["bdata"]), dtype=spec["dtype"])
+    shape = spec.get("shape")
+    if shape:
+        if isinstance(shape, str):
+            shape = [int(n) for n in shape.split(",")]
+        arr = arr.reshape(shape)
+    return arr
+
+
+def _epoch_ms(arr):
+    """Converts a datetime64 array to float epoch milliseconds (NaT -> NaN)."""
+    ms = arr.astype("datetime64[ms]")
+    out = ms.astype("int64").astype("f8")
+    out[np.isnat(ms)] = np.nan
+    return out
+
+
+def _parse_date_strings(arr):
+    """Parses an object array of ISO date strings, or returns None."""
+    if arr.size == 0:
+        return None
+    first = arr[0]
+    if not isinstance(first, str) or not _ISO_DATE.match(first):
+        return None
+    try:
+        return np.asarray(arr, dtype="datetime64[ms]")
+    except (ValueError, TypeError):
+        return None
+
+
+def _scalar(value):
+    """Converts a scalar to a JSON-serializable Python value."""
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float):
+        return None if math.isnan(value) or math.isinf(value) else value
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    return value
+
+
+def _array_to_list(arr):
+    """Converts a numpy array to a JSON-serializable list."""
+    kind = arr.dtype.kind
+    if kind == "M":
+        # Plain dates when every value falls on midnight
+        days = arr.astype("datetime64[D]")
+        unit = "D" if np.array_equal(days, arr, equal_nan=True) else "s"
+        out = np.datetime_as_string(arr, unit=unit).astype(object)
+        out[np.isnat(arr)] = None
+        return out.tolist()
+    if kind == "f":
+        out = arr.astype(object)
+        out[~np.isfinite(arr)] = None
+        return out.tolist()
+    if kind in "iub":
+        return arr.tolist()
+    return [_encode(v, False, None) for v in arr.tolist()]
+
+
+def _encode(value, binary, date_keys, key=None):
+    """
+    Recursively converts a figure value to JSON-serializable objects.
+
+    date_keys collects the trace attributes ("x"/"y") that were emitted as
+    epoch-millisecond arrays, so their axes can be marked as date axes.
+    """
+    if isinstance(value, dict):
+        if "bdata" in value and "dtype" in value:
+            arr = _decode_typed_array(value)
+            if binary:
+                return _typed_array_spec(arr)
+            return _array_to_list(arr)
+        return {
+            k: _encode(v, binary, date_keys, k)
+            for k, v in value.items()
+        }
+    if isinstance(value, (list, tuple)):
+        if binary and key in _AXIS_KEYS and value:
+            return _encode(np.asarray(value, dtype=object), binary, date_keys, key)
+        return [_encode(v, binary, date_keys) for v in value]
+    if isinstance(value, np.ndarray):
+        if not binary:
+            return _array_to_list(value)
+        kind = value.dtype.kind
+        if kind == "O" and key in _AXIS_KEYS:
+            parsed = _parse_date_strings(value)
+            if parsed is not None:
+                value, kind = parsed, "M"
+        if kind == "M":
+            if date_keys is not None and key in _AXIS_KEYS:
+                date_keys.add(key)
+                return _typed_array_spec(_epoch_ms(value))
+            return _array_to_list(value)
+        if kind in "fiub":
+            return _typed_array_spec(value)
+        return _array_to_list(value)
+    return _scalar(value)
+
+
+def _axis_name(trace, key):
+    """Returns the layout axis name ('xaxis', 'xaxis2', ...) of a trace."""
+    ref = trace.get(_AXIS_KEYS[key][0] + "axis") or key
+    return _AXIS_KEYS[key] + ref[1:]
+
+
+def figure_to_dict(fig, binary=None):
+    """
+    Converts a Plotly figure to a JSON-serializable dictionary.
+
+    Parameters:
+        fig (plotly.graph_objects.Figure): The figure to convert.
+        binary (bool): Optional. Use the typed-array encoding. Defaults to
+            the encoding negotiated for the current request.
+
+    Returns:
+        dict: The figure as plain Python objects.
+    """
+    if binary is None:
+        binary = use_binary_encoding()
+
+    spec = fig.to_plotly_json()
+
+    data = []
+    date_axes = set()
+    for trace in spec.get("data", []):
+        date_keys = set()
+        data.append(_encode(trace, binary, date_keys))
+        for key in date_keys:
+            date_axes.add(_axis_name(trace, key))
+
+    layout = _encode(spec.get("layout", {}), binary, None)
+    for axis in date_axes:
+        layout.setdefault(axis, {}).setdefault("type", "date")
+
+    return {"data": data, "layout": layout}
+
+
+def encode_figure(fig, binary=None):
+    """
+    Serializes a Plotly figure to compact JSON bytes.
+
+    Parameters:
+        fig (plotly.graph_objects.Figure): The figure to serialize.
+        binary (bool): Optional. Use the typed-array encoding. Defaults to
+            the encoding negotiated for the current request.
+
+    Returns:
+        bytes: The UTF-8 encoded JSON document.
+    """
+    return json.dumps(
+        figure_to_dict(fig, binary),
+        separators=(",", ":"),
+        allow_nan=False,
+    ).encode("utf-8")
+
+
+def encoded_response(body):
+    """
+    Builds the HTTP response for an already encoded figure.
+
+    Parameters:
+        body (bytes): Output of encode_figure().
+
+    Returns:
+        fastapi.responses.Response: JSON response with the encoded figure.
+    """
+    headers = {}
+    if ENCODING_MODE == "auto":
+        headers["Vary"] = "X-Plotly-Typed-Arrays"
+    return Response(
+        content=body,
+        media_type="application/json",
+        headers=headers,
+    )
+
+
+def figure_response(fig):
+    """
+    Builds the HTTP response for a Plotly figure.
+
+    Parameters:
+        fig (plotly.graph_objects.Figure): The figure to return.
+
+    Returns:
+        fastapi.responses.Response: JSON response with the encoded figure.
+    """
+    return encoded_response(encode_figure(fig))
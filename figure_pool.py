@@ -0,0 +1,141 @@
+"""
+Process pool for CPU-heavy figure construction.
+
+Building large figures is pure pandas/Plotly work that holds the GIL, so
+concurrent requests handled on threads effectively run one at a time. With
+FIGURE_WORKERS set above 0, the builders in figures.py run in a pool of
+warm worker processes instead, and a multi-core machine can build that many
+figures at once.
+
+Workers do not receive DataFrames with each call. Each call carries the
+builder name, the path of a file per snapshot and the parameters, and
+returns the encoded figure bytes. The files are those datasets.py shares
+between processes on one host (see datasets.snapshot_file()), written
+once per version; workers map a file the first time they see that version,
+so its numeric and date columns are not copied, and keep it until a newer
+version arrives. A file replaced before a worker mapped it is built here.
+
+With FIGURE_WORKERS=0 (the default) figures are built in the web process.
+"""
+
+import atexit
+import concurrent.futures
+import multiprocessing
+import os
+import threading
+
+import datasets
+import figures
+import snapshot_files
+from figure_encoding import encode_figure, encoded_response, use_binary_encoding
+
+FIGURE_WORKERS = int(os.environ.get("FIGURE_WORKERS", "0"))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+# Frames mapped by this worker process: name -> (version, frame)
+_worker_frames = {}
+
+
+def _worker_init():
+    # Build one figure so Plotly's validators are loaded before the first call
+    figures.go.Figure().to_plotly_json()
+
+
+def _worker_frame(name, version, path):
+    cached = _worker_frames.get(name)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    frame = snapshot_files.read(path)
+    _worker_frames[name] = (version, frame)
+    return frame
+
+
+def _worker_render(builder, refs, binary, kwargs):
+    frames = {arg: _worker_frame(*ref) for arg, ref in refs.items()}
+    fig = getattr(figures, builder)(**frames, **kwargs)
+    return encode_figure(fig, binary)
+
+
+def _get_pool():
+    global _pool
+    if FIGURE_WORKERS <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = concurrent.futures.ProcessPoolExecutor(
+                max_workers=FIGURE_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_worker_init,
+            )
+        return _pool
+
+
+def _reset_pool(pool):
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False)
+
+
+def start():
+    """Starts the worker processes ahead of the first request, if enabled."""
+    pool = _get_pool()
+    if pool is not None:
+        for _ in range(FIGURE_WORKERS):
+            pool.submit(_worker_init)
+
+
+def stop():
+    """Stops the worker processes and removes the snapshot files only they used."""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=True, cancel_futures=True)
+    datasets.remove_snapshot_files()
+
+
+def render(builder, inputs, **kwargs):
+    """
+    Builds and encodes a figure, in a worker process if the pool is enabled.
+
+    Parameters:
+        builder (str): Name of a builder function in figures.py.
+        inputs (dict): Builder argument name -> datasets.Snapshot (or any
+            object with name, version and frame attributes).
+        **kwargs: The remaining builder arguments.
+
+    Returns:
+        bytes: The encoded figure.
+    """
+    binary = use_binary_encoding()
+    pool = _get_pool()
+
+    if pool is not None:
+        try:
+            refs = {
+                arg: (snapshot.name, snapshot.version, datasets.snapshot_file(snapshot))
+                for arg, snapshot in inputs.items()
+            }
+            return pool.submit(_worker_render, builder, refs, binary, kwargs).result()
+        except FileNotFoundError:
+            # A newer version replaced a file before the worker mapped it
+            pass
+        except concurrent.futures.process.BrokenProcessPool:
+            # A worker died; build this figure here and start a fresh pool
+            _reset_pool(pool)
+
+    frames = {arg: snapshot.frame for arg, snapshot in inputs.items()}
+    fig = getattr(figures, builder)(**frames, **kwargs)
+    return encode_figure(fig, binary)
+
+
+def render_response(builder, inputs, **kwargs):
+    """Like render(), but returns the HTTP response."""
+    return encoded_response(render(builder, inputs, **kwargs))
+
+
+atexit.register(stop)
@@ -0,0 +1,222 @@
+"""
+Theme-independent figure segments.
+
+Every chart endpoint takes a theme, but the theme only changes layout values
+set by plotly_config (create_base_layout and apply_config_to_figure); the
+traces are identical. An encoded figure, {"data":[...],"layout":{...}}, is
+therefore split into:
+
+- a TraceSegment: the head {"data":[...] with its gzip deflate stream,
+  shared by every theme, and
+- a layout tail ,"layout":{...}} per theme, which retheme() derives from the
+  layout of any other theme without rebuilding the figure.
+
+A SplicedResponse joins one segment and one tail when it is served. Its
+gzip variant is spliced too: the head is deflated once, ending with a full
+flush, the tail is deflated on its own, and the gzip header and trailer are
+recomputed (the CRC of the tail continues the CRC of the head). Brotli
+streams cannot be joined this way, so spliced responses are sent gzip or
+identity encoded.
+"""
+
+import collections.abc
+import functools
+import hashlib
+import json
+import struct
+import time
+import zlib
+
+from lazy_imports import lazy_module
+from plotly_config import create_base_layout, get_layout_update
+
+go = lazy_module("plotly.graph_objects")
+
+THEMES = ("dark", "light")
+
+_HEAD = b'{"data":'
+_LAYOUT = b',"layout":'
+
+_decoder = json.JSONDecoder()
+
+# gzip member header: deflate, no flags, mtime 0, unknown OS
+_GZIP_HEADER = b"\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\xff"
+
+
+def split(body):
+    """
+    Splits an encoded figure into its data and layout JSON.
+
+    Parameters:
+        body (bytes): Output of figure_encoding.encode_figure().
+
+    Returns:
+        tuple: (data, layout) bytes, or None if body is not a figure.
+    """
+    if not body.startswith(_HEAD) or not body.endswith(b"}"):
+        return None
+    # "layout" also appears inside layout.template, so find where the data
+    # array ends instead of searching for the key
+    text = body.decode("utf-8")
+    try:
+        _, end = _decoder.raw_decode(text, len(_HEAD))
+    except ValueError:
+        return None
+    if not text.startswith(_LAYOUT.decode(), end):
+        return None
+    end = len(text[:end].encode("utf-8"))
+    return body[len(_HEAD):end], body[end + len(_LAYOUT):-1]
+
+
+def _deflate(data, final):
+    compressor = zlib.compressobj(9, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush(
+        zlib.Z_FINISH if final else zlib.Z_FULL_FLUSH
+    )
+
+
+def _leaves(layout, prefix=()):
+    for key, value in layout.items():
+        if isinstance(value, dict):
+            yield from _leaves(value, prefix + (key,))
+        else:
+            yield prefix + (key,), value
+
+
+@functools.lru_cache(maxsize=None)
+def _theme_leaves(theme):
+    layout = go.Layout(create_base_layout("x", "y", theme=theme))
+    layout.update(get_layout_update(theme))
+    return dict(_leaves(layout.to_plotly_json()))
+
+
+@functools.lru_cache(maxsize=None)
+def theme_values(theme):
+    """
+    Returns the layout values that differ between themes.
+
+    Parameters:
+        theme (str): "light" or "dark"; anything else is dark, as in
+            plotly_config.
+
+    Returns:
+        dict: Layout path (tuple of keys) -> value for theme.
+    """
+    leaves = {t: _theme_leaves(t) for t in THEMES}
+    own = _theme_leaves("light" if theme == "light" else "dark")
+    paths = {
+        path
+        for path in own
+        if len({json.dumps(leaves[t].get(path)) for t in THEMES}) > 1
+    }
+    return {path: own[path] for path in paths}
+
+
+def retheme(layout, theme):
+    """
+    Rewrites the themed values of an encoded layout.
+
+    Parameters:
+        layout (bytes): The layout JSON, rendered for any theme.
+        theme (str): The theme to render.
+
+    Returns:
+        bytes: The layout JSON for theme.
+    """
+    spec = json.loads(layout)
+    for path, value in theme_values(theme).items():
+        node = spec
+        for key in path[:-1]:
+            node = node.setdefault(key, {})
+        node[path[-1]] = value
+    return json.dumps(spec, separators=(",", ":"), allow_nan=False).encode("utf-8")
+
+
+class TraceSegment:
+    """
+    The theme-independent head of an encoded figure.
+
+    Also keeps the layout it was rendered with, to retheme from, and the
+    response headers and version of the data it was built from.
+    """
+
+    def __init__(self, data, layout, version=None, headers=None,
+                 media_type="application/json"):
+        self.layout = layout
+        self.version = version
+        self.headers = dict(headers or {})
+        self.media_type = media_type
+        self.created = time.time()
+
+        head = _HEAD + data
+        self.head = head
+        self.head_deflate = _deflate(head, final=False)
+        self.head_crc = zlib.crc32(head)
+        self.digest = hashlib.sha256(head).digest()
+
+    def has_data(self, data):
+        """Whether the segment holds exactly this data JSON."""
+        return memoryview(self.head)[len(_HEAD):] == data
+
+    @property
+    def size(self):
+        """Total number of bytes held for this segment."""
+        return len(self.head) + len(self.head_deflate) + len(self.layout)
+
+
+class _Variants(collections.abc.Mapping):
+    """Encoded variants of a SplicedResponse, assembled on access."""
+
+    def __init__(self, spliced):
+        self._spliced = spliced
+
+    def __getitem__(self, coding):
+        spliced = self._spliced
+        segment = spliced.segment
+        if coding == "identity":
+            return segment.head + spliced.tail
+        if coding == "gzip":
+            crc = zlib.crc32(spliced.tail, segment.head_crc)
+            length = (len(segment.head) + len(spliced.tail)) & 0xFFFFFFFF
+            return b"".join([
+                _GZIP_HEADER,
+                segment.head_deflate,
+                spliced.tail_deflate,
+                struct.pack("<II", crc, length),
+            ])
+        raise KeyError(coding)
+
+    def __iter__(self):
+        return iter(("identity", "gzip"))
+
+    def __len__(self):
+        return 2
+
+
+class SplicedResponse:
+    """
+    A figure response assembled from a shared TraceSegment and its own
+    layout. Served like a response_store.StoredResponse.
+    """
+
+    def __init__(self, segment, layout):
+        self.segment = segment
+        self.media_type = segment.media_type
+        self.headers = segment.headers
+        self.version = segment.version
+        # As old as the traces it serves
+        self.created = segment.created
+
+        self.tail = _LAYOUT + layout + b"}"
+        self.tail_deflate = _deflate(self.tail, final=True)
+        self.etag = '"' + hashlib.sha256(segment.digest + self.tail).hexdigest()[:32] + '"'
+        self.variants = _Variants(self)
+
+    @property
+    def size(self):
+        """
+        Bytes held for this response, not counting the shared segment:
+        evicting the segment drops the responses using it (see
+        widget_cache.py).
+        """
+        return len(self.tail) + len(self.tail_deflate)
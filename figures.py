@@ -0,0 +1,163 @@
+"""
+Figure builders for the CPU-heavy chart endpoints.
+
+Each builder takes the DataFrames it plots plus the endpoint's parameters and
+returns a configured Plotly figure. They do not load data themselves, so
+they can run either in the web process or in a figure_pool worker that reads
+the frames from a shared snapshot file.
+"""
+
+from plotly_config import create_base_layout, apply_config_to_figure
+from mts_panel import MONTH_NAMES
+from lazy_imports import lazy_module
+import _fed_balance_sheet
+
+go = lazy_module("plotly.graph_objects")
+
+
+def fed_balance_sheet(df, start_date, item, theme):
+    """
+    Federal Reserve balance sheet components over time.
+
+    Parameters:
+        df (pd.DataFrame): The fed_balance_sheet dataset.
+        start_date (str): Only dates after this one are shown.
+        item (str): "all", "assets" or "liabilities".
+        theme (str): "light" or "dark".
+
+    Returns:
+        plotly.graph_objects.Figure: The configured figure.
+    """
+    # Filter by date
+    df = df[df['date'] > start_date]
+
+    # Create the figure
+    fig = go.Figure()
+
+    # Determine which columns to display based on item selection
+    columns_to_display = []
+    if item == "assets":
+        columns_to_display = list(_fed_balance_sheet.assets.keys())
+    elif item == "liabilities":
+        columns_to_display = list(_fed_balance_sheet.liabilities.keys())
+    else:  # "all" or any other value
+        columns_to_display = list(_fed_balance_sheet.all_items.keys())
+
+    # Add traces for each component
+    for column in df.columns[1:]:
+        # Skip if column not in selected items
+        if column not in columns_to_display:
+            continue
+
+        if column in _fed_balance_sheet.assets:
+            name = f'A: {column} - {_fed_balance_sheet.all_items[column]}'
+        elif column in _fed_balance_sheet.liabilities:
+            name = f'L: {column} - {_fed_balance_sheet.all_items[column]}'
+        else:
+            name = f'{column} - {_fed_balance_sheet.all_items[column]}'
+
+        fig.add_trace(
+            go.Bar(
+                x=df['date'],
+                y=df[column],
+                name=name,
+                hovertemplate='<b>'+name+'</b><br>Date: %{x}<br>Value: %{y}<extra></extra>'
+            )
+        )
+
+    # Set the layout
+    fig.update_layout(
+        create_base_layout(
+            x_title="Date",
+            y_title="Amount (Millions)",
+            theme=theme
+        ),
+        barmode='relative',
+        xaxis_tickangle=-45
+    )
+
+    # Apply theme configuration
+    return apply_config_to_figure(fig, theme)
+
+
+def mts_income_taxes_monthly_by_year(by_month, year, theme):
+    """
+    Monthly individual income tax receipts, one line per calendar year.
+
+    Parameters:
+        by_month (pd.DataFrame): mts_panel month x year matrix.
+        year (int): First calendar year to show.
+        theme (str): "light" or "dark".
+
+    Returns:
+        plotly.graph_objects.Figure: The configured figure.
+    """
+    fig = go.Figure()
+
+    # One line per calendar year from the selected year on
+    for year_val in by_month.columns[by_month.columns >= int(year)]:
+        fig.add_trace(
+            go.Scatter(
+                x=MONTH_NAMES,
+                y=by_month[year_val].to_numpy(),
+                name=str(year_val),
+                mode='lines'
+            )
+        )
+
+    fig.update_layout(
+        create_base_layout(
+            x_title="Month",
+            y_title="Amount",
+            theme=theme
+        ),
+        xaxis_tickangle=-45
+    )
+
+    return apply_config_to_figure(fig, theme)
+
+
+def fed_net_liquidity_all(df, start_date, theme):
+    """
+    Every net liquidity component on one chart.
+
+    Parameters:
+        df (pd.DataFrame): The fed_net_liquidity dataset.
+        start_date (str): Only dates after this one are shown.
+        theme (str): "light" or "dark".
+
+    Returns:
+        plotly.graph_objects.Figure: The configured figure.
+    """
+    # Filter by date
+    df = df[df['date'] > start_date]
+
+    # Create figure
+    fig = go.Figure()
+
+    # Add all metrics as separate traces
+    components = ["NL", "WALCL", "RRP", "TGA", "REM"]
+    colors = ["#00ff00", "#00a7ff", "#00a7ff", "#ff69b4", "#ff0000"]
+    for component, color in zip(components, colors):
+        fig.add_trace(
+            go.Scatter(
+                x=df['date'],
+                y=df[component],
+                mode='lines',
+                name=component,
+                line=dict(color=color)
+            )
+        )
+
+    # Set the layout
+    fig.update_layout(
+        create_base_layout(
+            x_title="Date",
+            y_title="Amount (Billions)",
+            theme=theme
+        ),
+        xaxis_tickangle=-45
+    )
+
+    # Apply theme configuration
+    return apply_config_to_figure(fig, theme)
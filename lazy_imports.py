@@ -0,0 +1,108 @@
+"""
+Deferred imports of heavy modules.
+
+pandas, numpy, Plotly and the upstream data packages take most of the time
+it takes to import main.py, yet /widgets.json and /templates.json need none
+of them. With LAZY_IMPORTS=1 the modules below import them with
+lazy_module(), which returns a stand-in that imports the real module the
+first time one of its attributes is used, that is, in the first request
+that needs it. With LAZY_IMPORTS unset or 0 the modules are imported right
+away, as before.
+
+    pd = lazy_module("pandas")      # nothing is imported yet
+    pd.DataFrame(...)               # pandas is imported here
+
+report() lists the deferred modules, whether they have been imported and how
+long their import took; /debug/imports serves it.
+"""
+
+import importlib
+import os
+import sys
+import threading
+import time
+
+LAZY_IMPORTS = os.environ.get("LAZY_IMPORTS", "0") == "1"
+
+# Deferred module name -> stand-in
+DEFERRED = {}
+
+# Deferred module name -> (seconds its import took, thread that imported it)
+IMPORT_TIMES = {}
+_lock = threading.Lock()
+
+
+class LazyModule:
+    """Stand-in for a module that is imported on first attribute access."""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def _load(self):
+        module = self._module
+        if module is None:
+            already_imported = self._name in sys.modules
+            start = time.perf_counter()
+            module = importlib.import_module(self._name)
+            elapsed = time.perf_counter() - start
+            with _lock:
+                if self._name not in IMPORT_TIMES:
+                    IMPORT_TIMES[self._name] = (
+                        0.0 if already_imported else elapsed,
+                        threading.current_thread().name,
+                    )
+            # Later lookups find the module's attributes without __getattr__
+            name = self._name
+            self.__dict__.update(module.__dict__)
+            self.__dict__.update(_name=name, _module=module)
+        return module
+
+    def __getattr__(self, attr):
+        if attr in ("_name", "_module"):
+            raise AttributeError(attr)
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module {self._name!r} ({state})>"
+
+
+def lazy_module(name):
+    """
+    Returns a module, deferring its import when LAZY_IMPORTS is on.
+
+    Args:
+        name (str): Absolute module name, e.g. "plotly.graph_objects".
+
+    Returns:
+        module or LazyModule: The module, or a stand-in that imports it on
+        first use.
+    """
+    if not LAZY_IMPORTS:
+        return importlib.import_module(name)
+    with _lock:
+        module = DEFERRED.get(name)
+        if module is None:
+            module = DEFERRED[name] = LazyModule(name)
+    return module
+
+
+def report():
+    """
+    Returns the deferred modules and their import times.
+
+    Returns:
+        dict: Whether lazy imports are on, and one entry per deferred module
+        with "loaded", "seconds" and "thread" (None until imported).
+    """
+    with _lock:
+        modules = {}
+        for name in sorted(DEFERRED):
+            seconds, thread = IMPORT_TIMES.get(name, (None, None))
+            modules[name] = {
+                "loaded": name in IMPORT_TIMES,
+                "seconds": None if seconds is None else round(seconds, 4),
+                "thread": thread,
+            }
+    return {"lazy_imports": LAZY_IMPORTS, "modules": modules}
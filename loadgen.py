@@ -0,0 +1,408 @@
+"""
+Load generator that replays OpenBB workspace sessions.
+
+Each virtual user behaves like a workspace tab:
+
+1. Opens the workspace: GET /widgets.json and /templates.json, then every
+   widget of a template with its default parameters.
+2. Then, after a think time, repeatedly either changes one parameter of a
+   widget on the open template (a value from the parameter's options, or a
+   shifted date) or toggles the theme and reloads every widget.
+
+Unless --url is given, the server is launched with uvicorn from a directory
+of offline stand-ins (see standins.py), so no network access is needed. The
+report covers throughput, latency percentiles and error rates per endpoint,
+and the server's RSS (including figure workers) sampled every second.
+
+    python loadgen.py --users 20 --duration 60 --think 2
+
+Compare configurations head to head; each runs against a fresh server with
+the same seed and the given environment variables:
+
+    python loadgen.py --users 20 --duration 60 \\
+        --config baseline: --config pool:FIGURE_WORKERS=2,LAZY_IMPORTS=1
+"""
+
+import argparse
+import datetime
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+THEMES = ("dark", "light")
+
+
+class Sample:
+    """One request made by a virtual user."""
+
+    def __init__(self, at, endpoint, status, latency, size):
+        self.at = at
+        self.endpoint = endpoint
+        self.status = status  # HTTP status, or 0 if the request failed
+        self.latency = latency
+        self.size = size
+
+
+class Workspace:
+    """Widgets and templates as served by the backend."""
+
+    def __init__(self, widgets, templates):
+        self.widgets = widgets
+        self.templates = templates
+
+    def template_widgets(self, template):
+        ids = []
+        for tab in template.get("tabs", {}).values():
+            for item in tab.get("layout", []):
+                if item["i"] in self.widgets and item["i"] not in ids:
+                    ids.append(item["i"])
+        return ids or list(self.widgets)
+
+    @staticmethod
+    def default_params(widget):
+        return {p["paramName"]: p["value"] for p in widget.get("params", [])}
+
+    @staticmethod
+    def vary_param(rng, param):
+        """Picks a new value for a widget parameter, as a user would."""
+        if param.get("options"):
+            return rng.choice(param["options"])["value"]
+        if param.get("type") == "date":
+            try:
+                default = datetime.date.fromisoformat(str(param["value"]))
+            except ValueError:
+                return param["value"]
+            return (default - datetime.timedelta(days=rng.randint(0, 3 * 365))).isoformat()
+        if param.get("type") == "number" and isinstance(param["value"], (int, float)):
+            return type(param["value"])(param["value"] * rng.uniform(0.5, 2))
+        return param["value"]
+
+
+class User(threading.Thread):
+    """A virtual user replaying one workspace session until the deadline."""
+
+    def __init__(self, index, base_url, workspace, samples, started, deadline, think, seed):
+        super().__init__(daemon=True, name=f"user-{index}")
+        self.base_url = base_url
+        self.workspace = workspace
+        self.samples = samples
+        self.started = started
+        self.deadline = deadline
+        self.think = think
+        self.rng = random.Random(seed + index)
+        self.session = requests.Session()
+        self.theme = self.rng.choice(THEMES)
+        self.params = {}
+
+    def get(self, path, endpoint, params=None):
+        start = time.perf_counter()
+        try:
+            response = self.session.get(self.base_url + path, params=params, timeout=120)
+            status, size = response.status_code, len(response.content)
+        except requests.RequestException:
+            status, size = 0, 0
+        end = time.perf_counter()
+        self.samples.append(Sample(end - self.started, endpoint, status, end - start, size))
+
+    def load_widget(self, endpoint):
+        self.get("/" + endpoint, endpoint, {**self.params[endpoint], "theme": self.theme})
+
+    def pause(self):
+        if self.think > 0:
+            time.sleep(min(self.rng.expovariate(1 / self.think), 10 * self.think))
+
+    def run(self):
+        # Open the workspace
+        self.get("/widgets.json", "widgets.json")
+        self.get("/templates.json", "templates.json")
+        template = self.rng.choice(self.workspace.templates) if self.workspace.templates else {}
+        endpoints = self.workspace.template_widgets(template)
+        for endpoint in endpoints:
+            self.params[endpoint] = self.workspace.default_params(self.workspace.widgets[endpoint])
+            self.load_widget(endpoint)
+
+        while time.perf_counter() < self.deadline:
+            self.pause()
+            if time.perf_counter() >= self.deadline:
+                break
+            if self.rng.random() < 0.2:
+                # Theme toggle reloads every widget
+                self.theme = THEMES[1 - THEMES.index(self.theme)]
+                for endpoint in endpoints:
+                    self.load_widget(endpoint)
+            else:
+                endpoint = self.rng.choice(endpoints)
+                params = self.workspace.widgets[endpoint].get("params", [])
+                if params:
+                    param = self.rng.choice(params)
+                    self.params[endpoint][param["paramName"]] = self.workspace.vary_param(self.rng, param)
+                self.load_widget(endpoint)
+
+
+def _children(pid):
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [int(child) for child in f.read().split()]
+    except OSError:
+        return []
+
+
+def rss_bytes(pid):
+    """Resident memory of a process and its descendants, from /proc (Linux)."""
+    total = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f"/proc/{current}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1]) * 1024
+                        break
+        except OSError:
+            continue
+        pending.extend(_children(current))
+    return total
+
+
+class RssSampler(threading.Thread):
+    def __init__(self, pid, started, interval=1.0):
+        super().__init__(daemon=True, name="rss-sampler")
+        self.pid = pid
+        self.started = started
+        self.interval = interval
+        self.samples = []
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.is_set():
+            self.samples.append((time.perf_counter() - self.started, rss_bytes(self.pid)))
+            self.stopped.wait(self.interval)
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class Server:
+    """A uvicorn server launched from a stand-in data directory."""
+
+    def __init__(self, data_dir, env=None, root=ROOT):
+        self.port = _free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        server_env = {**os.environ, **(env or {})}
+        server_env["PYTHONPATH"] = os.pathsep.join(
+            p for p in [root, os.environ.get("PYTHONPATH")] if p
+        )
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app",
+             "--host", "127.0.0.1", "--port", str(self.port), "--log-level", "warning"],
+            cwd=data_dir,
+            env=server_env,
+            stdout=subprocess.DEVNULL,
+        )
+        self.pid = self.process.pid
+
+    def wait_ready(self, timeout=120):
+        deadline = time.perf_counter() + timeout
+        while time.perf_counter() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"server exited with code {self.process.returncode}")
+            try:
+                requests.get(self.url + "/widgets.json", timeout=5).raise_for_status()
+                return
+            except requests.RequestException:
+                time.sleep(0.05)
+        raise RuntimeError("server did not start")
+
+    def stop(self):
+        self.process.terminate()
+        self.process.wait()
+
+
+def percentile(values, q):
+    """Nearest-rank percentile of a sorted list."""
+    if not values:
+        return None
+    return values[min(len(values) - 1, max(0, int(round(q / 100 * len(values))) - 1))]
+
+
+def summarize(samples, elapsed):
+    """Throughput, latency percentiles and error rates of a set of samples."""
+    latencies = sorted(s.latency for s in samples)
+    errors = sum(1 for s in samples if s.status == 0 or s.status >= 400)
+    shed = sum(1 for s in samples if s.status == 503)
+    return {
+        "requests": len(samples),
+        "rps": len(samples) / elapsed if elapsed else 0.0,
+        "errors": errors,
+        "error_rate": errors / len(samples) if samples else 0.0,
+        "shed": shed,
+        "p50": percentile(latencies, 50),
+        "p90": percentile(latencies, 90),
+        "p99": percentile(latencies, 99),
+        "max": latencies[-1] if latencies else None,
+        "bytes": sum(s.size for s in samples),
+    }
+
+
+def run_load(base_url, users, duration, think, ramp, warmup, seed, pid=None):
+    """
+    Runs one load test against a server.
+
+    Returns:
+        dict: Overall and per-endpoint summaries and the RSS samples.
+    """
+    widgets = requests.get(base_url + "/widgets.json", timeout=60).json()
+    templates = requests.get(base_url + "/templates.json", timeout=60).json()
+    workspace = Workspace(widgets, templates)
+
+    # Fetch dynamic options once, as the workspace does when it opens a widget
+    for widget in widgets.values():
+        for param in widget.get("params", []):
+            if param.get("optionsEndpoint") and not param.get("options"):
+                response = requests.get(base_url + param["optionsEndpoint"], timeout=60)
+                if response.ok:
+                    param["options"] = response.json()
+
+    samples = []
+    started = time.perf_counter()
+    deadline = started + duration
+    sampler = RssSampler(pid, started) if pid else None
+    if sampler:
+        sampler.start()
+
+    threads = []
+    for i in range(users):
+        user = User(i, base_url, workspace, samples, started, deadline, think, seed)
+        threads.append(user)
+        user.start()
+        if ramp and users > 1:
+            time.sleep(ramp / (users - 1))
+    for user in threads:
+        user.join()
+
+    if sampler:
+        sampler.stopped.set()
+        sampler.join()
+
+    measured = [s for s in samples if s.at >= warmup]
+    elapsed = max(time.perf_counter() - started - warmup, 1e-9)
+    endpoints = sorted({s.endpoint for s in measured})
+    return {
+        "overall": summarize(measured, elapsed),
+        "endpoints": {
+            endpoint: summarize([s for s in measured if s.endpoint == endpoint], elapsed)
+            for endpoint in endpoints
+        },
+        "rss": sampler.samples if sampler else [],
+    }
+
+
+def _ms(seconds):
+    return "-" if seconds is None else f"{seconds * 1000:.0f}"
+
+
+def print_report(name, result):
+    overall = result["overall"]
+    print(f"\n== {name} ==")
+    print(
+        f"{overall['requests']} requests, {overall['rps']:.1f} req/s, "
+        f"{overall['error_rate']:.1%} errors ({overall['shed']} shed with 503), "
+        f"p50 {_ms(overall['p50'])} ms, p90 {_ms(overall['p90'])} ms, "
+        f"p99 {_ms(overall['p99'])} ms"
+    )
+
+    print(f"\n{'endpoint':40} {'req':>6} {'err%':>6} {'p50':>7} {'p90':>7} {'p99':>7} {'max':>7}")
+    for endpoint, s in result["endpoints"].items():
+        print(
+            f"{endpoint:40} {s['requests']:6} {s['error_rate'] * 100:6.1f} "
+            f"{_ms(s['p50']):>7} {_ms(s['p90']):>7} {_ms(s['p99']):>7} {_ms(s['max']):>7}"
+        )
+
+    if result["rss"]:
+        print("\nRSS over time (MB):")
+        step = max(1, len(result["rss"]) // 20)
+        for at, rss in result["rss"][::step]:
+            print(f"  {at:6.0f}s {rss / 2**20:8.1f}")
+        print(f"  peak    {max(rss for _, rss in result['rss']) / 2**20:8.1f}")
+
+
+def print_comparison(results):
+    print(f"\n== comparison ==")
+    print(f"{'config':20} {'req/s':>8} {'err%':>6} {'shed':>6} {'p50':>7} {'p90':>7} {'p99':>7} {'peak MB':>8}")
+    for name, result in results.items():
+        o = result["overall"]
+        peak = max((rss for _, rss in result["rss"]), default=0) / 2**20
+        print(
+            f"{name:20} {o['rps']:8.1f} {o['error_rate'] * 100:6.1f} {o['shed']:6} "
+            f"{_ms(o['p50']):>7} {_ms(o['p90']):>7} {_ms(o['p99']):>7} {peak:8.1f}"
+        )
+
+
+def parse_config(text):
+    """Parses NAME:VAR=VALUE,VAR=VALUE into (name, env)."""
+    name, _, assignments = text.partition(":")
+    env = {}
+    for assignment in filter(None, assignments.split(",")):
+        key, _, value = assignment.partition("=")
+        env[key.strip()] = value.strip()
+    return name, env
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay OpenBB workspace sessions against the backend")
+    parser.add_argument("--users", type=int, default=10, help="concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=60, help="seconds to run each test")
+    parser.add_argument("--think", type=float, default=2.0, help="mean think time between actions, seconds")
+    parser.add_argument("--ramp", type=float, default=5.0, help="seconds over which users start")
+    parser.add_argument("--warmup", type=float, default=0.0, help="seconds of samples to leave out of the report")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--url", help="target a running server instead of launching one")
+    parser.add_argument("--pid", type=int, help="with --url, the server process to sample RSS from")
+    parser.add_argument("--data", help="stand-in data directory (default: generated in a temp directory)")
+    parser.add_argument("--config", action="append", default=[], metavar="NAME:VAR=VALUE,...",
+                        help="server configuration to test; repeat to compare")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    load_args = (args.users, args.duration, args.think, args.ramp, args.warmup, args.seed)
+    results = {}
+
+    if args.url:
+        results["server"] = run_load(args.url.rstrip("/"), *load_args, pid=args.pid)
+    else:
+        data_dir = args.data
+        if data_dir is None:
+            import standins
+            data_dir = tempfile.mkdtemp(prefix="openbb-standins-")
+            standins.write_standins(data_dir, seed=args.seed)
+
+        for name, env in [parse_config(c) for c in args.config] or [("default", {})]:
+            server = Server(data_dir, env)
+            try:
+                server.wait_ready()
+                results[name] = run_load(server.url, *load_args, pid=server.pid)
+            finally:
+                server.stop()
+
+    for name, result in results.items():
+        print_report(name, result)
+    if len(results) > 1:
+        print_comparison(results)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
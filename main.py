@@ -1,33 +1,42 @@
+import asyncio
+import hmac
+import inspect
 import json
 from pathlib import Path
-import pandas as pd
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from pydantic import BaseModel
+from starlette.concurrency import run_in_threadpool
+from typing import Any, Dict, List
 from plotly_config import create_base_layout, apply_config_to_figure
-from registry import WIDGETS, register_widget
-import treasury_gov_pandas.datasets.deposits_withdrawals_operating_cash.load
-import treasury_gov_pandas.datasets.mts.mts_table_4.load
-import fed_net_liquidity
+from figure_encoding import TypedArraysMiddleware, client_accepts_typed_arrays, figure_response
+from response_store import RESPONSE_STORE, ResponseStore, serve
+import admission
+import artifacts
+import cache_backends
+import cache_registry
+import batch
+import figure_pool
+from registry import WIDGETS, WIDGET_BUDGETS, WIDGET_INPUTS, Budget, OPTION_PROVIDERS, options_endpoint, register_options, register_widget
+import datasets
+import metrics
+import mts_panel
+import dts_cube
+import events
+import exports
+import overlays
+import profiler
+import widget_cache
 import _fed_balance_sheet
+import lazy_imports
+from lazy_imports import lazy_module
 import datetime
 
-# Get available dates from FRED data
-df = _fed_balance_sheet.load_diff_dataframe()
-if df is not None and not df.empty:
-    df['date'] = pd.to_datetime(df['date'])
-    df = df.set_index('date').diff().reset_index()
-    available_dates = sorted(
-        df['date'].dt.strftime('%Y-%m-%d').unique(),
-        reverse=True
-    )
-else:
-    available_dates = []
-
-# Create options list for the widget
-date_options = [{"label": date, "value": date} for date in available_dates]
+np = lazy_module("numpy")
+pd = lazy_module("pandas")
+go = lazy_module("plotly.graph_objects")
+plotly_subplots = lazy_module("plotly.subplots")
 
 app = FastAPI()
 
@@ -35,6 +44,11 @@ origins = [
     "https://pro.openbb.co",
 ]
 
+# Added before CORS so that 503 rejections still carry CORS headers
+app.add_middleware(admission.AdmissionMiddleware)
+# Outside the admission gates, so cached widget responses are served at once
+app.add_middleware(widget_cache.WidgetCacheMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
@@ -43,6 +57,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Let figure_response() know whether this client accepts typed arrays
+app.add_middleware(TypedArraysMiddleware)
+
 ROOT_PATH = Path(__file__).parent.resolve()
 
 
@@ -51,14 +68,316 @@ def read_root():
     return {"Info": "Full example for OpenBB Custom Backend"}
 
 
+@app.get("/debug/admission")
+def get_admission_stats():
+    """Concurrency, queue depth and rejection counters of every endpoint."""
+    return admission.stats()
+
+
+@app.get("/debug/caches")
+def get_cache_stats():
+    """
+    Memory budget and the hit rates, sizes and ages of every cache, and the
+    counters of the shared cache backend.
+    """
+    return {**cache_registry.stats(), "backend": cache_backends.stats()}
+
+
+@app.get("/debug/artifacts")
+def get_artifact_graph():
+    """Datasets and derived artifacts, their inputs, dependents and versions."""
+    consumers = {f"/{endpoint}": inputs for endpoint, inputs in WIDGET_INPUTS.items()}
+    for name, provider in OPTION_PROVIDERS.items():
+        consumers[provider.endpoint] = provider.inputs
+    return artifacts.report(consumers)
+
+
+@app.get("/debug/budgets")
+def get_budget_report():
+    """Performance budget of every widget, what its recent builds measured, and the limits exceeded."""
+    measured = widget_cache.build_stats()
+    report = {}
+    for endpoint, budget in WIDGET_BUDGETS.items():
+        values = measured.get(endpoint, {})
+        report[endpoint] = {
+            "budget": budget.limits(),
+            "measured": values,
+            "exceeded": budget.exceeded(values),
+        }
+    return report
+
+
+@app.get("/debug/events")
+def get_event_stats():
+    """Subscribers of /events and the last version announced per endpoint."""
+    return events.stats()
+
+
+@app.get("/debug/imports")
+def get_import_report():
+    """Deferred heavy modules and how long each took to import."""
+    return lazy_imports.report()
+
+
+def _route_handlers():
+    """Code object of every route handler -> its path, to tag profiles by."""
+    handlers = {}
+    for route in app.routes:
+        endpoint = getattr(route, "endpoint", None)
+        if endpoint is not None and endpoint is not get_profile:
+            handlers[inspect.unwrap(endpoint).__code__] = route.path
+    return handlers
+
+
+@app.get("/debug/profile")
+async def get_profile(
+    request: Request,
+    seconds: float = 10,
+    interval_ms: float = 5,
+    format: str = "collapsed",
+    scope: str = "handlers",
+    endpoint: str = None
+):
+    """
+    Sample the server's threads for a few seconds and return the stacks.
+
+    Disabled unless PROFILER_TOKEN is set; the token must be sent in the
+    X-Profiler-Token header.
+
+    Args:
+        seconds (float): How long to sample, at most PROFILER_MAX_SECONDS.
+        interval_ms (float): Milliseconds between samples.
+        format (str): "collapsed" stacks, or "speedscope" JSON.
+        scope (str): "handlers" for request handlers only, or "all" threads.
+        endpoint (str): Optional. Only keep the stacks of this path,
+            e.g. "/fed-balance-sheet".
+    """
+    if profiler.TOKEN is None:
+        return JSONResponse(
+            content={"error": "Profiling is disabled; set PROFILER_TOKEN to enable it"},
+            status_code=404
+        )
+    token = request.headers.get("x-profiler-token", "")
+    if not hmac.compare_digest(token.encode(), profiler.TOKEN.encode()):
+        return JSONResponse(
+            content={"error": "Missing or wrong X-Profiler-Token"},
+            status_code=403
+        )
+    if not 0 < seconds <= profiler.MAX_SECONDS or not 1 <= interval_ms <= 1000:
+        return JSONResponse(
+            content={"error": f"Use 0 < seconds <= {profiler.MAX_SECONDS:g} and 1 <= interval_ms <= 1000"},
+            status_code=400
+        )
+    if format not in ("collapsed", "speedscope") or scope not in profiler.SCOPES:
+        return JSONResponse(
+            content={"error": "Use format collapsed or speedscope, and scope handlers or all"},
+            status_code=400
+        )
+
+    try:
+        # Sample from a thread of its own, so the event loop keeps serving
+        profile = await asyncio.to_thread(
+            profiler.sample, seconds, interval_ms / 1000, _route_handlers(), scope
+        )
+    except RuntimeError as e:
+        return JSONResponse(
+            content={"error": str(e)},
+            status_code=409
+        )
+
+    try:
+        if endpoint:
+            profile = profile.only("/" + endpoint.strip("/"))
+        headers = {
+            "X-Profile-Ticks": str(profile.ticks),
+            "X-Profile-Seconds": f"{profile.elapsed:.3f}",
+        }
+        if format == "speedscope":
+            return JSONResponse(content=profiler.speedscope(profile), headers=headers)
+        return PlainTextResponse(profiler.collapsed(profile), headers=headers)
+
+    except Exception as e:
+        return JSONResponse(
+            content={"error": str(e)},
+            status_code=500
+        )
+
+
 @app.get("/widgets.json")
-async def get_widgets():
-    return WIDGETS
+async def get_widgets(request: Request):
+    return RESPONSE_STORE.respond("widgets.json", request)
 
 @app.get("/templates.json")
-async def get_templates():
-    with open("templates.json", "r") as f:
-        return json.load(f)
+async def get_templates(request: Request):
+    return RESPONSE_STORE.respond("templates.json", request)
+
+
+# Option lists served by /options/<name>, keyed by (name, version of inputs)
+OPTIONS_STORE = ResponseStore("options", evictable=True)
+
+
+@datasets.on_change
+def drop_stale_options(names):
+    """Drop the option lists computed from reloaded datasets."""
+    stale = artifacts.affected(names)
+    OPTIONS_STORE.discard(
+        lambda key: not stale.isdisjoint(OPTION_PROVIDERS[key[0]].inputs)
+    )
+
+
+@app.get("/events")
+async def get_events(endpoints: str = None):
+    """
+    Server-sent events announcing which widget endpoints have new data.
+
+    Args:
+        endpoints (str): Optional. Comma-separated endpoints to announce,
+            e.g. "fed-net-liquidity,options/h41-weeks". All by default.
+    """
+    selected = None
+    if endpoints:
+        selected = frozenset("/" + e.strip().strip("/") for e in endpoints.split(",") if e.strip())
+        unknown = selected - set(events.endpoints())
+        if unknown:
+            return JSONResponse(
+                content={"error": f"Unknown endpoints {', '.join(sorted(unknown))}"},
+                status_code=404
+            )
+
+    return StreamingResponse(
+        events.stream(selected),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def _store_options(key, provider):
+    body = json.dumps(provider.func(), separators=(",", ":")).encode()
+    return OPTIONS_STORE.put(key, body)
+
+
+@app.get("/options/{name}")
+async def get_options(name: str, request: Request):
+    """
+    Serve the options of a dynamic provider, cached per version of its inputs.
+
+    Hits are answered on the event loop; only computing a missing list runs
+    in a worker thread.
+    """
+    provider = OPTION_PROVIDERS.get(name)
+    if provider is None:
+        return JSONResponse(
+            content={"error": f"Unknown options {name}"},
+            status_code=404
+        )
+
+    try:
+        key = (name, await artifacts.aversion_of(provider.inputs))
+        stored = OPTIONS_STORE.get(key)
+        if stored is None:
+            stored = await run_in_threadpool(_store_options, key, provider)
+        return serve(stored, request)
+
+    except Exception as e:
+        return JSONResponse(
+            content={"error": str(e)},
+            status_code=500
+        )
+
+
+@register_options("h41-weeks", inputs=["fed_balance_sheet_changes"])
+def h41_week_options():
+    """H.4.1 week dates, newest first."""
+    # Get available dates from FRED data
+    df = datasets.load("fed_balance_sheet_changes")
+    if df is not None and not df.empty:
+        available_dates = sorted(
+            df['date'].dt.strftime('%Y-%m-%d').unique(),
+            reverse=True
+        )
+    else:
+        available_dates = []
+
+    return [{"label": date, "value": date} for date in available_dates]
+
+
+@register_options("mts-years", inputs=["mts_by_month"])
+def mts_year_options():
+    """Calendar years with MTS income tax receipts, oldest first."""
+    by_month = artifacts.get("mts_by_month")
+    return [{"label": str(year), "value": int(year)} for year in by_month.columns]
+
+
+@app.get("/export/{name}")
+def get_export(
+    name: str,
+    format: str = "ndjson",
+    columns: str = None,
+    start_date: str = None,
+    end_date: str = None
+):
+    """
+    Stream a full-history dataset as NDJSON, CSV or Arrow IPC, optionally
+    limited to some columns (comma-separated) and a date range.
+    """
+    if name not in exports.EXPORTS:
+        return JSONResponse(
+            content={"error": f"Unknown export {name}"},
+            status_code=404
+        )
+
+    try:
+        body = exports.prepare(
+            name,
+            format,
+            columns=columns.split(",") if columns else None,
+            start_date=start_date,
+            end_date=end_date,
+        )
+    except ValueError as e:
+        return JSONResponse(
+            content={"error": str(e)},
+            status_code=400
+        )
+    except Exception as e:
+        return JSONResponse(
+            content={"error": str(e)},
+            status_code=500
+        )
+
+    return StreamingResponse(
+        body,
+        media_type=exports.MEDIA_TYPES[format],
+        headers={
+            "Content-Disposition": f'attachment; filename="{exports.filename(name, format)}"'
+        },
+    )
+
+
+class BatchItem(BaseModel):
+    endpoint: str
+    params: Dict[str, Any] = {}
+
+
+@app.post("/batch")
+def post_batch(request: Request, items: List[BatchItem], stream: bool = False):
+    """
+    Build several widgets in one round-trip, e.g. every widget of a template
+    tab. With stream=true, results are sent as NDJSON lines as they complete.
+    """
+    if len(items) > batch.MAX_ITEMS:
+        return JSONResponse(
+            content={"error": f"A batch may have at most {batch.MAX_ITEMS} items"},
+            status_code=400
+        )
+    items = [{"endpoint": item.endpoint, "params": item.params} for item in items]
+    typed = client_accepts_typed_arrays(request.headers)
+    if stream:
+        return StreamingResponse(
+            batch.stream_batch(items, typed),
+            media_type="application/x-ndjson"
+        )
+    return Response(content=batch.run_batch(items, typed), media_type="application/json")
 
 @app.get("/transactions")
 @register_widget({
@@ -103,7 +422,7 @@ async def get_templates():
             "type": "number"
         }
     ],
-})
+}, inputs=["dts_deposits_withdrawals"], budget=Budget(p95_ms=400, max_bytes=100_000, max_memory=32 * 2**20))
 def get_transactions(
     theme: str = "dark",
     metric: str = "transaction_fytd_amt",
@@ -125,7 +444,7 @@ def get_transactions(
 
         # Load the dataframe
         try:
-            df = treasury_gov_pandas.datasets.deposits_withdrawals_operating_cash.load.load()
+            df = datasets.load("dts_deposits_withdrawals")
         except ImportError:
             return JSONResponse(
                 content={
@@ -139,31 +458,11 @@ def get_transactions(
                 status_code=500
             )
 
-        # Convert numeric columns
-        numeric_cols = [
-            'transaction_today_amt',
-            'transaction_mtd_amt',
-            'transaction_fytd_amt'
-        ]
-        for col in numeric_cols:
-            df[col] = pd.to_numeric(df[col], errors='coerce')
-
         # Filter out unwanted categories
-        exclude_categories = [
-            "null",
-            "Sub-Total Withdrawals",
-            "Sub-Total Deposits",
-            "Transfers from Depositaries",
-            "Transfers from Federal Reserve Account (Table V)",
-            "Transfers to Depositaries",
-            "Transfers to Federal Reserve Account (Table V)",
-            "ShTransfersCtohFederalmReserve Account (Table V)"
-        ]
-        for cat in exclude_categories:
-            df = df.query(f'transaction_catg != "{cat}"')
+        df = df[~df['transaction_catg'].isin(dts_cube.EXCLUDE_CATEGORIES)]
 
         # Filter for specific date
-        df = df.query(f'record_date == "{date}"')
+        df = df[df['record_date'] == pd.Timestamp(date)]
         
         # Check if data exists for the given date
         if df.empty:
@@ -217,7 +516,164 @@ def get_transactions(
         # Apply theme configuration
         fig = apply_config_to_figure(fig, theme)
 
-        return json.loads(fig.to_json())
+        return figure_response(fig)
+
+    except Exception as e:
+        return JSONResponse(
+            content={"error": str(e)},
+            status_code=500
+        )
+
+
+def current_fiscal_year_start():
+    """First day of the current federal fiscal year (October 1)."""
+    today = datetime.date.today()
+    year = today.year if today.month >= 10 else today.year - 1
+    return datetime.date(year, 10, 1).strftime("%Y-%m-%d")
+
+
+@app.get("/transactions-range")
+@register_widget({
+    "name": "Transactions by Category - Date Range",
+    "description": (
+        "Shows total deposits and withdrawals by category over a date range "
+        "or fiscal year"
+    ),
+    "category": "Treasury",
+    "type": "chart",
+    "endpoint": "transactions-range",
+    "gridData": {"w": 40, "h": 15},
+    "source": "U.S. Treasury",
+    "data": {"chart": {"type": "bar"}},
+    "params": [
+        {
+            "paramName": "start_date",
+            "value": current_fiscal_year_start(),
+            "label": "Start Date",
+            "show": True,
+            "description": "First date of the range",
+            "type": "date"
+        },
+        {
+            "paramName": "end_date",
+            "value": datetime.date.today().strftime("%Y-%m-%d"),
+            "label": "End Date",
+            "show": True,
+            "description": "Last date of the range",
+            "type": "date"
+        },
+        {
+            "paramName": "fiscal_year",
+            "value": "",
+            "label": "Fiscal Year",
+            "show": True,
+            "description": "Fiscal year to sum (overrides the date range)",
+            "type": "text"
+        },
+        {
+            "paramName": "transaction_type",
+            "value": "all",
+            "label": "Type",
+            "show": True,
+            "description": "Deposits, withdrawals or both",
+            "type": "text",
+            "options": [
+                {"label": "All", "value": "all"},
+                {"label": "Deposits", "value": "Deposits"},
+                {"label": "Withdrawals", "value": "Withdrawals"}
+            ]
+        },
+        {
+            "paramName": "min_amount",
+            "value": 100000,
+            "label": "Minimum Amount",
+            "show": True,
+            "description": "Minimum total amount to display",
+            "type": "number"
+        }
+    ],
+}, inputs=["dts_cube"], budget=Budget(p95_ms=300, max_bytes=100_000, max_memory=32 * 2**20))
+def get_transactions_range(
+    theme: str = "dark",
+    start_date: str = None,
+    end_date: str = None,
+    fiscal_year: str = "",
+    transaction_type: str = "all",
+    min_amount: int = 100000
+):
+    """Get transaction totals by category over a date range and return as Plotly figure."""
+    try:
+        # A fiscal year runs from October 1 to September 30
+        if fiscal_year:
+            try:
+                fy = int(fiscal_year)
+            except ValueError:
+                return JSONResponse(
+                    content={"error": "Invalid fiscal year."},
+                    status_code=400
+                )
+            start_date = f"{fy - 1}-10-01"
+            end_date = f"{fy}-09-30"
+
+        start_date = start_date or current_fiscal_year_start()
+        end_date = end_date or datetime.date.today().strftime("%Y-%m-%d")
+
+        # Validate date format
+        try:
+            datetime.datetime.strptime(start_date, "%Y-%m-%d")
+            datetime.datetime.strptime(end_date, "%Y-%m-%d")
+        except ValueError:
+            return JSONResponse(
+                content={
+                    "error": "Invalid date format. Please use YYYY-MM-DD format."
+                },
+                status_code=400
+            )
+
+        # Two row lookups in the prefix-sum cube per category
+        df = dts_cube.range_totals(start_date, end_date)
+
+        if transaction_type != "all":
+            df = df[df['transaction_type'] == transaction_type]
+
+        df = df[df['amount'].abs() > min_amount]
+
+        if df.empty:
+            return JSONResponse(
+                content={
+                    "error": f"No transactions found above minimum amount {min_amount}"
+                },
+                status_code=404
+            )
+
+        # Sort by amount (from negative to positive)
+        df = df.sort_values('amount', ascending=True)
+
+        # Create the figure
+        fig = go.Figure()
+        fig.add_trace(go.Bar(
+            x=df['transaction_type'].str[0] + ": " + df['transaction_catg'],
+            y=df['amount'],
+            text=[f"${x:,.2f}" for x in df['amount']],
+            textposition='auto',
+            marker_color=np.where(df['amount'] < 0, 'red', 'green')
+        ))
+
+        # Set the layout
+        fig.update_layout(
+            create_base_layout(
+                x_title="Transaction Category",
+                y_title="Total Amount",
+                theme=theme
+            ),
+            xaxis_tickangle=-45,
+            showlegend=False
+        )
+
+        # Apply theme configuration
+        fig = apply_config_to_figure(fig, theme)
+
+        return figure_response(fig)
 
     except Exception as e:
         return JSONResponse(
@@ -257,11 +713,15 @@ def get_transactions(
                 {"label": "WALCL", "value": "WALCL"},
                 {"label": "RRP", "value": "RRP"},
                 {"label": "TGA", "value": "TGA"},
-                {"label": "REM", "value": "REM"}
+                {"label": "REM", "value": "REM"},
+                *[
+                    {"label": m.label, "value": name}
+                    for name, m in metrics.METRICS.items()
+                ]
             ]
         }
     ],
-})
+}, inputs=["fed_net_liquidity"], budget=Budget(p95_ms=400, max_bytes=250_000, max_memory=32 * 2**20))
 def get_fed_net_liquidity(
     start_date: str = "2023-01-01",
     metric: str = "NL",
@@ -270,13 +730,22 @@ def get_fed_net_liquidity(
     """Get Federal Reserve Net Liquidity data and return as Plotly figure."""
     try:
         # Load the dataframe
-        df = fed_net_liquidity.load_dataframe()
+        df = datasets.load("fed_net_liquidity")
+
+        # Derived metrics are computed once per dataset version
+        if metric not in df.columns:
+            if metric not in metrics.METRICS:
+                return JSONResponse(
+                    content={"error": f"Unknown metric {metric}"},
+                    status_code=400
+                )
+            df = metrics.evaluate(metric)
 
         # Filter by date
         df = df[df['date'] > start_date]
 
         # Create subplots with 2 rows
-        fig = make_subplots(
+        fig = plotly_subplots.make_subplots(
             rows=2, 
             cols=1,
             shared_xaxes=True,
@@ -337,7 +806,7 @@ def get_fed_net_liquidity(
         # Apply theme configuration
         fig = apply_config_to_figure(fig, theme)
 
-        return json.loads(fig.to_json())
+        return figure_response(fig)
 
     except Exception as e:
         return JSONResponse(
@@ -365,51 +834,20 @@ def get_fed_net_liquidity(
             "type": "date"
         }
     ],
-})
-def get_fed_net_liquidity(
+}, inputs=["fed_net_liquidity"], budget=Budget(p95_ms=400, max_bytes=500_000, max_memory=32 * 2**20))
+def get_fed_net_liquidity_all(
     start_date: str = "2023-01-01",
     theme: str = "dark"
 ):
     """Get Federal Reserve Net Liquidity data and return as Plotly figure."""
     try:
-        # Load the dataframe
-        df = fed_net_liquidity.load_dataframe()
-
-        # Filter by date
-        df = df[df['date'] > start_date]
-
-        # Create figure
-        fig = go.Figure()
-
-        # Add all metrics as separate traces
-        metrics = ["NL", "WALCL", "RRP", "TGA", "REM"]
-        colors = ["#00ff00", "#00a7ff", "#00a7ff", "#ff69b4", "#ff0000"]
-        for metric, color in zip(metrics, colors):
-            fig.add_trace(
-                go.Scatter(
-                    x=df['date'],
-                    y=df[metric],
-                    mode='lines',
-                    name=metric,
-                    line=dict(color=color)
-                )
-            )
-
-        # Set the layout
-        fig.update_layout(
-            create_base_layout(
-                x_title="Date",
-                y_title="Amount (Billions)",
-                theme=theme
-            ),
-            xaxis_tickangle=-45
+        return figure_pool.render_response(
+            "fed_net_liquidity_all",
+            {"df": datasets.get("fed_net_liquidity")},
+            start_date=start_date,
+            theme=theme,
         )
 
-        # Apply theme configuration
-        fig = apply_config_to_figure(fig, theme)
-
-        return json.loads(fig.to_json())
-
     except Exception as e:
         return JSONResponse(
             content={"error": str(e)},
@@ -472,14 +910,14 @@ def get_fed_net_liquidity(
             "type": "date"
         }
     ],
-})
+}, inputs=["fed_net_liquidity"], budget=Budget(p95_ms=200, max_bytes=500_000, max_memory=32 * 2**20))
 def get_fed_net_liquidity_data(
     start_date: str = "2023-01-01"
 ):
     """Get Federal Reserve Net Liquidity data and return as a dataframe."""
     try:
         # Load the dataframe
-        df = fed_net_liquidity.load_dataframe()
+        df = datasets.load("fed_net_liquidity")
 
         # Filter by date
         df = df[df['date'] > start_date]
@@ -494,6 +932,8 @@ def get_fed_net_liquidity_data(
             'NL_diff': 'NL Change'
         })
 
+        df['date'] = df['date'].dt.strftime('%Y-%m-%d')
+
         # Format numbers in billions
         def format_billions(x):
             return round(x / 1_000_000_000, 2)
@@ -552,7 +992,7 @@ def get_fed_net_liquidity_data(
             }
         }
     ],
-})
+}, inputs=["fed_balance_sheet"], budget=Budget(p95_ms=600, max_bytes=1_500_000, max_memory=64 * 2**20))
 def get_fed_balance_sheet(
     start_date: str = "2005-01-01",
     item: str = "all",
@@ -560,62 +1000,14 @@ def get_fed_balance_sheet(
 ):
     """Get Federal Reserve balance sheet data and return as Plotly figure."""
     try:
-        # Load the dataframe
-        df = _fed_balance_sheet.load_dataframe()
-
-        # Filter by date
-        df = df[df['date'] > start_date]
-
-        # Create the figure
-        fig = go.Figure()
-
-        # Determine which columns to display based on item selection
-        columns_to_display = []
-        if item == "assets":
-            columns_to_display = list(_fed_balance_sheet.assets.keys())
-        elif item == "liabilities":
-            columns_to_display = list(_fed_balance_sheet.liabilities.keys())
-        else:  # "all" or any other value
-            columns_to_display = list(_fed_balance_sheet.all_items.keys())
-
-        # Add traces for each component
-        for column in df.columns[1:]:
-            # Skip if column not in selected items
-            if column not in columns_to_display:
-                continue
-
-            if column in _fed_balance_sheet.assets:
-                name = f'A: {column} - {_fed_balance_sheet.all_items[column]}'
-            elif column in _fed_balance_sheet.liabilities:
-                name = f'L: {column} - {_fed_balance_sheet.all_items[column]}'
-            else:
-                name = f'{column} - {_fed_balance_sheet.all_items[column]}'
-
-            fig.add_trace(
-                go.Bar(
-                    x=df['date'],
-                    y=df[column],
-                    name=name,
-                    hovertemplate='<b>'+name+'</b><br>Date: %{x}<br>Value: %{y}<extra></extra>'
-                )
-            )
-
-        # Set the layout
-        fig.update_layout(
-            create_base_layout(
-                x_title="Date",
-                y_title="Amount (Millions)",
-                theme=theme
-            ),
-            barmode='relative',
-            xaxis_tickangle=-45
+        return figure_pool.render_response(
+            "fed_balance_sheet",
+            {"df": datasets.get("fed_balance_sheet")},
+            start_date=start_date,
+            item=item,
+            theme=theme,
         )
 
-        # Apply theme configuration
-        fig = apply_config_to_figure(fig, theme)
-
-        return json.loads(fig.to_json())
-
     except Exception as e:
         return JSONResponse(
             content={"error": str(e)},
@@ -637,34 +1029,24 @@ def get_fed_balance_sheet(
     "params": [
         {
             "paramName": "start_date_week",
-            "value": "2025-03-26",
+            # Wednesday of last week, the latest H.4.1 week surely published
+            "value": (datetime.date.today() - datetime.timedelta(days=(datetime.date.today().weekday() - 2) % 7 + 7)).strftime("%Y-%m-%d"),
             "label": "Week Start Date",
             "show": True,
             "description": "Select week to view changes",
             "type": "text",
-            "options": date_options
+            "optionsEndpoint": options_endpoint("h41-weeks")
         }
     ],
-})
+}, inputs=["fed_balance_sheet_changes"], budget=Budget(p95_ms=300, max_bytes=100_000, max_memory=32 * 2**20))
 def get_fed_balance_sheet_weekly(
     start_date_week: str = None,
     theme: str = "dark"
 ):
     """Get Federal Reserve balance sheet weekly changes and return as Plotly figure."""
     try:
-        # Load the dataframe
-        df = _fed_balance_sheet.load_diff_dataframe()
-
-        # Convert date column to datetime if it's not already
-        if not pd.api.types.is_datetime64_any_dtype(df['date']):
-            df['date'] = pd.to_datetime(df['date'])
-
-        # Get last year of data
-        one_year_ago = datetime.datetime.now() - datetime.timedelta(days=365)
-        df = df[df['date'] > one_year_ago]
-
-        # Calculate weekly changes
-        df = df.set_index('date').diff().reset_index()
+        # Load the weekly changes
+        df = datasets.load("fed_balance_sheet_changes")
 
         # Check if start_date_week is provided
         if start_date_week is None:
@@ -676,7 +1058,7 @@ def get_fed_balance_sheet_weekly(
         # Convert start_date_week to datetime for comparison
         start_date_dt = datetime.datetime.strptime(start_date_week, "%Y-%m-%d")
 
-        # Get data for selected week
+        # Get data for selected week, any of those /options/h41-weeks lists
         week_data = df[df['date'].dt.date == start_date_dt.date()]
         
         # Check if week_data is empty
@@ -727,7 +1109,7 @@ def get_fed_balance_sheet_weekly(
         # Apply theme configuration
         fig = apply_config_to_figure(fig, theme)
 
-        return json.loads(fig.to_json())
+        return figure_response(fig)
 
     except Exception as e:
         return JSONResponse(
@@ -753,56 +1135,30 @@ def get_fed_balance_sheet_weekly(
             "show": True,
             "description": "Select year to display",
             "type": "text",
-            "options": [
-                {"label": str(year), "value": year}
-                for year in range(
-                    datetime.datetime.now().year - 10,
-                    datetime.datetime.now().year + 1
-                )
-            ]
+            "optionsEndpoint": options_endpoint("mts-years")
         }
     ],
-})
+}, inputs=["mts_by_month"], budget=Budget(p95_ms=300, max_bytes=100_000, max_memory=32 * 2**20))
 def get_mts_income_taxes_monthly(
     year: int = datetime.datetime.now().year-10,
     theme: str = "dark"
 ):
     """Get MTS Income Tax monthly data and return as Plotly figure."""
     try:
-        df = treasury_gov_pandas.datasets.mts.mts_table_4.load.load()
-        df['record_date'] = pd.to_datetime(df['record_date'])
-        df['current_month_net_rcpt_amt'] = pd.to_numeric(
-            df['current_month_net_rcpt_amt'], errors='coerce'
-        )
+        by_month = artifacts.get("mts_by_month")
 
-        df = df.query('classification_desc == "Total -- Individual Income Taxes"')
+        fig = go.Figure()
 
-        # Filter for selected year and previous years
-        df = df[
-            (df['record_calendar_year'].astype(int) >= int(year) - 1) &
-            (df['record_calendar_year'].astype(int) <= int(year))
-        ]
+        # Add a trace for the selected year and the previous year
+        for year_val in (int(year) - 1, int(year)):
+            if year_val not in by_month.columns:
+                continue
+            year_data = by_month[year_val].dropna()
 
-        fig = go.Figure()
-        
-        # Add a trace for each year
-        month_names = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 
-                      'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
-        
-        for year_val in sorted(df['record_calendar_year'].unique()):
-            year_data = df[df['record_calendar_year'] == year_val]
-            # Create a mapping from month number to month name
-            year_data = year_data.copy()  # Create a copy to avoid SettingWithCopyWarning
-            year_data['month_name'] = year_data['record_calendar_month'].map(
-                lambda x: month_names[int(x)-1]
-            )
-            # Sort by original month number to maintain chronological order
-            year_data = year_data.sort_values('record_calendar_month')
-            
             fig.add_trace(
                 go.Bar(
-                    x=year_data['month_name'],
-                    y=year_data['current_month_net_rcpt_amt'],
+                    x=[mts_panel.MONTH_NAMES[m - 1] for m in year_data.index],
+                    y=year_data.to_numpy(),
                     name=str(year_val),
                     hovertemplate='<b>%{fullData.name}</b><br>Month: %{x}<br>Amount: $%{y:,.2f}<extra></extra>'
                 )
@@ -819,7 +1175,7 @@ def get_mts_income_taxes_monthly(
         )
 
         fig = apply_config_to_figure(fig, theme)
-        return json.loads(fig.to_json())
+        return figure_response(fig)
 
     except Exception as e:
         return JSONResponse(
@@ -846,79 +1202,25 @@ def get_mts_income_taxes_monthly(
             "show": True,
             "description": "Select year to display",
             "type": "text",
-            "options": [
-                {"label": str(year), "value": year}
-                for year in range(
-                    datetime.datetime.now().year - 10,
-                    datetime.datetime.now().year + 1
-                )
-            ]
+            "optionsEndpoint": options_endpoint("mts-years")
         }
     ],
-})
+}, inputs=["mts_by_month"], budget=Budget(p95_ms=300, max_bytes=100_000, max_memory=32 * 2**20))
 def get_mts_income_taxes_monthly_by_year(
     year: int = datetime.datetime.now().year-10,
     theme: str = "dark"
 ):
     """Get MTS Income Tax monthly data by year and return as Plotly figure."""
     try:
-        # Convert year to start date
-        start_date = datetime.datetime(year, 1, 1)
-        
-        df = treasury_gov_pandas.datasets.mts.mts_table_4.load.load()
-        df['record_date'] = pd.to_datetime(df['record_date'])
-        df['current_month_net_rcpt_amt'] = pd.to_numeric(
-            df['current_month_net_rcpt_amt'], errors='coerce'
-        )
-
-        df = df.query('classification_desc == "Total -- Individual Income Taxes"')
-        df = df[df['record_date'] > start_date]
-
-        pivot = df.pivot_table(
-            values='current_month_net_rcpt_amt',
-            index='record_calendar_month',
-            columns='record_calendar_year'
-        )
-        melted = pivot.reset_index().melt(
-            id_vars='record_calendar_month',
-            value_name='current_month_net_rcpt_amt'
-        )
-
-        fig = go.Figure()
-        month_names = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 
-                      'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
-        
-        for year in melted['record_calendar_year'].unique():
-            year_data = melted[melted['record_calendar_year'] == year]
-            # Create a mapping from month number to month name
-            year_data = year_data.copy()  # Create a copy to avoid SettingWithCopyWarning
-            year_data['month_name'] = year_data['record_calendar_month'].map(
-                lambda x: month_names[int(x)-1]
-            )
-            # Sort by original month number to maintain chronological order
-            year_data = year_data.sort_values('record_calendar_month')
-            
-            fig.add_trace(
-                go.Scatter(
-                    x=year_data['month_name'],
-                    y=year_data['current_month_net_rcpt_amt'],
-                    name=str(year),
-                    mode='lines'
-                )
-            )
+        by_month = artifacts.get_snapshot("mts_by_month")
 
-        fig.update_layout(
-            create_base_layout(
-                x_title="Month",
-                y_title="Amount",
-                theme=theme
-            ),
-            xaxis_tickangle=-45
+        return figure_pool.render_response(
+            "mts_income_taxes_monthly_by_year",
+            {"by_month": by_month},
+            year=int(year),
+            theme=theme,
         )
 
-        fig = apply_config_to_figure(fig, theme)
-        return json.loads(fig.to_json())
-
     except Exception as e:
         return JSONResponse(
             content={"error": str(e)},
@@ -946,31 +1248,20 @@ def get_mts_income_taxes_monthly_by_year(
             "type": "date"
         }
     ],
-})
+}, inputs=["mts_panel"], budget=Budget(p95_ms=300, max_bytes=100_000, max_memory=32 * 2**20))
 def get_mts_income_taxes_yoy_comparison(
     start_date: str = (datetime.datetime.now() - datetime.timedelta(days=10*365)).strftime("%Y-%m-%d"),
     theme: str = "dark"
 ):
     """Get MTS Income Tax YoY comparison data and return as Plotly figure."""
     try:
-        df = treasury_gov_pandas.datasets.mts.mts_table_4.load.load()
-        df['record_date'] = pd.to_datetime(df['record_date'])
-        df['current_month_net_rcpt_amt'] = pd.to_numeric(
-            df['current_month_net_rcpt_amt'], errors='coerce'
-        )
-
-        df = df.query('classification_desc == "Total -- Individual Income Taxes"')
-        df = df[df['record_date'] > start_date]
-        df = df.sort_values('record_date')
-
-        df['prev_year'] = df['current_month_net_rcpt_amt'].shift(12)
-        df['yoy_change'] = ((df['current_month_net_rcpt_amt'] - df['prev_year']) / df['prev_year']) * 100
+        df = mts_panel.reported_since(start_date)
 
         fig = go.Figure()
         fig.add_trace(
             go.Bar(
                 x=df['record_date'],
-                y=df['yoy_change'],
+                y=df['yoy_pct'],
                 name="YoY Change",
                 hovertemplate='<b>YoY Change</b><br>Date: %{x}<br>Change: %{y:,.2f}%<extra></extra>'
             )
@@ -986,7 +1277,7 @@ def get_mts_income_taxes_yoy_comparison(
         )
 
         fig = apply_config_to_figure(fig, theme)
-        return json.loads(fig.to_json())
+        return figure_response(fig)
 
     except Exception as e:
         return JSONResponse(
@@ -1015,30 +1306,20 @@ def get_mts_income_taxes_yoy_comparison(
             "type": "date"
         }
     ],
-})
+}, inputs=["mts_panel"], budget=Budget(p95_ms=300, max_bytes=100_000, max_memory=32 * 2**20))
 def get_mts_income_taxes_current_vs_prior(
     start_date: str = (datetime.datetime.now() - datetime.timedelta(days=10*365)).strftime("%Y-%m-%d"),
     theme: str = "dark"
 ):
     """Get MTS Income Tax current vs prior year data and return as Plotly figure."""
     try:
-        df = treasury_gov_pandas.datasets.mts.mts_table_4.load.load()
-        df['record_date'] = pd.to_datetime(df['record_date'])
-        df['current_month_net_rcpt_amt'] = pd.to_numeric(
-            df['current_month_net_rcpt_amt'], errors='coerce'
-        )
-
-        df = df.query('classification_desc == "Total -- Individual Income Taxes"')
-        df = df[df['record_date'] > start_date]
-        df = df.sort_values('record_date')
-
-        df['prev_year'] = df['current_month_net_rcpt_amt'].shift(12)
+        df = mts_panel.reported_since(start_date)
 
         fig = go.Figure()
         fig.add_trace(
             go.Bar(
                 x=df['record_date'],
-                y=df['current_month_net_rcpt_amt'],
+                y=df['net'],
                 name="Current Year",
                 hovertemplate='<b>Current Year</b><br>Date: %{x}<br>Amount: $%{y:,.2f}<extra></extra>'
             )
@@ -1046,7 +1327,7 @@ def get_mts_income_taxes_current_vs_prior(
         fig.add_trace(
             go.Bar(
                 x=df['record_date'],
-                y=df['prev_year'],
+                y=df['prior_year'],
                 name="Prior Year",
                 hovertemplate='<b>Prior Year</b><br>Date: %{x}<br>Amount: $%{y:,.2f}<extra></extra>'
             )
@@ -1063,7 +1344,7 @@ def get_mts_income_taxes_current_vs_prior(
         )
 
         fig = apply_config_to_figure(fig, theme)
-        return json.loads(fig.to_json())
+        return figure_response(fig)
 
     except Exception as e:
         return JSONResponse(
@@ -1092,30 +1373,20 @@ def get_mts_income_taxes_current_vs_prior(
             "type": "date"
         }
     ],
-})
+}, inputs=["mts_panel"], budget=Budget(p95_ms=300, max_bytes=100_000, max_memory=32 * 2**20))
 def get_mts_income_taxes_fytd(
     start_date: str = (datetime.datetime.now() - datetime.timedelta(days=10*365)).strftime("%Y-%m-%d"),
     theme: str = "dark"
 ):
     """Get MTS Income Tax fiscal year-to-date data and return as Plotly figure."""
     try:
-        df = treasury_gov_pandas.datasets.mts.mts_table_4.load.load()
-        df['record_date'] = pd.to_datetime(df['record_date'])
-        df['current_fytd_net_rcpt_amt'] = pd.to_numeric(
-            df['current_fytd_net_rcpt_amt'], errors='coerce'
-        )
-        df['prior_fytd_net_rcpt_amt'] = pd.to_numeric(
-            df['prior_fytd_net_rcpt_amt'], errors='coerce'
-        )
-
-        df = df.query('classification_desc == "Total -- Individual Income Taxes"')
-        df = df[df['record_date'] > start_date]
+        df = mts_panel.reported_since(start_date)
 
         fig = go.Figure()
         fig.add_trace(
             go.Scatter(
                 x=df['record_date'],
-                y=df['current_fytd_net_rcpt_amt'],
+                y=df['fytd'],
                 name="Current FYTD",
                 mode='lines'
             )
@@ -1123,7 +1394,7 @@ def get_mts_income_taxes_fytd(
         fig.add_trace(
             go.Scatter(
                 x=df['record_date'],
-                y=df['prior_fytd_net_rcpt_amt'],
+                y=df['prior_fytd'],
                 name="Prior FYTD",
                 mode='lines'
             )
@@ -1139,10 +1410,235 @@ def get_mts_income_taxes_fytd(
         )
 
         fig = apply_config_to_figure(fig, theme)
-        return json.loads(fig.to_json())
+        return figure_response(fig)
+
+    except Exception as e:
+        return JSONResponse(
+            content={"error": str(e)},
+            status_code=500
+        )
+
+
+@register_options("overlay-series", inputs=overlays.INPUTS)
+def overlay_series_options():
+    """Every series that can be overlaid, by source."""
+    return [
+        {"label": f"{overlays.SOURCES[source].label}: {name.split('/', 1)[1]}", "value": name}
+        for source, names in overlays.catalog().items()
+        for name in names
+    ]
+
+
+OVERLAY_PARAMS = [
+    {
+        "paramName": "series",
+        "value": "fed-net-liquidity/TGA,fed-balance-sheet/WDTGAL",
+        "label": "Series",
+        "show": True,
+        "description": "Series to align, from the H.4.1, net liquidity, DTS and MTS sources",
+        "type": "text",
+        "multiSelect": True,
+        "optionsEndpoint": options_endpoint("overlay-series")
+    },
+    {
+        "paramName": "frequency",
+        "value": "W",
+        "label": "Frequency",
+        "show": True,
+        "description": "Frequency to align the series on",
+        "type": "text",
+        "options": [
+            {"label": "Daily", "value": "D"},
+            {"label": "Weekly (Wednesday)", "value": "W"},
+            {"label": "Monthly", "value": "M"},
+            {"label": "Quarterly", "value": "Q"},
+            {"label": "Yearly", "value": "Y"}
+        ]
+    },
+    {
+        "paramName": "how",
+        "value": "",
+        "label": "Aggregation",
+        "show": True,
+        "description": (
+            "How the values of a period are combined: one of last, first, mean, "
+            "sum, min or max, or one per series, comma-separated. Defaults to last "
+            "for balances and sum for DTS and MTS flows"
+        ),
+        "type": "text"
+    },
+    {
+        "paramName": "fill",
+        "value": "none",
+        "label": "Fill",
+        "show": True,
+        "description": "Carry values forward into periods without one",
+        "type": "text",
+        "options": [
+            {"label": "None", "value": "none"},
+            {"label": "Forward fill", "value": "ffill"}
+        ]
+    },
+    {
+        "paramName": "start_date",
+        "value": (datetime.datetime.now() - datetime.timedelta(days=3*365)).strftime("%Y-%m-%d"),
+        "label": "Start Date",
+        "show": True,
+        "description": "Start date for the data",
+        "type": "date"
+    }
+]
+
+
+def _split_param(value):
+    return [v.strip() for v in value.split(",") if v.strip()] if value else []
+
+
+@app.get("/overlay")
+@register_widget({
+    "name": "Series Overlay",
+    "description": "Overlays series from the balance sheet, net liquidity, DTS and MTS sources on a common frequency",
+    "category": "Treasury",
+    "type": "chart",
+    "endpoint": "overlay",
+    "gridData": {"w": 40, "h": 15},
+    "source": "Federal Reserve, U.S. Treasury",
+    "data": {"chart": {"type": "line"}},
+    "params": OVERLAY_PARAMS,
+}, inputs=overlays.INPUTS, budget=Budget(p95_ms=300, max_bytes=250_000, max_memory=32 * 2**20))
+def get_overlay(
+    series: str = "fed-net-liquidity/TGA,fed-balance-sheet/WDTGAL",
+    frequency: str = "W",
+    how: str = "",
+    fill: str = "none",
+    start_date: str = None,
+    theme: str = "dark"
+):
+    """Align series on one frequency and plot them; the first on the left axis, the others on the right."""
+    try:
+        try:
+            df = overlays.overlay(
+                _split_param(series), frequency, _split_param(how), fill, start_date
+            )
+        except ValueError as e:
+            return JSONResponse(
+                content={"error": str(e)},
+                status_code=400
+            )
+
+        fig = go.Figure()
+        for i, name in enumerate(df.columns):
+            fig.add_trace(go.Scatter(
+                x=df.index,
+                y=df[name],
+                mode='lines',
+                name=name,
+                connectgaps=True,
+                yaxis='y2' if i else 'y',
+            ))
+
+        fig.update_layout(
+            create_base_layout(
+                x_title="Date",
+                y_title=df.columns[0],
+                theme=theme
+            ),
+            xaxis_tickangle=-45
+        )
+        if len(df.columns) > 1:
+            fig.update_layout(yaxis2=dict(overlaying='y', side='right'))
+
+        # Apply theme configuration
+        fig = apply_config_to_figure(fig, theme)
+
+        return figure_response(fig)
 
     except Exception as e:
         return JSONResponse(
             content={"error": str(e)},
             status_code=500
         )
+
+
+@app.get("/overlay-data")
+@register_widget({
+    "name": "Series Overlay Data",
+    "description": "Series from the balance sheet, net liquidity, DTS and MTS sources aligned on a common frequency, as a table",
+    "category": "Treasury",
+    "type": "table",
+    "endpoint": "overlay-data",
+    "gridData": {"w": 40, "h": 15},
+    "source": "Federal Reserve, U.S. Treasury",
+    "data": {"table": {"showAll": True}},
+    "params": OVERLAY_PARAMS,
+}, inputs=overlays.INPUTS, budget=Budget(p95_ms=200, max_bytes=1_000_000, max_memory=32 * 2**20))
+def get_overlay_data(
+    series: str = "fed-net-liquidity/TGA,fed-balance-sheet/WDTGAL",
+    frequency: str = "W",
+    how: str = "",
+    fill: str = "none",
+    start_date: str = None
+):
+    """Align series on one frequency and return them as records, one per period."""
+    try:
+        try:
+            df = overlays.overlay(
+                _split_param(series), frequency, _split_param(how), fill, start_date
+            )
+        except ValueError as e:
+            return JSONResponse(
+                content={"error": str(e)},
+                status_code=400
+            )
+
+        df = df.reset_index()
+        df['date'] = df['date'].dt.strftime('%Y-%m-%d')
+
+        # Empty periods become null
+        return JSONResponse(content=json.loads(df.to_json(orient="records")))
+
+    except Exception as e:
+        return JSONResponse(
+            content={"error": str(e)},
+            status_code=500
+        )
+
+
+def fill_response_store():
+    """Encode and precompress the static payloads once, at startup."""
+    with open(ROOT_PATH / "templates.json", "r") as f:
+        templates = json.load(f)
+
+    RESPONSE_STORE.fill({
+        "widgets.json": json.dumps(WIDGETS, separators=(",", ":")).encode(),
+        "templates.json": json.dumps(templates, separators=(",", ":")).encode(),
+    })
+
+
+# All widgets are registered at this point
+fill_response_store()
+
+
+@app.on_event("startup")
+def start_figure_pool():
+    """Start the figure workers, if enabled, before the first request."""
+    figure_pool.start()
+
+
+@app.on_event("startup")
+def prerender_widgets():
+    """Build the default widget responses in the background, and after every data change."""
+    widget_cache.start_prerender(app)
+
+
+@app.on_event("startup")
+def close_event_streams_on_exit():
+    """End the /events streams when the server stops, so it does not wait on them."""
+    events.close_on_exit()
+
+
+@app.on_event("shutdown")
+def stop_figure_pool():
+    """Stop the figure workers with the server."""
+    figure_pool.stop()
+
@@ -0,0 +1,145 @@
+"""
+Derived metrics over the net-liquidity base series.
+
+Metrics are declared as a base expression over the columns of the
+fed_net_liquidity dataset (evaluated with DataFrame.eval) plus an optional
+time-based transform. Every metric is an artifact (see artifacts.py) named
+metric:<name>, so it is computed at most once per data refresh.
+
+Example:
+    register_metric(
+        "NL_yoy", "Net Liquidity YoY %",
+        expr="NL", transform="pct_change", window="365D",
+    )
+"""
+
+import functools
+
+import artifacts
+from lazy_imports import lazy_module
+
+np = lazy_module("numpy")
+pd = lazy_module("pandas")
+
+DATASET = "fed_net_liquidity"
+
+# Registered metrics: name -> Metric
+METRICS = {}
+
+
+class Metric:
+    """A declarative derived metric."""
+
+    def __init__(self, name, label, expr, transform=None, window=None):
+        if transform is not None and transform not in TRANSFORMS:
+            raise ValueError(f"Unknown transform {transform}")
+        self.name = name
+        self.label = label
+        self.expr = expr
+        self.transform = transform
+        self.window = window
+
+
+def register_metric(name, label, expr, transform=None, window=None):
+    """
+    Registers a derived metric.
+
+    Args:
+        name (str): The metric name, used as the `metric` query parameter.
+        label (str): Human-readable label for the widget options.
+        expr (str): Expression over the base columns, e.g. "WALCL - RRP - TGA".
+        transform (str): Optional. One of TRANSFORMS.
+        window (str): Optional. Transform window as a pandas Timedelta
+            string, e.g. "28D" or "365D".
+
+    Returns:
+        Metric: The registered metric.
+    """
+    metric = Metric(name, label, expr, transform, window)
+    METRICS[name] = metric
+    artifacts.register_artifact(artifact_name(name), inputs=[DATASET])(
+        functools.partial(_compute, metric)
+    )
+    return metric
+
+
+def artifact_name(name):
+    """Returns the name of the artifact holding a metric."""
+    return f"metric:{name}"
+
+
+def _lagged(values, index, window):
+    """Value of each series point as of `window` earlier (last observation
+    at or before that time), NaN where there is none."""
+    positions = index.searchsorted(index - window, side="right") - 1
+    lagged = values[np.clip(positions, 0, None)]
+    return np.where(positions >= 0, lagged, np.nan)
+
+
+def _change(s, window):
+    return s - _lagged(s.to_numpy(dtype="f8"), s.index, window)
+
+
+def _pct_change(s, window):
+    prior = _lagged(s.to_numpy(dtype="f8"), s.index, window)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return (s / prior - 1) * 100
+
+
+def _rolling_mean(s, window):
+    return s.rolling(window).mean()
+
+
+def _zscore(s, window):
+    rolling = s.rolling(window)
+    return (s - rolling.mean()) / rolling.std()
+
+
+# Transforms take a date-indexed Series and a Timedelta window
+TRANSFORMS = {
+    "change": _change,
+    "pct_change": _pct_change,
+    "rolling_mean": _rolling_mean,
+    "zscore": _zscore,
+}
+
+
+def _compute(metric, frame):
+    """Evaluates a metric against a dataset frame."""
+    values = frame.eval(metric.expr)
+    if metric.transform is not None:
+        index = pd.DatetimeIndex(pd.to_datetime(frame["date"]))
+        series = pd.Series(values.to_numpy(dtype="f8"), index=index)
+        window = pd.Timedelta(metric.window) if metric.window else None
+        values = TRANSFORMS[metric.transform](series, window)
+    values = pd.Series(np.asarray(values, dtype="f8"), index=frame.index)
+
+    return pd.DataFrame({
+        "date": frame["date"],
+        metric.name: values,
+        f"{metric.name}_diff": values.diff(),
+    })
+
+
+def evaluate(name):
+    """
+    Returns a derived metric for the current dataset snapshot.
+
+    Args:
+        name (str): The registered metric name.
+
+    Returns:
+        pd.DataFrame: Columns date, <name> and <name>_diff. Treat as read-only.
+    """
+    return artifacts.get(artifact_name(name))
+
+
+register_metric("NL_ex_REM", "Net Liquidity excl. REM", expr="WALCL - RRP - TGA")
+register_metric("NL_4w_change", "Net Liquidity 4-Week Change", expr="NL", transform="change", window="28D")
+register_metric("NL_13w_change", "Net Liquidity 13-Week Change", expr="NL", transform="change", window="91D")
+register_metric("NL_yoy", "Net Liquidity YoY %", expr="NL", transform="pct_change", window="365D")
+register_metric("NL_zscore", "Net Liquidity 1-Year Z-Score", expr="NL", transform="zscore", window="365D")
+register_metric("NL_13w_avg", "Net Liquidity 13-Week Average", expr="NL", transform="rolling_mean", window="91D")
+register_metric("WALCL_yoy", "WALCL YoY %", expr="WALCL", transform="pct_change", window="365D")
+register_metric("TGA_4w_change", "TGA 4-Week Change", expr="TGA", transform="change", window="28D")
+register_metric("RRP_4w_change", "RRP 4-Week Change", expr="RRP", transform="change", window="28D")
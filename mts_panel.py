@@ -0,0 +1,104 @@
+"""
+Monthly panel of MTS individual income tax receipts.
+
+The panel is indexed by calendar month (pd.Period) with every month between
+the first and last report present, so lagged columns line up by calendar
+period even when a month is missing from the source. It is an artifact
+(see artifacts.py) built once per version of the mts_table_4 dataset; the
+MTS endpoints only slice it.
+"""
+
+import artifacts
+from lazy_imports import lazy_module
+
+np = lazy_module("numpy")
+pd = lazy_module("pandas")
+
+DATASET = "mts_table_4"
+CLASSIFICATION = "Total -- Individual Income Taxes"
+
+MONTH_NAMES = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun',
+               'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+
+
+class Panel:
+    """
+    Precomputed views of the income tax receipts.
+
+    Attributes:
+        monthly (pd.DataFrame): One row per calendar month (PeriodIndex) with
+            record_date, year, month, reported, net, prior_year, yoy_pct,
+            fytd and prior_fytd columns.
+        by_month (pd.DataFrame): Net receipts as a month (1-12) x calendar
+            year matrix.
+    """
+
+    def __init__(self, monthly, by_month):
+        self.monthly = monthly
+        self.by_month = by_month
+
+
+@artifacts.register_artifact("mts_panel", inputs=[DATASET])
+def _build(df):
+    df = df[df['classification_desc'] == CLASSIFICATION]
+    periods = df['record_date'].dt.to_period('M')
+
+    # One row per month; later reports of the same month win
+    source = pd.DataFrame({
+        'net': df['current_month_net_rcpt_amt'].to_numpy(),
+        'fytd': df['current_fytd_net_rcpt_amt'].to_numpy(),
+        'prior_fytd': df['prior_fytd_net_rcpt_amt'].to_numpy(),
+    }, index=pd.PeriodIndex(periods, freq='M'))
+    source = source[~source.index.duplicated(keep='last')].sort_index()
+
+    if source.empty:
+        full = pd.period_range('2000-01', periods=0, freq='M')
+    else:
+        full = pd.period_range(source.index[0], source.index[-1], freq='M')
+    monthly = source.reindex(full)
+
+    monthly.insert(0, 'record_date', full.to_timestamp(how='end').normalize())
+    monthly.insert(1, 'year', full.year)
+    monthly.insert(2, 'month', full.month)
+    monthly.insert(3, 'reported', full.isin(source.index))
+
+    net = monthly['net'].to_numpy(dtype='f8')
+    prior = np.full_like(net, np.nan)
+    prior[12:] = net[:-12]
+    monthly['prior_year'] = prior
+    with np.errstate(divide='ignore', invalid='ignore'):
+        monthly['yoy_pct'] = (net - prior) / prior * 100
+
+    by_month = monthly.pivot(index='month', columns='year', values='net')
+    by_month = by_month.reindex(range(1, 13))
+
+    return Panel(monthly, by_month)
+
+
+@artifacts.register_artifact("mts_by_month", inputs=["mts_panel"])
+def _by_month(panel):
+    return panel.by_month
+
+
+def get_panel():
+    """
+    Returns the panel for the current mts_table_4 snapshot.
+
+    Returns:
+        Panel: The precomputed panel. Treat as read-only.
+    """
+    return artifacts.get("mts_panel")
+
+
+def reported_since(start_date):
+    """
+    Returns the reported months with a record_date after start_date.
+
+    Args:
+        start_date (str): Date in YYYY-MM-DD format.
+
+    Returns:
+        pd.DataFrame: Slice of Panel.monthly.
+    """
+    monthly = get_panel().monthly
+    return monthly[monthly['reported'] & (monthly['record_date'] > pd.Timestamp(start_date))]
@@ -0,0 +1,219 @@
+"""
+Series from different sources aligned on a common frequency.
+
+Every source is an artifact (see artifacts.py) holding its series as the
+columns of one wide, date-indexed frame:
+
+- fed-balance-sheet: the weekly H.4.1 levels, e.g. fed-balance-sheet/WDTGAL
+- fed-net-liquidity: WALCL, RRP, TGA (the daily DTS balance), REM and NL
+- dts: daily deposits and withdrawals per category, e.g.
+  dts/Deposits/Taxes - Corporate Income
+- mts: monthly net receipts per classification, e.g.
+  mts/Corporation Income Taxes
+
+A series is named "<source>/<column>"; commas are removed from column names
+so series can be listed comma-separated.
+
+A grid is a source resampled onto one frequency with one aggregation, for
+all of its columns at once. Grids are cached per (source, frequency,
+aggregation) until the source's data changes, so an overlay of series that
+were aligned before only selects and joins columns:
+
+    frame = overlays.overlay(
+        ["fed-net-liquidity/TGA", "fed-balance-sheet/WDTGAL"], "W"
+    )
+"""
+
+import datasets
+import artifacts
+import cache_registry
+from lazy_imports import lazy_module
+
+pd = lazy_module("pandas")
+
+# Frequency code -> pandas rule. Weeks end on Wednesday, as H.4.1 weeks do.
+FREQUENCIES = {
+    "D": "D",
+    "W": "W-WED",
+    "M": "ME",
+    "Q": "QE",
+    "Y": "YE",
+}
+
+# Aggregations of the values that fall in one period
+AGGREGATIONS = ("last", "first", "mean", "sum", "min", "max")
+
+FILLS = ("none", "ffill")
+
+
+class Source:
+    """A set of series and how they are aggregated by default."""
+
+    def __init__(self, name, dataset, default_how, label):
+        self.name = name
+        self.dataset = dataset
+        self.default_how = default_how
+        self.label = label
+
+    @property
+    def artifact(self):
+        return f"overlay:{self.name}"
+
+
+# Sources of overlay series, keyed by name. Levels default to the last value
+# of a period, flows to the sum.
+SOURCES = {
+    "fed-balance-sheet": Source("fed-balance-sheet", "fed_balance_sheet_levels", "last", "H.4.1"),
+    "fed-net-liquidity": Source("fed-net-liquidity", "fed_net_liquidity", "last", "Net liquidity"),
+    "dts": Source("dts", "dts_deposits_withdrawals", "sum", "DTS"),
+    "mts": Source("mts", "mts_table_4", "sum", "MTS"),
+}
+
+# Artifacts of every source, for register_widget(inputs=...)
+INPUTS = tuple(source.artifact for source in SOURCES.values())
+
+_grids = cache_registry.Cache("overlay_grids")
+
+
+def _clean(frame):
+    frame.columns = [str(c).replace(",", "") for c in frame.columns]
+    frame.index.name = "date"
+    return frame.sort_index().astype("float64")
+
+
+@artifacts.register_artifact("overlay:fed-balance-sheet", inputs=["fed_balance_sheet_levels"])
+def _balance_sheet(df):
+    return _clean(df.set_index("date"))
+
+
+@artifacts.register_artifact("overlay:fed-net-liquidity", inputs=["fed_net_liquidity"])
+def _net_liquidity(df):
+    return _clean(df.set_index("date")[["WALCL", "RRP", "TGA", "REM", "NL"]])
+
+
+@artifacts.register_artifact("overlay:dts", inputs=["dts_deposits_withdrawals"])
+def _dts(df):
+    wide = df.pivot_table(
+        index="record_date",
+        columns=["transaction_type", "transaction_catg"],
+        values="transaction_today_amt",
+        aggfunc="sum",
+    )
+    wide.columns = [f"{kind}/{category}" for kind, category in wide.columns]
+    return _clean(wide)
+
+
+@artifacts.register_artifact("overlay:mts", inputs=["mts_table_4"])
+def _mts(df):
+    # Later reports of the same month win
+    wide = df.pivot_table(
+        index="record_date",
+        columns="classification_desc",
+        values="current_month_net_rcpt_amt",
+        aggfunc="last",
+    )
+    return _clean(wide)
+
+
+def grid(source, frequency, how):
+    """
+    Returns every series of a source resampled onto a frequency.
+
+    Args:
+        source (str): A key of SOURCES.
+        frequency (str): A key of FREQUENCIES.
+        how (str): One of AGGREGATIONS.
+
+    Returns:
+        pd.DataFrame: One column per series, indexed by period end date.
+        Periods without values are NaN. Treat as read-only.
+    """
+    artifact = SOURCES[source].artifact
+    key = (source, frequency, how, artifacts.version(artifact))
+    frame = _grids.get(key)
+    if frame is None:
+        resampler = artifacts.get(artifact).resample(FREQUENCIES[frequency])
+        if how == "sum":
+            # Leave empty periods NaN rather than 0
+            frame = resampler.sum(min_count=1)
+        else:
+            frame = getattr(resampler, how)()
+        _grids.put(key, frame)
+    return frame
+
+
+@datasets.on_change
+def _drop_stale(names):
+    stale = artifacts.affected(names)
+    _grids.discard(lambda key: SOURCES[key[0]].artifact in stale)
+
+
+def parse_series(name):
+    """Splits a series name into its source and column."""
+    source, _, column = name.partition("/")
+    if source not in SOURCES or not column:
+        raise ValueError(f"Unknown series {name}")
+    return source, column
+
+
+def catalog():
+    """Returns the name of every series, grouped by source."""
+    return {
+        source: [f"{source}/{column}" for column in artifacts.get(s.artifact).columns]
+        for source, s in SOURCES.items()
+    }
+
+
+def overlay(series, frequency="W", how=None, fill="none", start_date=None, end_date=None):
+    """
+    Aligns series on one frequency.
+
+    Args:
+        series (list): Series names, "<source>/<column>".
+        frequency (str): A key of FREQUENCIES.
+        how (list): Optional. Aggregations: one for every series, or one
+            per series. Defaults to the aggregation of each source.
+        fill (str): "none" leaves periods without a value empty; "ffill"
+            carries the last value forward, e.g. to show a monthly series
+            on a weekly grid.
+        start_date (str): Optional. First period end date, YYYY-MM-DD.
+        end_date (str): Optional. Last period end date, YYYY-MM-DD.
+
+    Returns:
+        pd.DataFrame: One column per series, named as requested, indexed
+        by period end date.
+
+    Raises:
+        ValueError: If a series, the frequency, an aggregation or the fill
+            is unknown.
+    """
+    if not series:
+        raise ValueError("No series requested")
+    if frequency not in FREQUENCIES:
+        raise ValueError(f"Unknown frequency {frequency}; use one of {', '.join(FREQUENCIES)}")
+    if fill not in FILLS:
+        raise ValueError(f"Unknown fill {fill}; use one of {', '.join(FILLS)}")
+
+    parsed = [parse_series(name) for name in series]
+    how = list(how or [])
+    if len(how) == 1:
+        how = how * len(series)
+    elif not how:
+        how = [SOURCES[source].default_how for source, _ in parsed]
+    elif len(how) != len(series):
+        raise ValueError("Give one aggregation, or one per series")
+    for h in how:
+        if h not in AGGREGATIONS:
+            raise ValueError(f"Unknown aggregation {h}; use one of {', '.join(AGGREGATIONS)}")
+
+    columns = []
+    for name, (source, column), h in zip(series, parsed, how):
+        frame = grid(source, frequency, h)
+        if column not in frame.columns:
+            raise ValueError(f"Unknown series {name}")
+        columns.append(frame[column].rename(name))
+
+    result = pd.concat(columns, axis=1, sort=True)
+    if fill == "ffill":
+        result = result.ffill()
+    return result.loc[start_date:end_date]
@@ -0,0 +1,178 @@
+"""
+On-demand statistical profiler of the server's threads.
+
+sample() reads the stack of every thread with sys._current_frames() every
+few milliseconds, for a fixed number of seconds, and counts identical
+stacks. Each stack is tagged with the endpoint whose handler it runs: the
+innermost frame whose code object belongs to a route handler, so requests
+already running when sampling starts, and widgets run by /batch, are
+tagged too. Nothing is recorded per request, so the profiler costs nothing
+until it is started.
+
+Results are rendered as collapsed stacks, for flamegraph.pl or speedscope:
+
+    /fed-balance-sheet;get_fed_balance_sheet (main.py:882);... 12
+
+or as a speedscope file with one profile per endpoint.
+
+Only the server process is sampled; charts built in figure workers (see
+figure_pool.py) show up as the handler waiting on the pool.
+"""
+
+import collections
+import os
+import sys
+import threading
+import time
+
+# Required to use the profiler endpoint; profiling is disabled when unset
+TOKEN = os.environ.get("PROFILER_TOKEN")
+
+MAX_SECONDS = float(os.environ.get("PROFILER_MAX_SECONDS", "60"))
+
+SCOPES = ("handlers", "all")
+
+_running = threading.Lock()
+
+
+class Profile:
+    """
+    Sampled stacks and their counts.
+
+    Attributes:
+        counts (collections.Counter): (tag, tuple of code objects, outermost
+            first) -> number of samples.
+        ticks (int): Number of times the threads were sampled.
+        interval (float): Seconds between ticks.
+        elapsed (float): Seconds sampled.
+    """
+
+    def __init__(self, counts, ticks, interval, elapsed):
+        self.counts = counts
+        self.ticks = ticks
+        self.interval = interval
+        self.elapsed = elapsed
+
+    def only(self, tag):
+        """Returns the samples tagged with tag."""
+        counts = collections.Counter(
+            {key: count for key, count in self.counts.items() if key[0] == tag}
+        )
+        return Profile(counts, self.ticks, self.interval, self.elapsed)
+
+
+def _qualname(code):
+    # co_qualname is new in Python 3.11
+    return getattr(code, "co_qualname", code.co_name)
+
+
+def frame_name(code):
+    """Function name and definition site of a code object."""
+    return f"{_qualname(code)} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def sample(seconds, interval=0.005, handlers=None, scope="handlers"):
+    """
+    Samples the stacks of every thread but the caller's.
+
+    Args:
+        seconds (float): How long to sample.
+        interval (float): Optional. Seconds between samples.
+        handlers (dict): Optional. Code object of a route handler -> tag,
+            e.g. its path.
+        scope (str): Optional. "handlers" keeps only stacks that run a
+            handler; "all" keeps every thread, tagged by thread name
+            otherwise.
+
+    Returns:
+        Profile: The sampled stacks.
+
+    Raises:
+        RuntimeError: If another profile is being taken.
+    """
+    handlers = handlers or {}
+    if not _running.acquire(blocking=False):
+        raise RuntimeError("A profile is already being taken")
+    try:
+        own = threading.get_ident()
+        counts = collections.Counter()
+        ticks = 0
+        start = time.perf_counter()
+        deadline = start + seconds
+        while time.perf_counter() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                tag = None
+                while frame is not None:
+                    code = frame.f_code
+                    if tag is None:
+                        tag = handlers.get(code)
+                    stack.append(code)
+                    frame = frame.f_back
+                if tag is None:
+                    if scope == "handlers":
+                        continue
+                    tag = names.get(ident, f"thread-{ident}")
+                stack.reverse()
+                counts[(tag, tuple(stack))] += 1
+            # Do not keep the threads' frames alive while sleeping
+            frame = None
+            ticks += 1
+            time.sleep(interval)
+        return Profile(counts, ticks, interval, time.perf_counter() - start)
+    finally:
+        _running.release()
+
+
+def collapsed(profile):
+    """Renders a profile as collapsed stacks, one "tag;frame;... count" line each."""
+    lines = collections.Counter()
+    for (tag, stack), count in profile.counts.items():
+        lines[";".join([tag] + [frame_name(code) for code in stack])] += count
+    return "".join(f"{line} {count}\n" for line, count in sorted(lines.items()))
+
+
+def speedscope(profile, name="dharmatech-openbb"):
+    """
+    Renders a profile in the speedscope file format, with one sampled
+    profile per tag, weighted in seconds.
+    """
+    frames = []
+    index = {}
+    profiles = {}
+    for (tag, stack), count in sorted(profile.counts.items(), key=lambda item: item[0][0]):
+        samples = []
+        for code in stack:
+            if code not in index:
+                index[code] = len(frames)
+                frames.append({
+                    "name": _qualname(code),
+                    "file": code.co_filename,
+                    "line": code.co_firstlineno,
+                })
+            samples.append(index[code])
+        entry = profiles.setdefault(tag, {"samples": [], "weights": []})
+        entry["samples"].append(samples)
+        entry["weights"].append(count * profile.interval)
+
+    return {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "name": name,
+        "exporter": "profiler.py",
+        "shared": {"frames": frames},
+        "profiles": [
+            {
+                "type": "sampled",
+                "name": tag,
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": sum(entry["weights"]),
+                "samples": entry["samples"],
+                "weights": entry["weights"],
+            }
+            for tag, entry in profiles.items()
+        ],
+    }
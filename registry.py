@@ -7,7 +7,74 @@ import asyncio
 WIDGETS = {}
 TEMPLATES = {}
 
-def register_widget(widget_config):
+# Undecorated endpoint functions, keyed by widget endpoint
+WIDGET_HANDLERS = {}
+
+# Datasets and artifacts each widget is computed from, keyed by widget
+# endpoint. Only widgets that declare their inputs are cached.
+WIDGET_INPUTS = {}
+
+# Dynamic option providers, keyed by name
+OPTION_PROVIDERS = {}
+
+# Performance budgets, keyed by widget endpoint
+WIDGET_BUDGETS = {}
+
+
+class Budget:
+    """
+    The expected cost of one build of a widget at the reference data scale
+    (see budgets.py). A limit of None is not checked.
+
+    Args:
+        p95_ms (float): 95th percentile build time, in milliseconds.
+        max_bytes (int): Largest response body, in bytes.
+        max_memory (int): Peak memory allocated by one build, in bytes.
+    """
+
+    def __init__(self, p95_ms=None, max_bytes=None, max_memory=None):
+        self.p95_ms = p95_ms
+        self.max_bytes = max_bytes
+        self.max_memory = max_memory
+
+    def limits(self):
+        return {
+            "p95_ms": self.p95_ms,
+            "max_bytes": self.max_bytes,
+            "max_memory": self.max_memory,
+        }
+
+    def exceeded(self, measured):
+        """
+        Returns the names of the limits that measured values exceed.
+
+        Args:
+            measured (dict): Values keyed like limits(); missing ones are
+                not checked.
+        """
+        return [
+            name for name, limit in self.limits().items()
+            if limit is not None and measured.get(name) is not None and measured[name] > limit
+        ]
+
+
+# Applies to widgets registered without a budget
+DEFAULT_BUDGET = Budget(p95_ms=1000, max_bytes=2_000_000, max_memory=256 * 2**20)
+
+
+class OptionProvider:
+    """A function that computes a widget parameter's options."""
+
+    def __init__(self, name, func, inputs=()):
+        self.name = name
+        self.func = func
+        self.inputs = tuple(inputs)
+
+    @property
+    def endpoint(self):
+        return options_endpoint(self.name)
+
+def register_widget(widget_config, inputs=None, budget=None):
     """
     Decorator that registers a widget configuration in the WIDGETS dictionary.
     
@@ -15,6 +82,12 @@ def register_widget(widget_config):
         widget_config (dict): The widget configuration to add to the WIDGETS 
             dictionary. This should follow the same structure as other entries 
             in WIDGETS.
+        inputs (tuple): Optional. Names of the datasets and artifacts (see
+            artifacts.py) the widget is computed from. Responses of widgets
+            that declare their inputs are cached until one of them changes.
+        budget (Budget): Optional. The widget's performance budget, checked
+            by budgets.py and reported at /debug/budgets. Defaults to
+            DEFAULT_BUDGET.
     
     Returns:
         function: The decorated function.
@@ -38,9 +111,42 @@ def register_widget(widget_config):
                 widget_config["id"] = endpoint
             
             WIDGETS[endpoint] = widget_config
+            WIDGET_HANDLERS[endpoint] = func
+            if inputs is not None:
+                WIDGET_INPUTS[endpoint] = tuple(inputs)
+            WIDGET_BUDGETS[endpoint] = budget or DEFAULT_BUDGET
         
         # Return the appropriate wrapper based on whether the function is async
         if asyncio.iscoroutinefunction(func):
             return async_wrapper
         return sync_wrapper
     return decorator
+
+
+def options_endpoint(name):
+    """Returns the path that serves the options of a registered provider."""
+    return f"/options/{name}"
+
+
+def register_options(name, inputs=()):
+    """
+    Decorator that registers a dynamic options provider.
+
+    Instead of embedding a long options list in WIDGETS, a widget param can
+    point to a provider with "optionsEndpoint": options_endpoint(name). The
+    provider is then called when its endpoint is first requested, and the
+    result is cached until one of its input datasets is reloaded.
+
+    Args:
+        name (str): The provider name, served at /options/<name>.
+        inputs (tuple): Optional. Names of the datasets and artifacts the
+            options are computed from.
+
+    Returns:
+        function: The decorated function, unchanged. It takes no arguments
+        and returns a list of {"label": ..., "value": ...} dictionaries.
+    """
+    def decorator(func):
+        OPTION_PROVIDERS[name] = OptionProvider(name, func, inputs)
+        return func
+    return decorator
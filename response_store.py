@@ -0,0 +1,271 @@
+"""
+Precompressed response store.
+
+Payloads are stored once as raw, gzip and brotli bytes together with a strong
+ETag. Requests are answered with the best variant for their Accept-Encoding
+header, and If-None-Match revalidations are answered with 304 Not Modified.
+Each variant is sent with its own ETag, the payload's suffixed with the
+content-coding, e.g. "<hash>-gzip", as strong validators must differ per
+encoding; a revalidation with the ETag of any variant matches.
+"""
+
+import gzip
+import hashlib
+import time
+
+from fastapi.responses import JSONResponse, Response
+
+import cache_registry
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; fall back to gzip only
+    brotli = None
+
+# Payloads smaller than this are not worth compressing
+MIN_COMPRESS_SIZE = 512
+
+
+class StoredResponse:
+    """A payload with its precompressed variants and validator."""
+
+    def __init__(self, body, media_type="application/json", headers=None, version=None):
+        self.body = body
+        self.media_type = media_type
+        self.headers = dict(headers or {})
+        # Version of the data the payload was built from, if tracked
+        self.version = version
+        self.etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+        self.created = time.time()
+
+        self.variants = {"identity": body}
+        if len(body) >= MIN_COMPRESS_SIZE:
+            gz = gzip.compress(body, compresslevel=9, mtime=0)
+            if len(gz) < len(body):
+                self.variants["gzip"] = gz
+            if brotli is not None:
+                br = brotli.compress(body, quality=11)
+                if len(br) < len(body):
+                    self.variants["br"] = br
+
+    @property
+    def size(self):
+        """Total number of bytes held for this payload."""
+        return sum(len(v) for v in self.variants.values())
+
+
+def _parse_accept_encoding(header):
+    """
+    Parses an Accept-Encoding header into a {coding: qvalue} dictionary.
+
+    Parameters:
+        header (str): The header value, e.g. "gzip, br;q=0.9".
+
+    Returns:
+        dict: The accepted codings and their quality values.
+    """
+    accepted = {}
+    for part in header.split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[coding] = q
+    return accepted
+
+
+def choose_encoding(stored, accept_encoding):
+    """
+    Picks the stored variant the client prefers: the coding with the
+    highest q-value, and of those the smallest. Codings with q=0 are never
+    picked. Identity competes only if listed, directly or as "*", and is
+    the fallback if no variant is acceptable.
+
+    Parameters:
+        stored (StoredResponse): The stored payload.
+        accept_encoding (str): The request's Accept-Encoding header.
+
+    Returns:
+        str: "br", "gzip" or "identity".
+    """
+    accepted = _parse_accept_encoding(accept_encoding or "")
+    wildcard = accepted.get("*", 0.0)
+    quality = {
+        coding: accepted.get(coding, wildcard)
+        for coding in ("br", "gzip", "identity")
+        if coding in stored.variants
+    }
+    candidates = [coding for coding, q in quality.items() if q > 0]
+    if not candidates:
+        return "identity"
+    return min(
+        candidates,
+        key=lambda coding: (-quality[coding], len(stored.variants[coding])),
+    )
+
+
+# Content-codings that have a variant, and so an ETag suffix
+CODINGS = ("br", "gzip")
+
+
+def coding_etag(etag, coding):
+    """Returns the ETag of a payload's variant in a content-coding."""
+    if coding == "identity":
+        return etag
+    return f'{etag[:-1]}-{coding}"'
+
+
+def _base_etag(etag):
+    for coding in CODINGS:
+        suffix = f'-{coding}"'
+        if etag.endswith(suffix):
+            return etag[:-len(suffix)] + '"'
+    return etag
+
+
+def _etag_matches(if_none_match, etag):
+    """
+    Weak comparison of an If-None-Match header against a payload's ETag,
+    or the ETag of any of its variants.
+    """
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if _base_etag(candidate) == etag:
+            return True
+    return False
+
+
+class ResponseStore:
+    """
+    Thread-safe key -> StoredResponse mapping.
+
+    Keys are arbitrary hashable values, e.g. "widgets.json". Entries are
+    held in a cache_registry cache and count towards the memory budget.
+
+    Parameters:
+        name (str): Optional. Name of the cache in cache_registry.stats().
+        evictable (bool): Optional. Whether entries may be evicted when the
+            caches are over budget.
+    """
+
+    def __init__(self, name="responses", evictable=False):
+        self._entries = cache_registry.Cache(name, evictable=evictable)
+
+    def put(self, key, body, media_type="application/json", headers=None,
+            version=None, cost=0.0):
+        """
+        Compresses and stores a payload.
+
+        Parameters:
+            key (Hashable): The key to store the payload under.
+            body (bytes): The raw payload.
+            media_type (str): Optional. The response media type.
+            headers (dict): Optional. Extra headers to send with the payload.
+            version (Hashable): Optional. Version of the data the payload
+                was built from.
+            cost (float): Optional. Seconds it took to build the payload.
+
+        Returns:
+            StoredResponse: The stored entry.
+        """
+        start = time.perf_counter()
+        stored = StoredResponse(body, media_type, headers, version)
+        cost += time.perf_counter() - start
+        return self._entries.put(key, stored, cost=cost, size=stored.size)
+
+    def fill(self, payloads, media_type="application/json"):
+        """
+        Precompresses and stores several payloads at once.
+
+        Parameters:
+            payloads (dict): Mapping of key -> raw payload bytes.
+            media_type (str): Optional. The media type of all payloads.
+        """
+        for key, body in payloads.items():
+            self.put(key, body, media_type)
+
+    def get(self, key):
+        """Returns the StoredResponse for key, or None."""
+        return self._entries.get(key)
+
+    def invalidate(self, key=None):
+        """Drops one entry, or every entry if key is None."""
+        if key is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(key)
+
+    def discard(self, predicate):
+        """Drops every entry whose key satisfies predicate(key)."""
+        self._entries.discard(predicate)
+
+    def keys(self):
+        """Returns a snapshot of the stored keys."""
+        return self._entries.keys()
+
+    def respond(self, key, request):
+        """
+        Builds the response for a stored payload.
+
+        Parameters:
+            key (Hashable): The key of the stored payload.
+            request (fastapi.Request): The incoming request.
+
+        Returns:
+            fastapi.responses.Response: 304 if the client's copy is current,
+            otherwise the best encoded variant. 404 if key is not stored.
+        """
+        stored = self.get(key)
+        if stored is None:
+            return JSONResponse(content={"error": f"{key} not found"}, status_code=404)
+        return serve(stored, request)
+
+
+def serve(stored, request):
+    """
+    Serves a StoredResponse, honoring Accept-Encoding and If-None-Match.
+
+    Parameters:
+        stored (StoredResponse): The payload to serve.
+        request (fastapi.Request): The incoming request.
+
+    Returns:
+        fastapi.responses.Response: The response.
+    """
+    encoding = choose_encoding(stored, request.headers.get("accept-encoding"))
+    vary = [stored.headers["Vary"]] if "Vary" in stored.headers else []
+    headers = {
+        **stored.headers,
+        "ETag": coding_etag(stored.etag, encoding),
+        "Vary": ", ".join(vary + ["Accept-Encoding"]),
+        "Cache-Control": stored.headers.get("Cache-Control", "no-cache"),
+    }
+
+    if _etag_matches(request.headers.get("if-none-match"), stored.etag):
+        return Response(status_code=304, headers=headers)
+
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+
+    return Response(
+        content=stored.variants[encoding],
+        media_type=stored.media_type,
+        headers=headers,
+    )
+
+
+# Shared store for static and cached payloads
+RESPONSE_STORE = ResponseStore()
@@ -0,0 +1,131 @@
+"""
+DataFrame files that processes on one host map instead of copying.
+
+write() pickles a frame with protocol 5 and stores its column arrays out of
+band, each aligned in the file after the pickle. read() maps the file and
+unpickles the frame over views of the mapping, so numeric and datetime
+columns are not copied: every process reading the same file shares one
+copy of them in the page cache. Columns of Python objects, e.g. strings
+without pyarrow, are pickled in band and copied into each process.
+
+    snapshot_files.write(path, frame)
+    frame = snapshot_files.read(path)   # read-only columns
+
+Files are replaced atomically. Removing a file does not affect the
+processes that mapped it.
+
+Reading a file unpickles it, which runs code, so only read files from a
+directory that private_directory() accepted.
+"""
+
+import mmap
+import os
+import pickle
+import stat
+import struct
+
+MAGIC = b"OBBSNAP1"
+
+# Pickle length and number of buffers, then (offset, length) per buffer
+_HEADER = struct.Struct("<QQ")
+_BUFFER = struct.Struct("<QQ")
+
+# Buffers start on cache-line boundaries
+_ALIGN = 64
+
+
+def _align(offset):
+    return (offset + _ALIGN - 1) // _ALIGN * _ALIGN
+
+
+def private_directory(path):
+    """
+    Creates a directory only this user may access, unless it exists.
+
+    Returns:
+        bool: Whether path is a directory, not a link, owned by this user
+        and writable by no one else, so the files in it can be read.
+    """
+    try:
+        os.makedirs(path, mode=0o700)
+    except FileExistsError:
+        pass
+    info = os.lstat(path)
+    if not stat.S_ISDIR(info.st_mode):
+        return False
+    if not hasattr(os, "getuid"):
+        # Windows: the temp directory is private to each user already
+        return True
+    return info.st_uid == os.getuid() and not info.st_mode & (stat.S_IWGRP | stat.S_IWOTH)
+
+
+def owned(path):
+    """Whether this user owns the file at path, e.g. before removing it."""
+    if not hasattr(os, "getuid"):
+        return True
+    return os.lstat(path).st_uid == os.getuid()
+
+
+def write(path, frame):
+    """
+    Writes a DataFrame, or any pickleable value, to path.
+
+    Returns:
+        int: Number of bytes written.
+    """
+    buffers = []
+    data = pickle.dumps(frame, protocol=5, buffer_callback=buffers.append)
+    raws = [buffer.raw() for buffer in buffers]
+
+    position = _align(len(MAGIC) + _HEADER.size + _BUFFER.size * len(raws) + len(data))
+    layout = []
+    for raw in raws:
+        layout.append((position, raw.nbytes))
+        position = _align(position + raw.nbytes)
+
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, "wb") as f:
+            f.write(MAGIC)
+            f.write(_HEADER.pack(len(data), len(raws)))
+            for entry in layout:
+                f.write(_BUFFER.pack(*entry))
+            f.write(data)
+            for (offset, _), raw in zip(layout, raws):
+                f.seek(offset)
+                f.write(raw)
+            f.truncate(position)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+    return position
+
+
+def read(path):
+    """
+    Maps a file written by write() and returns its value, whose arrays are
+    read-only views of the mapping.
+
+    Raises:
+        FileNotFoundError: If there is no file at path.
+        ValueError: If the file was not written by write().
+    """
+    with open(path, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    view = memoryview(mapped)
+    if view[:len(MAGIC)] != MAGIC:
+        raise ValueError(f"{path} is not a snapshot file")
+    position = len(MAGIC)
+    length, count = _HEADER.unpack_from(view, position)
+    position += _HEADER.size
+    buffers = []
+    for _ in range(count):
+        offset, size = _BUFFER.unpack_from(view, position)
+        position += _BUFFER.size
+        buffers.append(view[offset:offset + size])
+    # The arrays keep the views, and so the mapping, alive
+    return pickle.loads(view[position:position + length], buffers=buffers)
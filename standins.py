@@ -0,0 +1,403 @@
+"""
+Offline stand-ins for the upstream data sources.
+
+Writes synthetic, deterministic data for every source in upstream.SOURCES,
+in the files and formats fred_pandas, treasury_gov_pandas and
+newyorkfed_pandas read. A server started from that directory (or
+loadgen.py) then runs without network access or API keys:
+
+    python standins.py /tmp/openbb-standins
+    cd /tmp/openbb-standins && uvicorn main:app --app-dir /path/to/repo
+
+The values are random walks of a realistic scale, not real data.
+
+UpstreamStandin serves the same data over HTTP, in the JSON of the FRED,
+fiscaldata.treasury.gov and New York Fed APIs, with ETags, 304 Not
+Modified and injectable failures, for running upstream.RefreshClient
+offline through RequestsTransport(host_map=server.host_map).
+`python standins.py check` refreshes stand-in files that way and checks
+what each refresh reports.
+"""
+
+import hashlib
+import http.server
+import json
+import os
+import sys
+import tempfile
+import threading
+import urllib.parse
+
+import numpy as np
+import pandas as pd
+
+import upstream
+
+# Categories of the DTS deposits/withdrawals table, including the sub-totals
+# and transfers the endpoints exclude
+DTS_CATEGORIES = [
+    "Taxes - Withheld Individual/FICA",
+    "Taxes - Corporate Income",
+    "Public Debt Cash Issues (Table IIIB)",
+    "Public Debt Cash Redemp. (Table IIIB)",
+    "Medicare",
+    "Social Security Benefits (EFT)",
+    "Defense Vendor Payments (EFT)",
+    "Federal Salaries (EFT)",
+    "Sub-Total Deposits",
+    "Sub-Total Withdrawals",
+    "Transfers to Federal Reserve Account (Table V)",
+    "null",
+]
+
+MTS_CLASSIFICATIONS = [
+    "Total -- Individual Income Taxes",
+    "Corporation Income Taxes",
+    "Social Insurance and Retirement Receipts",
+]
+
+
+def _walk(rng, n, start, volatility):
+    """A positive random walk of n steps."""
+    steps = rng.normal(0, volatility, n)
+    return np.abs(start + np.cumsum(steps * start))
+
+
+def fred_series(rng, end, series):
+    weeks = pd.date_range("2003-01-01", end, freq="W-WED")
+    values = _walk(rng, len(weeks), rng.uniform(1e3, 1e6), 0.01).round(0)
+    return pd.DataFrame({
+        "realtime_start": end.strftime("%Y-%m-%d"),
+        "realtime_end": end.strftime("%Y-%m-%d"),
+        "date": weeks.strftime("%Y-%m-%d"),
+        "value": values.astype(int).astype(str),
+    })
+
+
+def operating_cash_balance(rng, end):
+    days = pd.bdate_range("2005-10-03", end)
+    return pd.DataFrame({
+        "record_date": days.strftime("%Y-%m-%d"),
+        "account_type": "Treasury General Account (TGA) Closing Balance",
+        "open_today_bal": _walk(rng, len(days), 5e5, 0.02).astype(int).astype(str),
+        "close_today_bal": "null",
+    })
+
+
+def deposits_withdrawals(rng, end, years=6):
+    days = pd.bdate_range(end - pd.DateOffset(years=years), end)
+    index = pd.MultiIndex.from_product(
+        [days.strftime("%Y-%m-%d"), ["Deposits", "Withdrawals"], DTS_CATEGORIES],
+        names=["record_date", "transaction_type", "transaction_catg"],
+    )
+    df = index.to_frame(index=False)
+    n = len(df)
+    df["transaction_today_amt"] = rng.integers(1, 50_000, n).astype(str)
+    df["transaction_mtd_amt"] = rng.integers(1, 500_000, n).astype(str)
+    df["transaction_fytd_amt"] = rng.integers(1, 5_000_000, n).astype(str)
+    return df
+
+
+def mts_table_4(rng, end):
+    months = pd.date_range("2010-01-31", end, freq="ME")
+    rows = []
+    for month in months:
+        for classification in MTS_CLASSIFICATIONS:
+            rows.append({
+                "record_date": month.strftime("%Y-%m-%d"),
+                "classification_desc": classification,
+                "current_month_net_rcpt_amt": str(rng.integers(1e11, 3e11)),
+                "current_month_gross_rcpt_amt": str(rng.integers(1e11, 3e11)),
+                "current_fytd_net_rcpt_amt": str(rng.integers(1e11, 3e12)),
+                "prior_fytd_net_rcpt_amt": str(rng.integers(1e11, 3e12)),
+                "record_calendar_year": str(month.year),
+                "record_calendar_month": f"{month.month:02d}",
+                "record_fiscal_year": str(month.year + (month.month >= 10)),
+            })
+    return pd.DataFrame(rows)
+
+
+def reverse_repo(rng, end):
+    # newyorkfed_pandas keeps the newest operation first
+    days = pd.bdate_range("2014-01-02", end)[::-1]
+    return pd.DataFrame({
+        "operationDate": days.strftime("%Y-%m-%d"),
+        "totalAmtAccepted": _walk(rng, len(days), 5e11, 0.03).astype(int),
+        "note": "",
+    })
+
+
+FISCALDATA_TABLES = {
+    "dts/operating_cash_balance": operating_cash_balance,
+    "dts/deposits_withdrawals_operating_cash": deposits_withdrawals,
+    "mts/mts_table_4": mts_table_4,
+}
+
+
+def frame_for(source, rng, end):
+    """Builds the stand-in DataFrame for one upstream source."""
+    if isinstance(source, upstream.FredSeries):
+        return fred_series(rng, end, source.series)
+    if isinstance(source, upstream.FiscalDataTable):
+        return FISCALDATA_TABLES[source.name](rng, end)
+    if isinstance(source, upstream.NyFedReverseRepo):
+        return reverse_repo(rng, end)
+    raise ValueError(f"No stand-in for {source.name}")
+
+
+def standin_frames(seed=0, end=None):
+    """
+    Builds the stand-in DataFrame of every upstream source.
+
+    Args:
+        seed (int): Optional. Random seed; the same seed builds the same data.
+        end (str): Optional. Last date of the data, YYYY-MM-DD. Defaults to
+            today.
+
+    Returns:
+        dict: Source name -> DataFrame, in the order of upstream.SOURCES.
+    """
+    rng = np.random.default_rng(seed)
+    end = pd.Timestamp(end) if end else pd.Timestamp.today().normalize()
+    return {source.name: frame_for(source, rng, end) for source in upstream.SOURCES}
+
+
+def write_standins(directory, seed=0, end=None):
+    """
+    Writes stand-in files for every upstream source.
+
+    Args:
+        directory (str): Directory to run the server from.
+        seed (int): Optional. Random seed; the same seed writes the same data.
+        end (str): Optional. Last date of the data, YYYY-MM-DD. Defaults to
+            today.
+
+    Returns:
+        list: The paths written.
+    """
+    frames = standin_frames(seed, end)
+
+    paths = []
+    for source in upstream.SOURCES:
+        path = os.path.join(directory, source.path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        frames[source.name].to_pickle(path)
+        paths.append(path)
+    return paths
+
+
+def date_column(source):
+    """The column of a source's DataFrame holding the record date."""
+    if isinstance(source, upstream.FredSeries):
+        return "date"
+    if isinstance(source, upstream.FiscalDataTable):
+        return "record_date"
+    return "operationDate"
+
+
+def _records(frame):
+    return json.loads(frame.to_json(orient="records"))
+
+
+class _UpstreamHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        url = urllib.parse.urlsplit(self.path)
+        params = dict(urllib.parse.parse_qsl(url.query))
+        server.requests.append(url.path)
+
+        with server.lock:
+            failure, server.failures = server.failures[:1], server.failures[1:]
+            frames = dict(server.frames)
+        if failure:
+            status, retry_after = failure[0]
+            self.send_response(status)
+            self.send_header("Retry-After", retry_after)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        body = self.body(url.path, params, frames)
+        if body is None:
+            self.send_error(404)
+            return
+        body = json.dumps(body).encode()
+        etag = '"' + hashlib.sha1(body).hexdigest()[:16] + '"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    @staticmethod
+    def body(path, params, frames):
+        """The JSON the upstream API answers with, or None if unknown."""
+        if path == urllib.parse.urlsplit(upstream.FRED_URL).path:
+            frame = frames.get(params.get("series_id"))
+            if frame is None:
+                return None
+            frame = frame[frame["date"] >= params.get("observation_start", "")]
+            return {"observations": _records(frame)}
+
+        fiscaldata = urllib.parse.urlsplit(upstream.FISCALDATA_URL).path
+        if path.startswith(fiscaldata):
+            frame = frames.get(path[len(fiscaldata):])
+            if frame is None:
+                return None
+            field, _, start = params.get("filter", "record_date:gt:").partition(":gt:")
+            frame = frame[frame[field] > start]
+            size = int(params.get("page[size]", 100))
+            number = int(params.get("page[number]", 1))
+            return {
+                "data": _records(frame.iloc[(number - 1) * size:number * size]),
+                "meta": {"total-count": len(frame), "total-pages": max(1, -(-len(frame) // size))},
+            }
+
+        if path == urllib.parse.urlsplit(upstream.NYFED_RRP_URL).path:
+            frame = frames["rrp"]
+            frame = frame[frame["operationDate"] >= params.get("startDate", "")]
+            return {"repo": {"operations": _records(frame)}}
+        return None
+
+    def log_message(self, format, *args):
+        pass
+
+
+class UpstreamStandin(http.server.ThreadingHTTPServer):
+    """
+    A local HTTP server answering like the upstream APIs, from stand-in
+    DataFrames. Responses carry an ETag, and a request sending it back
+    with If-None-Match is answered 304 Not Modified.
+
+    Args:
+        frames (dict): Optional. Source name -> DataFrame served, in the
+            format of standin_frames(), which builds the default.
+        host (str): Optional. Address to listen on.
+        port (int): Optional. Port to listen on; a free one by default.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, frames=None, host="127.0.0.1", port=0):
+        super().__init__((host, port), _UpstreamHandler)
+        self.frames = standin_frames() if frames is None else dict(frames)
+        self.failures = []
+        self.requests = []
+        self.lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def host_map(self):
+        """The host_map that points RequestsTransport at this server."""
+        return {
+            f"{url.scheme}://{url.netloc}": self.url
+            for url in map(urllib.parse.urlsplit, (
+                upstream.FRED_URL, upstream.FISCALDATA_URL, upstream.NYFED_RRP_URL
+            ))
+        }
+
+    def publish(self, name, frame):
+        """Serves frame as the data of source name from now on."""
+        with self.lock:
+            self.frames[name] = frame
+
+    def fail_next(self, count, status=503, retry_after="0"):
+        """Answers the next count requests with status and Retry-After."""
+        with self.lock:
+            self.failures.extend([(status, retry_after)] * count)
+
+    def start(self):
+        """Serves in a background thread; returns the server."""
+        self._thread = threading.Thread(
+            target=self.serve_forever, name="upstream-standin", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def check(end="2024-06-28", days=45):
+    """
+    Refreshes stand-in files missing their last days through RefreshClient
+    and an UpstreamStandin, in a temporary directory, and checks that:
+    every source is updated with the missing rows; a second refresh finds
+    nothing new, whether answered 200 or 304; a revised value is an update
+    without new rows; and 503s with Retry-After are retried.
+
+    Raises:
+        AssertionError: If a refresh reports something else.
+    """
+    frames = standin_frames(end=end)
+    cutoff = (pd.Timestamp(end) - pd.Timedelta(days=days)).strftime("%Y-%m-%d")
+    cwd = os.getcwd()
+    os.environ.setdefault("FRED_API_KEY", "standin")
+    with tempfile.TemporaryDirectory() as directory, UpstreamStandin(frames) as server:
+        os.chdir(directory)
+        try:
+            for source in upstream.SOURCES:
+                frame = frames[source.name]
+                os.makedirs(os.path.dirname(source.path) or ".", exist_ok=True)
+                frame[frame[date_column(source)] <= cutoff].to_pickle(source.path)
+
+            client = upstream.RefreshClient(
+                upstream.RequestsTransport(host_map=server.host_map)
+            )
+
+            def refresh(sources=upstream.SOURCES):
+                return {result.source: result for result in client.refresh(sources)}
+
+            paths = {source.name: source.path for source in upstream.SOURCES}
+            for name, result in refresh().items():
+                assert result.status == "updated" and result.new_rows > 0, result
+                assert len(pd.read_pickle(paths[name])) == len(frames[name]), (
+                    f"{name}: rows missing after refresh"
+                )
+            for _ in range(2):
+                for result in refresh().values():
+                    assert result.status == "not-modified", result
+            assert server.requests, "nothing was requested"
+
+            walcl = next(source for source in upstream.SOURCES if source.name == "WALCL")
+            revised = frames["WALCL"].copy()
+            revised.loc[revised.index[-1], "value"] = "1"
+            server.publish("WALCL", revised)
+            result = refresh([walcl])["WALCL"]
+            assert result.status == "updated" and result.new_rows == 0, result
+            assert pd.read_pickle(walcl.path)["value"].iloc[-1] == "1", "revision not written"
+
+            server.fail_next(2)
+            result = refresh([walcl])["WALCL"]
+            assert result.status == "not-modified" and result.requests_made == 3, result
+        finally:
+            os.chdir(cwd)
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["check"]:
+        check()
+        print("Refreshes through the HTTP stand-in: ok")
+    elif len(sys.argv) == 2:
+        paths = write_standins(sys.argv[1])
+        print(f"Wrote {len(paths)} stand-in files to {sys.argv[1]}")
+    else:
+        sys.exit("usage: python standins.py DIRECTORY | check")
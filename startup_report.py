@@ -0,0 +1,155 @@
+"""
+Startup profiling for the FastAPI backend.
+
+Import-time report for main.py, per module with self and cumulative times
+(from `python -X importtime`) and summed by top-level package:
+
+    python startup_report.py imports [--top 30]
+
+Cold-start benchmark: launches uvicorn and measures the time from process
+launch to the first byte of /widgets.json:
+
+    python startup_report.py ttfb [--runs 5]
+
+Run both from the directory holding the data pickles, as for the server.
+They use the current environment, so compare the startup modes with e.g.
+
+    LAZY_IMPORTS=0 python startup_report.py ttfb
+    LAZY_IMPORTS=1 python startup_report.py ttfb
+"""
+
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def _env():
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        p for p in [ROOT, env.get("PYTHONPATH")] if p
+    )
+    return env
+
+
+def import_times(module="main"):
+    """
+    Imports a module in a fresh interpreter with -X importtime.
+
+    Args:
+        module (str): The module to import.
+
+    Returns:
+        list: (name, depth, self_us, cumulative_us) per imported module, in
+        the order their imports finished.
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        env=_env(),
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{proc.stderr[-2000:]}")
+
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((name.strip(), depth, int(self_us), int(cumulative_us)))
+    return rows
+
+
+def print_imports(top):
+    rows = import_times()
+    total = sum(self_us for _, _, self_us, _ in rows)
+    print(f"import main: {total / 1000:.0f} ms, {len(rows)} modules\n")
+
+    print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+    for name, _, self_us, cumulative_us in sorted(rows, key=lambda r: -r[3])[:top]:
+        print(f"{cumulative_us / 1000:14.1f} {self_us / 1000:9.1f}  {name}")
+
+    packages = {}
+    for name, _, self_us, _ in rows:
+        package = name.split(".")[0]
+        packages[package] = packages.get(package, 0) + self_us
+
+    print(f"\n{'total ms':>14}  package")
+    for package, self_us in sorted(packages.items(), key=lambda p: -p[1])[:top]:
+        print(f"{self_us / 1000:14.1f}  {package}")
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def time_to_first_byte(path="/widgets.json", timeout=120):
+    """
+    Launches the server and waits for the first byte of a response.
+
+    Returns:
+        float: Seconds from process launch to the first response byte.
+    """
+    port = _free_port()
+    url = f"http://127.0.0.1:{port}{path}"
+
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app",
+         "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        env=_env(),
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            if proc.poll() is not None:
+                raise RuntimeError(f"server exited with code {proc.returncode}")
+            try:
+                with urllib.request.urlopen(url, timeout=timeout) as response:
+                    response.read(1)
+                    return time.perf_counter() - start
+            except (urllib.error.URLError, ConnectionError):
+                time.sleep(0.005)
+        raise RuntimeError(f"no response from {url} after {timeout} s")
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def print_ttfb(runs):
+    mode = "lazy" if os.environ.get("LAZY_IMPORTS") == "1" else "eager"
+    times = []
+    for i in range(runs):
+        times.append(time_to_first_byte())
+        print(f"run {i + 1}: {times[-1] * 1000:.0f} ms")
+    print(
+        f"\n/widgets.json time to first byte ({mode} imports, {runs} runs): "
+        f"min {min(times) * 1000:.0f} ms, median {statistics.median(times) * 1000:.0f} ms"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Startup profiling")
+    commands = parser.add_subparsers(dest="command", required=True)
+    imports = commands.add_parser("imports", help="import-time report for main.py")
+    imports.add_argument("--top", type=int, default=30)
+    ttfb = commands.add_parser("ttfb", help="cold-start time to first byte")
+    ttfb.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.command == "imports":
+        print_imports(args.top)
+    else:
+        print_ttfb(args.runs)
@@ -0,0 +1,447 @@
+"""
+Incremental refresh client for the upstream data sources.
+
+Refreshes the pickles that fred_pandas, treasury_gov_pandas and
+newyorkfed_pandas read, so the rest of the backend keeps using their
+load functions with update=False. Compared to calling those libraries with
+update=True, this client:
+
+- shares one pooled HTTP session between all requests,
+- refreshes sources concurrently with a bounded number of workers,
+- only asks for records after the last cached date and sends
+  If-None-Match / If-Modified-Since validators from the previous refresh,
+- retries transient failures with exponential backoff.
+
+The HTTP layer is a pluggable transport. RequestsTransport(host_map=...)
+redirects upstream hosts to a local stand-in server (see
+standins.UpstreamStandin), and any object with a compatible get() method
+can replace it entirely.
+
+Usage:
+    python upstream.py            # refresh every source
+    python upstream.py WALCL rrp  # refresh selected sources
+"""
+
+import concurrent.futures
+import email.utils
+import json
+import os
+import pathlib
+import random
+import sys
+import threading
+import time
+
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+from treasury_gov_pandas.load import url_to_path
+
+import datasets
+import _fed_balance_sheet
+
+FRED_URL = "https://api.stlouisfed.org/fred/series/observations"
+FISCALDATA_URL = "https://api.fiscaldata.treasury.gov/services/api/fiscal_service/v1/accounting/"
+NYFED_RRP_URL = "https://markets.newyorkfed.org/api/rp/reverserepo/propositions/search.json"
+
+FRED_PKL_PATH = "pkl"
+VALIDATORS_PATH = os.path.join(FRED_PKL_PATH, "_validators.json")
+
+MAX_WORKERS = int(os.environ.get("UPSTREAM_MAX_WORKERS", "4"))
+MAX_RETRIES = int(os.environ.get("UPSTREAM_MAX_RETRIES", "4"))
+BACKOFF_BASE = float(os.environ.get("UPSTREAM_BACKOFF_BASE", "0.5"))
+TIMEOUT = float(os.environ.get("UPSTREAM_TIMEOUT", "30"))
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class UpstreamResponse:
+    """Minimal response returned by transports."""
+
+    def __init__(self, status_code, headers, content):
+        self.status_code = status_code
+        self.headers = {k.lower(): v for k, v in (headers or {}).items()}
+        self.content = content
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class RequestsTransport:
+    """
+    Pooled HTTP transport based on a shared requests.Session.
+
+    Args:
+        pool_size (int): Optional. Connections kept open per host.
+        host_map (dict): Optional. Maps upstream base URLs to replacements,
+            e.g. {"https://api.stlouisfed.org": "http://127.0.0.1:8001"}.
+    """
+
+    def __init__(self, pool_size=MAX_WORKERS, host_map=None):
+        self.host_map = host_map or {}
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def get(self, url, params=None, headers=None, timeout=TIMEOUT):
+        for source, target in self.host_map.items():
+            if url.startswith(source):
+                url = target + url[len(source):]
+                break
+        response = self.session.get(url, params=params, headers=headers, timeout=timeout)
+        return UpstreamResponse(response.status_code, response.headers, response.content)
+
+
+class RefreshResult:
+    """Outcome of refreshing one source."""
+
+    def __init__(self, source, status, new_rows=0, bytes_received=0, requests_made=0, error=None):
+        self.source = source
+        self.status = status  # "updated", "not-modified" or "failed"
+        self.new_rows = new_rows
+        self.bytes_received = bytes_received
+        self.requests_made = requests_made
+        self.error = error
+
+    def __repr__(self):
+        return (
+            f"{self.source}: {self.status}, {self.new_rows} rows, "
+            f"{self.bytes_received:,} bytes in {self.requests_made} requests"
+            + (f" ({self.error})" if self.error else "")
+        )
+
+
+class RefreshClient:
+    """
+    Refreshes sources with pooled, conditional, retried requests.
+
+    Args:
+        transport: Optional. Object with a get(url, params, headers, timeout)
+            method returning an UpstreamResponse. Defaults to RequestsTransport.
+        max_workers (int): Optional. Sources refreshed concurrently.
+        validators_path (str): Optional. Where ETag/Last-Modified values of
+            previous refreshes are stored.
+    """
+
+    def __init__(self, transport=None, max_workers=MAX_WORKERS, validators_path=VALIDATORS_PATH):
+        self.transport = transport or RequestsTransport(pool_size=max_workers)
+        self.max_workers = max_workers
+        self.validators_path = validators_path
+        self._validators_lock = threading.Lock()
+        self._validators = self._read_validators()
+
+    def _read_validators(self):
+        try:
+            with open(self.validators_path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_validators(self):
+        pathlib.Path(self.validators_path).parent.mkdir(parents=True, exist_ok=True)
+        with open(self.validators_path, "w") as f:
+            json.dump(self._validators, f, indent=2, sort_keys=True)
+
+    def fetch(self, url, params, stats, conditional_key=None):
+        """
+        GETs url with retries, sending stored validators if conditional_key
+        is given.
+
+        Args:
+            url (str): The URL to fetch.
+            params (dict): The query parameters.
+            stats (RefreshResult): Receives request and byte counts.
+            conditional_key (str): Optional. Key of the stored validators.
+
+        Returns:
+            UpstreamResponse: The response, or None if it was 304 Not Modified.
+        """
+        headers = {"Accept-Encoding": "gzip"}
+        request_key = json.dumps(params, sort_keys=True, default=str)
+        if conditional_key:
+            with self._validators_lock:
+                validators = self._validators.get(conditional_key, {})
+            # Validators only apply to the exact same request
+            if validators.get("request") != request_key:
+                validators = {}
+            if validators.get("etag"):
+                headers["If-None-Match"] = validators["etag"]
+            if validators.get("last_modified"):
+                headers["If-Modified-Since"] = validators["last_modified"]
+
+        for attempt in range(MAX_RETRIES + 1):
+            try:
+                response = self.transport.get(url, params=params, headers=headers, timeout=TIMEOUT)
+            except (requests.ConnectionError, requests.Timeout, OSError):
+                if attempt == MAX_RETRIES:
+                    raise
+                time.sleep(self._backoff(attempt))
+                continue
+
+            stats.requests_made += 1
+            stats.bytes_received += len(response.content or b"")
+
+            if response.status_code in RETRY_STATUSES and attempt < MAX_RETRIES:
+                time.sleep(self._backoff(attempt, response.headers.get("retry-after")))
+                continue
+            break
+
+        if response.status_code == 304:
+            return None
+        if response.status_code != 200:
+            raise RuntimeError(f"{url} returned status {response.status_code}")
+
+        if conditional_key:
+            with self._validators_lock:
+                self._validators[conditional_key] = {
+                    "request": request_key,
+                    "etag": response.headers.get("etag"),
+                    "last_modified": response.headers.get("last-modified"),
+                }
+        return response
+
+    @staticmethod
+    def _backoff(attempt, retry_after=None):
+        """Seconds to wait before the next attempt."""
+        if retry_after:
+            try:
+                return float(retry_after)
+            except ValueError:
+                parsed = email.utils.parsedate_to_datetime(retry_after)
+                if parsed is not None:
+                    return max(0.0, parsed.timestamp() - time.time())
+        return BACKOFF_BASE * (2 ** attempt) * (1 + random.random())
+
+    def refresh(self, sources=None):
+        """
+        Refreshes sources concurrently and expires affected datasets, which
+        are then reloaded in the background while the old snapshots are
+        still served.
+
+        Args:
+            sources (list): Optional. Sources to refresh. Defaults to SOURCES.
+
+        Returns:
+            list: A RefreshResult per source.
+        """
+        sources = SOURCES if sources is None else sources
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            results = list(executor.map(self._refresh_one, sources))
+
+        with self._validators_lock:
+            self._write_validators()
+
+        changed = set()
+        for source, result in zip(sources, results):
+            if result.status == "updated":
+                changed.update(source.invalidates)
+        for name in changed:
+            datasets.expire(name)
+        return results
+
+    def _refresh_one(self, source):
+        stats = RefreshResult(source.name, "not-modified")
+        try:
+            stats.new_rows = source.refresh(self, stats)
+            if stats.new_rows is not None:
+                stats.status = "updated"
+            else:
+                stats.new_rows = 0
+        except Exception as e:
+            stats.status = "failed"
+            stats.error = str(e)
+        return stats
+
+
+def _read_pickle(path):
+    return pd.read_pickle(path) if os.path.isfile(path) else None
+
+
+def _merge(kept, replaced, new, new_first=False):
+    """
+    Puts re-fetched rows in place of the cached rows they replace.
+
+    Args:
+        kept (DataFrame): Cached rows that were not re-fetched.
+        replaced (DataFrame): Cached rows that were re-fetched.
+        new (DataFrame): The rows fetched.
+        new_first (bool): Optional. True if the newest rows come first.
+
+    Returns:
+        tuple: (frame, number of rows added), or None if the fetched rows
+        are the replaced ones, in any order.
+    """
+    if len(new) == len(replaced) and set(new.columns) == set(replaced.columns):
+        columns = list(new.columns)
+
+        def rows(df):
+            return df[columns].astype(str).sort_values(columns).reset_index(drop=True)
+
+        if rows(replaced).equals(rows(new)):
+            return None
+    parts = [new, kept] if new_first else [kept, new]
+    return pd.concat(parts, ignore_index=True), len(new) - len(replaced)
+
+
+def _write_pickle(df, path):
+    # Write to a temporary file first so readers never see a partial pickle
+    pathlib.Path(path).parent.mkdir(parents=True, exist_ok=True)
+    tmp = f"{path}.tmp"
+    df.to_pickle(tmp)
+    os.replace(tmp, path)
+
+
+class FredSeries:
+    """A FRED series cached by fred_pandas in pkl/<series>.pkl."""
+
+    def __init__(self, series, invalidates=()):
+        self.name = series
+        self.series = series
+        self.invalidates = tuple(invalidates)
+        self.path = os.path.join(FRED_PKL_PATH, f"{series}.pkl")
+
+    def refresh(self, client, stats):
+        """Returns the number of new rows, or None if no row was added or revised."""
+        cached = _read_pickle(self.path)
+        params = {"series_id": self.series, "file_type": "json", "api_key": os.environ["FRED_API_KEY"]}
+        if cached is not None and not cached.empty:
+            # Re-request the last cached observation, which may be revised
+            params["observation_start"] = cached["date"].iloc[-1]
+
+        response = client.fetch(FRED_URL, params, stats, conditional_key=f"fred:{self.series}")
+        if response is None:
+            return None
+        new = pd.DataFrame(response.json()["observations"])
+        if new.empty:
+            return None
+
+        if cached is not None and not cached.empty:
+            older = cached["date"] < params["observation_start"]
+            merged = _merge(cached[older], cached[~older], new)
+            if merged is None:
+                return None
+            df, added = merged
+        else:
+            df, added = new, len(new)
+        _write_pickle(df, self.path)
+        return added
+
+
+class FiscalDataTable:
+    """A fiscaldata.treasury.gov table cached by treasury_gov_pandas."""
+
+    def __init__(self, endpoint, lookback=2, page_size=10000, invalidates=()):
+        self.name = endpoint
+        self.url = FISCALDATA_URL + endpoint
+        self.lookback = lookback
+        self.page_size = page_size
+        self.invalidates = tuple(invalidates)
+        self.path = url_to_path(self.url)
+
+    def refresh(self, client, stats):
+        """Returns the number of new rows, or None if no row was added or revised."""
+        cached = _read_pickle(self.path)
+        start = "1900-01-01"
+        if cached is not None and not cached.empty:
+            dates = cached["record_date"].unique()
+            # Same revision window as treasury_gov_pandas.load_records
+            start = dates[-min(self.lookback, len(dates))]
+
+        rows = []
+        page, total_pages = 1, 1
+        while page <= total_pages:
+            params = {
+                "filter": f"record_date:gt:{start}",
+                "page[size]": self.page_size,
+                "page[number]": page,
+            }
+            response = client.fetch(
+                self.url, params, stats,
+                conditional_key=f"fiscaldata:{self.name}" if page == 1 else None,
+            )
+            if response is None:
+                return None
+            result = response.json()
+            rows.extend(result["data"])
+            total_pages = result.get("meta", {}).get("total-pages") or 1
+            page += 1
+
+        if not rows:
+            return None
+        new = pd.DataFrame(rows)
+        if cached is not None and not cached.empty:
+            older = cached["record_date"] <= start
+            merged = _merge(cached[older], cached[~older], new)
+            if merged is None:
+                return None
+            df, added = merged
+        else:
+            df, added = new, len(new)
+        _write_pickle(df, self.path)
+        return added
+
+
+class NyFedReverseRepo:
+    """New York Fed reverse repo operations cached by newyorkfed_pandas."""
+
+    def __init__(self, invalidates=()):
+        self.name = "rrp"
+        self.path = "rrp.pkl"
+        self.invalidates = tuple(invalidates)
+
+    def refresh(self, client, stats):
+        """Returns the number of new rows, or None if no row was added or revised."""
+        cached = _read_pickle(self.path)
+        start = "1900-01-01"
+        if cached is not None and not cached.empty:
+            # The pickle is ordered newest first
+            start = cached["operationDate"].max()
+
+        response = client.fetch(NYFED_RRP_URL, {"startDate": start}, stats, conditional_key="nyfed:rrp")
+        if response is None:
+            return None
+        new = pd.DataFrame(response.json()["repo"]["operations"])
+        if new.empty:
+            return None
+
+        if cached is not None and not cached.empty:
+            older = cached["operationDate"] < start
+            merged = _merge(cached[older], cached[~older], new, new_first=True)
+            if merged is None:
+                return None
+            df, added = merged
+        else:
+            df, added = new, len(new)
+        _write_pickle(df, self.path)
+        return added
+
+
+SOURCES = (
+    [
+        FredSeries(series, invalidates=["fed_balance_sheet_levels"])
+        for series in _fed_balance_sheet.series_items
+    ]
+    + [
+        FredSeries("WALCL", invalidates=["fed_net_liquidity"]),
+        FredSeries("RESPPLLOPNWW", invalidates=["fed_net_liquidity"]),
+        NyFedReverseRepo(invalidates=["fed_net_liquidity"]),
+        FiscalDataTable("dts/operating_cash_balance", lookback=2, invalidates=["fed_net_liquidity"]),
+        FiscalDataTable("dts/deposits_withdrawals_operating_cash", lookback=10, invalidates=["dts_deposits_withdrawals"]),
+        FiscalDataTable("mts/mts_table_4", lookback=10, invalidates=["mts_table_4"]),
+    ]
+)
+
+
+if __name__ == "__main__":
+    names = set(sys.argv[1:])
+    selected = [s for s in SOURCES if not names or s.name in names]
+    started = time.perf_counter()
+    results = RefreshClient().refresh(selected)
+    for result in results:
+        print(result)
+    print(
+        f"{sum(r.bytes_received for r in results):,} bytes in "
+        f"{sum(r.requests_made for r in results)} requests, "
+        f"{time.perf_counter() - started:.1f}s"
+    )
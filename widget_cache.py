@@ -0,0 +1,524 @@
+"""
+Cache of widget responses, served stale-while-revalidate.
+
+Widgets registered with register_widget(..., inputs=[...]) have their
+successful responses stored, precompressed and with an ETag. The key is
+the endpoint, the query parameters and whether the client accepts typed
+arrays; each entry also records artifacts.version_of(inputs) at the time it
+was built.
+
+An entry is fresh while its inputs keep that version and it is younger than
+RESPONSE_MAX_AGE seconds (handlers default some parameters relative to
+today). A stale entry is still served at once, while one background task
+per key rebuilds it through the rest of the application. Only entries older
+than RESPONSE_MAX_AGE + RESPONSE_MAX_STALE seconds, and missing ones, are
+built before answering. Because the version only changes for widgets
+downstream of a reloaded dataset (see artifacts.py), a TGA refresh makes the
+net-liquidity responses stale and leaves the MTS responses fresh.
+
+Chart responses are stored as a theme-independent trace segment, keyed
+without the theme parameter, plus a small layout part per theme (see
+figure_segments.py). A theme toggle is answered by rewriting the themed
+layout values of a current segment, without calling the handler, and the
+traces are held once for both themes.
+
+Responses carry "Cache-Control: max-age=0, stale-while-revalidate=<max
+stale>", so browsers and intermediaries may likewise show their copy while
+they revalidate it with its ETag. Hits are answered by the middleware
+itself, in front of the admission gates, with compressed variants, and on
+the event loop: only loading datasets and building responses go to worker
+threads.
+
+Most requests use a widget's default parameters, so those responses are
+pre-rendered, for both themes, before anyone asks: for every widget when the
+server starts (see start_prerender()), and for the widgets downstream of a
+dataset whenever it is loaded or reloaded. Pre-rendering sends the requests
+through the whole application, one at a time, and rebuilds stale entries
+instead of serving them. Set PRERENDER=0 to turn it off.
+
+With a shared cache backend (see cache_backends.py), every response built
+is also written to it, keyed by its request and the version of its inputs,
+and a response missing here is taken from there, if it is younger than
+RESPONSE_MAX_AGE, before the handler is called. As dataset versions are
+content hashes, machines holding the same data share their responses.
+"""
+
+import asyncio
+import collections
+import functools
+import inspect
+import os
+import time
+import urllib.parse
+
+from fastapi import Request
+from starlette.concurrency import run_in_threadpool
+
+import admission
+import artifacts
+import cache_backends
+import cache_registry
+import datasets
+import figure_encoding
+import figure_segments
+from figure_encoding import client_accepts_typed_arrays
+from registry import WIDGET_HANDLERS, WIDGET_INPUTS, WIDGETS
+from response_store import StoredResponse, serve
+
+MAX_AGE = float(os.environ.get("RESPONSE_MAX_AGE", "3600"))
+MAX_STALE = float(os.environ.get("RESPONSE_MAX_STALE", "86400"))
+
+CACHE_CONTROL = f"max-age=0, stale-while-revalidate={int(MAX_STALE)}"
+
+PRERENDER = os.environ.get("PRERENDER", "1") != "0"
+
+# Recent builds kept per widget for build_stats()
+BUILD_SAMPLES = 200
+
+# Full key -> StoredResponse, or SplicedResponse for charts
+WIDGET_STORE = cache_registry.Cache("widget_responses")
+
+
+def _drop_spliced(trace_key, segment):
+    """Drops the responses that keep an evicted trace segment alive."""
+    WIDGET_STORE.discard(
+        lambda key: is_themed(key[0]) and _trace_key(key) == trace_key
+    )
+
+
+# Key without the theme -> TraceSegment of a chart. The SplicedResponses in
+# WIDGET_STORE do not count the segment they use, so evicting it drops them.
+TRACE_STORE = cache_registry.Cache("figure_traces", on_evict=_drop_spliced)
+
+# Response headers that are recomputed when serving from the store
+_DROP_HEADERS = {"content-length", "content-type", "content-encoding", "etag", "cache-control"}
+
+# Keys being rebuilt in the background, and the tasks doing it
+_rebuilding = set()
+_tasks = set()
+
+# Endpoint -> (seconds inside the admission gate, body bytes) of its recent
+# successful builds
+_builds = collections.defaultdict(lambda: collections.deque(maxlen=BUILD_SAMPLES))
+
+# Set in the scope of pre-render requests, which must not be served stale
+_PRERENDER_SCOPE = "widget_cache.prerender"
+
+# The application and event loop pre-render requests are sent through, and
+# the widgets waiting to be pre-rendered, in order
+_app = None
+_loop = None
+_queue = []
+_prerendering = None
+
+
+def key_for(endpoint, params, typed):
+    """
+    The key of a widget response.
+
+    Args:
+        endpoint (str): The widget endpoint.
+        params (list): (name, value) pairs of the query parameters, as strings.
+        typed (bool): Whether the client accepts typed arrays.
+    """
+    if not is_themed(endpoint):
+        # Clients send the theme to every widget; only charts use it
+        params = [p for p in params if p[0] != "theme"]
+    return (endpoint, tuple(sorted(params)), typed)
+
+
+def _key(endpoint, request):
+    return key_for(
+        endpoint,
+        request.query_params.multi_items(),
+        client_accepts_typed_arrays(request.headers),
+    )
+
+
+def _trace_key(key):
+    endpoint, params, typed = key
+    return (endpoint, tuple(p for p in params if p[0] != "theme"), typed)
+
+
+@functools.lru_cache(maxsize=None)
+def is_themed(endpoint):
+    """Whether a widget takes a theme parameter, and so may be spliced."""
+    handler = WIDGET_HANDLERS.get(endpoint)
+    return handler is not None and "theme" in inspect.signature(handler).parameters
+
+
+def _age(stored):
+    return time.time() - stored.created
+
+
+def is_fresh(stored, version):
+    """Whether a stored response can be served without a rebuild."""
+    return stored.version == version and _age(stored) <= MAX_AGE
+
+
+def is_usable(stored):
+    """Whether a stored response can be served, possibly stale."""
+    return stored is not None and _age(stored) <= MAX_AGE + MAX_STALE
+
+
+async def _request_body():
+    return {"type": "http.request", "body": b"", "more_body": False}
+
+
+def _store(key, version, messages, cost):
+    """Stores a captured 200 response; see store()."""
+    headers = [
+        (name.decode("latin-1"), value.decode("latin-1"))
+        for name, value in messages[0].get("headers", [])
+    ]
+    body = b"".join(m.get("body", b"") for m in messages[1:])
+    return store(key, version, body, headers, cost)
+
+
+def store(key, version, body, headers, cost):
+    """
+    Stores a 200 response, with its compressed variants, and shares it
+    through the cache backend if there is one.
+
+    Args:
+        key (tuple): The key, see key_for().
+        version (str): artifacts.version_of() the widget's inputs.
+        body (bytes): The response body.
+        headers (list): (name, value) pairs of the response headers.
+        cost (float): Seconds it took to build.
+
+    Returns:
+        StoredResponse: Or SplicedResponse for a chart of a themed endpoint.
+    """
+    media_type = "application/json"
+    kept = {}
+    for name, value in headers:
+        if name.lower() == "content-type":
+            media_type = value
+        elif name.lower() not in _DROP_HEADERS:
+            kept[name.title()] = value
+    kept["Cache-Control"] = CACHE_CONTROL
+    headers = kept
+
+    stored = _keep(key, version, body, media_type, headers, cost)
+    if cache_backends.BACKEND is not None:
+        cache_backends.store(
+            _backend_key(key, version),
+            (body, media_type, headers, stored.created),
+            ttl=MAX_AGE,
+        )
+    return stored
+
+
+def _backend_key(key, version):
+    endpoint, params, typed = key
+    return cache_backends.key("response", endpoint, params, typed, version)
+
+
+def _fetch(key, version):
+    """
+    Stores the response for key from the cache backend, if it holds one
+    built from version less than MAX_AGE seconds ago.
+
+    Returns:
+        StoredResponse: Or SplicedResponse, or None.
+    """
+    start = time.perf_counter()
+    shared = cache_backends.fetch(_backend_key(key, version))
+    if shared is None:
+        return None
+    body, media_type, headers, created = shared
+    if time.time() - created > MAX_AGE:
+        return None
+    # Ages from when it was built, as handlers default parameters to today
+    return _keep(
+        key, version, body, media_type, headers, time.perf_counter() - start, created
+    )
+
+
+def lookup(key, version):
+    """
+    Returns the fresh response for key, if one is stored, can be rethemed
+    from a chart of another theme, or is held by the cache backend; or
+    None. For requests answered outside the middleware, e.g. the items of
+    a batch; blocks on the cache backend, so call it from a worker thread.
+    """
+    stored = WIDGET_STORE.get(key)
+    if stored is not None and is_fresh(stored, version):
+        return stored
+    if is_themed(key[0]):
+        stored = _retheme(key, dict(key[1]).get("theme", "dark"), version)
+        if stored is not None:
+            return stored
+    if cache_backends.BACKEND is not None:
+        return _fetch(key, version)
+    return None
+
+
+def _retheme(key, theme, version):
+    """
+    Stores the response for key from the current trace segment of another
+    theme, without calling the handler.
+
+    Returns:
+        SplicedResponse: The response, or None if no current segment.
+    """
+    segment = TRACE_STORE.get(_trace_key(key))
+    if segment is None or not is_fresh(segment, version):
+        return None
+    start = time.perf_counter()
+    stored = figure_segments.SplicedResponse(
+        segment, figure_segments.retheme(segment.layout, theme)
+    )
+    WIDGET_STORE.put(key, stored, cost=time.perf_counter() - start, size=stored.size)
+    return stored
+
+
+def _keep(key, version, body, media_type, headers, cost, created=None):
+    """
+    Stores a response body in WIDGET_STORE, and TRACE_STORE for charts.
+
+    Args:
+        created (float): Optional. When the body was built; now by default.
+    """
+    created = time.time() if created is None else created
+    parts = figure_segments.split(body) if is_themed(key[0]) else None
+    if parts is None:
+        stored = StoredResponse(body, media_type, headers, version)
+        stored.created = created
+    else:
+        data, layout = parts
+        trace_key = _trace_key(key)
+        segment = TRACE_STORE.get(trace_key)
+        if segment is None or segment.version != version or not segment.has_data(data):
+            segment = figure_segments.TraceSegment(data, layout, version, headers, media_type)
+            segment.created = created
+            TRACE_STORE.put(trace_key, segment, cost=cost, size=segment.size)
+        else:
+            # The build found the same traces, so they are as recent as it
+            segment.created = max(segment.created, created)
+        stored = figure_segments.SplicedResponse(segment, layout)
+
+    WIDGET_STORE.put(key, stored, cost=cost, size=stored.size)
+    return stored
+
+
+class WidgetCacheMiddleware:
+    """ASGI middleware that serves, stores and revalidates cached widgets."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "GET":
+            return await self.app(scope, receive, send)
+
+        endpoint = scope["path"].lstrip("/")
+        inputs = WIDGET_INPUTS.get(endpoint)
+        if inputs is None:
+            return await self.app(scope, receive, send)
+
+        request = Request(scope)
+        try:
+            # Only leaves the event loop when datasets have to be loaded
+            version = await artifacts.aversion_of(inputs)
+        except Exception:
+            # Let the handler report the error in its own way
+            return await self.app(scope, receive, send)
+        key = _key(endpoint, request)
+
+        stored = WIDGET_STORE.get(key)
+        if stored is None or not is_fresh(stored, version):
+            rethemed = (
+                _retheme(key, request.query_params.get("theme", "dark"), version)
+                if is_themed(endpoint) else None
+            )
+            if rethemed is not None:
+                stored = rethemed
+            elif is_usable(stored) and not scope.get(_PRERENDER_SCOPE):
+                self._revalidate(scope, key, version)
+            else:
+                stored, messages = await self._build(scope, receive, key, version)
+                if stored is None:
+                    for message in messages:
+                        await send(message)
+                    return
+
+        response = serve(stored, request)
+        await response(scope, receive, send)
+
+    async def _build(self, scope, receive, key, version):
+        """
+        Runs the handler and stores its response if it succeeded, unless
+        the cache backend holds the response already.
+
+        Returns:
+            tuple: The StoredResponse or SplicedResponse, or None if the
+            response was not a 200, and the captured ASGI messages.
+        """
+        if cache_backends.BACKEND is not None:
+            stored = await run_in_threadpool(_fetch, key, version)
+            if stored is not None:
+                return stored, []
+
+        messages = []
+
+        async def capture(message):
+            messages.append(message)
+
+        start = time.perf_counter()
+        await self.app(scope, receive, capture)
+        cost = time.perf_counter() - start
+
+        if not messages or messages[0]["status"] != 200:
+            return None, messages
+        size = sum(len(m.get("body", b"")) for m in messages[1:])
+        # Budgets are calibrated on builds alone, not on waits for a slot
+        _builds[key[0]].append((scope.get(admission.SERVICE_TIME_SCOPE, cost), size))
+
+        # Compressing large bodies takes a while, so keep it off the event loop
+        stored = await run_in_threadpool(_store, key, version, messages, cost)
+        return stored, messages
+
+    def _revalidate(self, scope, key, version):
+        """Rebuilds a stale response in the background, once per key."""
+        if key in _rebuilding:
+            return
+        _rebuilding.add(key)
+
+        async def rebuild():
+            try:
+                await self._build(dict(scope), _request_body, key, version)
+            finally:
+                _rebuilding.discard(key)
+
+        task = asyncio.ensure_future(rebuild())
+        _tasks.add(task)
+        task.add_done_callback(_tasks.discard)
+
+
+def build_stats():
+    """
+    Measures the recent builds of every widget, as served: the time spent
+    inside the admission gate, without any wait in its queue, excluding
+    cache hits.
+
+    Returns:
+        dict: Endpoint -> builds, p95_ms and max_bytes.
+    """
+    stats = {}
+    for endpoint, builds in list(_builds.items()):
+        builds = list(builds)
+        times = sorted(cost * 1000 for cost, _ in builds)
+        stats[endpoint] = {
+            "builds": len(builds),
+            "p95_ms": times[min(len(times) - 1, int(round(0.95 * len(times))) - 1)],
+            "max_bytes": max(size for _, size in builds),
+        }
+    return stats
+
+
+def default_queries(endpoint):
+    """
+    Returns the requests a widget is pre-rendered for: its default
+    parameters with each theme, without and, unless figures are always
+    text, with typed arrays.
+
+    Returns:
+        list: (query string, accepts typed arrays) tuples.
+    """
+    params = {}
+    for param in WIDGETS[endpoint].get("params", []):
+        value = param.get("value")
+        if value is not None:
+            params[param["paramName"]] = str(value).lower() if isinstance(value, bool) else value
+    themes = figure_segments.THEMES if is_themed(endpoint) else (None,)
+    typed = (False,) if figure_encoding.ENCODING_MODE == "text" else (False, True)
+
+    queries = []
+    for theme in themes:
+        query = dict(params) if theme is None else {**params, "theme": theme}
+        for accepts in typed:
+            queries.append((urllib.parse.urlencode(query), accepts))
+    return queries
+
+
+async def _discard(message):
+    pass
+
+
+async def prerender(endpoint):
+    """Builds and stores the default responses of a widget, unless fresh."""
+    for query, typed in default_queries(endpoint):
+        headers = [(b"host", b"prerender")]
+        if typed:
+            headers.append((figure_encoding.TYPED_ARRAYS_HEADER.encode(), b"1"))
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": "GET",
+            "scheme": "http",
+            "path": f"/{endpoint}",
+            "raw_path": f"/{endpoint}".encode(),
+            "root_path": "",
+            "query_string": query.encode(),
+            "headers": headers,
+            "client": None,
+            "server": None,
+            _PRERENDER_SCOPE: True,
+        }
+        await _app(scope, _request_body, _discard)
+
+
+async def _drain():
+    while _queue:
+        endpoint = _queue.pop(0)
+        try:
+            await prerender(endpoint)
+        except Exception:
+            # The first request for it builds it instead
+            pass
+
+
+def _enqueue(endpoints):
+    global _prerendering
+    for endpoint in endpoints:
+        if endpoint in WIDGETS and endpoint not in _queue:
+            _queue.append(endpoint)
+    if _queue and (_prerendering is None or _prerendering.done()):
+        _prerendering = asyncio.ensure_future(_drain())
+
+
+def start_prerender(app):
+    """
+    Pre-renders every cached widget in the background, and the affected
+    widgets after every dataset change from then on. Call from a startup
+    handler.
+
+    Args:
+        app: The ASGI application to send the requests through.
+    """
+    global _app, _loop
+    if not PRERENDER:
+        return
+    _app = app
+    _loop = asyncio.get_running_loop()
+    _enqueue(list(WIDGET_INPUTS))
+
+
+@datasets.on_change
+def _prerender_changed(names):
+    if _loop is None:
+        return
+    stale = artifacts.affected(names)
+    endpoints = [
+        endpoint for endpoint, inputs in WIDGET_INPUTS.items()
+        if not stale.isdisjoint(inputs)
+    ]
+    if endpoints:
+        try:
+            _loop.call_soon_threadsafe(_enqueue, endpoints)
+        except RuntimeError:
+            # The server has stopped
+            pass